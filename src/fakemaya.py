@@ -0,0 +1,334 @@
+"""In-memory stand-in for the parts of maya.cmds used by the tools.
+
+FakeCmds keeps a tiny scene of named nodes and FakeMeshSource serves mesh
+geometry from plain Python lists, so the scatter stages can be run and
+inspected outside of a Maya session, and FakeCmds.file writes scene files of
+a fixed size for the smart save tool. install registers the fakes as the
+maya, PySide2 and shiboken2 modules so the tool modules themselves can be
+imported without Maya.
+"""
+import fnmatch
+import io
+import logging
+import os
+import sys
+import tempfile
+import types
+
+from profiling import CallCounter
+from scatter_mesh import MeshData, MeshSource
+
+log = logging.getLogger(__name__)
+
+IDENTITY_MATRIX = [1.0, 0.0, 0.0, 0.0,
+                   0.0, 1.0, 0.0, 0.0,
+                   0.0, 0.0, 1.0, 0.0,
+                   0.0, 0.0, 0.0, 1.0]
+UNIT_BOUNDING_BOX = [-0.5, -0.5, -0.5, 0.5, 0.5, 0.5]
+
+
+class FakeNode(object):
+    """A node in the fake scene."""
+
+    def __init__(self, name, node_type='transform', source=None):
+        self.name = name
+        self.node_type = node_type
+        self.source = source
+        self.matrix = list(IDENTITY_MATRIX)
+        self.attributes = {}
+
+
+class FakeCmds(object):
+    """Minimal in-memory implementation of maya.cmds."""
+
+    def __init__(self):
+        self.nodes = {}
+        self.selection = []
+        self._name_counters = {}
+        self._sets = set()
+        self.undo_chunks = 0
+        self._open_chunks = 0
+        self.workspace_root = tempfile.gettempdir()
+        self.user_app_dir = tempfile.gettempdir()
+        self.scene_name = ''
+        self.scene_bytes = 1024
+        self.saves = 0
+        self._payload = b''
+
+    def add_node(self, name, node_type='transform', source=None):
+        """Add a node to the fake scene and return its name."""
+        self.nodes[name] = FakeNode(name, node_type, source)
+        return name
+
+    def _unique_name(self, name):
+        base = name.rstrip('0123456789')
+        index = self._name_counters.get(base, 1)
+        while "{}{}".format(base, index) in self.nodes:
+            index += 1
+        self._name_counters[base] = index
+        return "{}{}".format(base, index)
+
+    def workspace(self, query=False, rootDirectory=False, **kwargs):
+        return self.workspace_root
+
+    def internalVar(self, userAppDir=False, **kwargs):
+        return self.user_app_dir
+
+    def file(self, path=None, query=False, sceneName=False, rename=None,
+             save=False, open=False, force=False, **kwargs):
+        """Query, rename, save and open scene_bytes sized scene files.
+
+        Like Maya, saving raises RuntimeError when the folder is missing.
+        """
+        if query and sceneName:
+            return self.scene_name
+        if rename is not None:
+            self.scene_name = str(rename)
+            return self.scene_name
+        if save:
+            if not os.path.isdir(os.path.dirname(self.scene_name)):
+                raise RuntimeError("Could not save {}".format(
+                    self.scene_name))
+            if len(self._payload) != self.scene_bytes:
+                self._payload = b'\0' * self.scene_bytes
+            with io.open(self.scene_name, 'wb') as scene:
+                scene.write(self._payload)
+            self.saves += 1
+            return self.scene_name
+        if open:
+            if not os.path.exists(str(path)):
+                raise RuntimeError("File not found: {}".format(path))
+            self.scene_name = str(path)
+            return self.scene_name
+
+    def objExists(self, name):
+        return name in self.nodes
+
+    def objectType(self, name):
+        return self.nodes[name].node_type
+
+    def instance(self, name):
+        node = self.nodes[name]
+        new_name = self._unique_name(name)
+        self.add_node(new_name, node.node_type, source=name)
+        return [new_name]
+
+    def xform(self, name, query=False, worldSpace=False, matrix=None,
+              boundingBox=False, **kwargs):
+        if query and boundingBox:
+            return list(self.nodes[name].attributes.get(
+                'boundingBox', UNIT_BOUNDING_BOX))
+        if query:
+            return list(self.nodes[name].matrix)
+        if matrix is not None:
+            self.nodes[name].matrix = [float(value) for value in matrix]
+
+    def particle(self, position=(), name='particle1'):
+        particle = self.add_node(self._unique_name(name))
+        shape = self.add_node(particle + 'Shape', 'particle')
+        self.nodes[particle].attributes['shape'] = shape
+        self.nodes[shape].attributes['position'] = \
+            [tuple(point) for point in position]
+        return [particle, shape]
+
+    def sets(self, *nodes, **kwargs):
+        if kwargs.get('empty'):
+            name = self.add_node(
+                self._unique_name(kwargs.get('name', 'set1')), 'objectSet')
+            self.nodes[name].attributes['members'] = {}
+            self._sets.add(name)
+            return name
+        if kwargs.get('query') or kwargs.get('q'):
+            members = self.nodes[nodes[0]].attributes['members']
+            return list(members) or None
+        members = self.nodes[kwargs['add']].attributes['members']
+        for name in nodes:
+            names = name if isinstance(name, (list, tuple)) else [name]
+            for member in names:
+                members[member] = True
+
+    def attributeQuery(self, attribute, node=None, exists=False):
+        return attribute in self.nodes[node].attributes
+
+    def addAttr(self, name, longName=None, dataType=None, **kwargs):
+        self.nodes[name].attributes.setdefault(longName, None)
+
+    def setAttr(self, plug, *values, **kwargs):
+        name, attribute = plug.split('.', 1)
+        value = values[0] if len(values) == 1 else list(values)
+        self.nodes[name].attributes[attribute] = value
+
+    def getAttr(self, plug):
+        name, attribute = plug.split('.', 1)
+        return self.nodes[name].attributes[attribute]
+
+    def saveInitialState(self, name):
+        pass
+
+    def particleInstancer(self, particle_shape, addObject=False, object=None,
+                          name='instancer1', **kwargs):
+        instancer = self.add_node(self._unique_name(name), 'instancer')
+        attributes = self.nodes[instancer].attributes
+        attributes['inputPoints'] = particle_shape
+        attributes['object'] = object
+        attributes.update(kwargs)
+        return instancer
+
+    def select(self, *names, **kwargs):
+        if kwargs.get('clear') or kwargs.get('cl'):
+            self.selection = []
+            return
+        flat = []
+        for name in names:
+            if isinstance(name, (list, tuple)):
+                flat.extend(name)
+            else:
+                flat.append(name)
+        if kwargs.get('deselect') or kwargs.get('d'):
+            self.selection = [name for name in self.selection
+                              if name not in flat]
+        elif kwargs.get('all'):
+            self.selection = list(self.nodes)
+        else:
+            self.selection = flat
+
+    def ls(self, *names, **kwargs):
+        if kwargs.get('os') or kwargs.get('sl') or \
+                kwargs.get('orderedSelection') or kwargs.get('selection'):
+            return list(self.selection)
+        node_type = kwargs.get('type')
+        matches = []
+        for name, node in self.nodes.items():
+            if node_type is not None and node.node_type != node_type:
+                continue
+            if names and not any(fnmatch.fnmatchcase(name, pattern)
+                                 for pattern in names):
+                continue
+            matches.append(name)
+        return matches
+
+    def delete(self, *names):
+        deleted = []
+        for name in names:
+            if isinstance(name, (list, tuple)):
+                deleted.extend(name)
+            else:
+                deleted.append(name)
+        for name in deleted:
+            node = self.nodes.pop(name, None)
+            if node is None:
+                continue
+            self._sets.discard(name)
+            shape = node.attributes.get('shape')
+            if shape is not None:
+                self.nodes.pop(shape, None)
+        for set_name in self._sets:
+            members = self.nodes[set_name].attributes['members']
+            for name in deleted:
+                members.pop(name, None)
+
+    def undoInfo(self, openChunk=False, closeChunk=False, query=False,
+                 **kwargs):
+        if query:
+            return True
+        if openChunk:
+            self._open_chunks += 1
+            self.undo_chunks += 1
+        if closeChunk:
+            self._open_chunks -= 1
+
+    def instances_of(self, name):
+        """Return the names of every node instanced from ``name``."""
+        return [node.name for node in self.nodes.values()
+                if node.source == name]
+
+
+class FakeMeshSource(MeshSource):
+    """Mesh source that serves geometry from plain Python lists."""
+
+    def __init__(self, mesh, points, face_counts, face_indices):
+        super(FakeMeshSource, self).__init__(mesh)
+        self.points = [tuple(point) for point in points]
+        self.face_counts = list(face_counts)
+        self.face_indices = list(face_indices)
+        self.revision = 0
+
+    def set_points(self, points):
+        """Replace the vertex positions, as a deformation would."""
+        self.points = [tuple(point) for point in points]
+        self.revision += 1
+
+    @classmethod
+    def grid(cls, mesh, rows, columns, size=1.0):
+        """Return a flat quad grid in the XZ plane facing up the Y axis."""
+        points = []
+        for row in range(rows + 1):
+            for column in range(columns + 1):
+                points.append((column * size, 0.0, row * size))
+        face_counts = []
+        face_indices = []
+        for row in range(rows):
+            for column in range(columns):
+                corner = row * (columns + 1) + column
+                face_counts.append(4)
+                face_indices.extend([corner, corner + columns + 1,
+                                     corner + columns + 2, corner + 1])
+        return cls(mesh, points, face_counts, face_indices)
+
+    def fetch(self):
+        return MeshData(self.points, self.face_counts, self.face_indices)
+
+    def signature(self):
+        return (len(self.points), len(self.face_counts), self.revision)
+
+
+def install(cmds=None):
+    """Register the fakes in sys.modules in place of Maya and its Qt modules.
+
+    Any real maya, PySide2 or shiboken2 modules already imported are
+    replaced, so only call this outside of a Maya session.
+
+    Args:
+        cmds: Backend to expose as maya.cmds. A CallCounter wrapping a new
+            FakeCmds is used when omitted.
+
+    Returns:
+        The backend registered as maya.cmds.
+    """
+    if cmds is None:
+        cmds = CallCounter(FakeCmds())
+    maya = types.ModuleType('maya')
+    maya.cmds = cmds
+    maya.OpenMayaUI = types.ModuleType('maya.OpenMayaUI')
+    maya.OpenMayaUI.MQtUtil = types.SimpleNamespace(mainWindow=lambda: 0)
+    maya.api = types.ModuleType('maya.api')
+    maya.api.OpenMaya = types.ModuleType('maya.api.OpenMaya')
+    sys.modules.update({'maya': maya,
+                        'maya.cmds': cmds,
+                        'maya.OpenMayaUI': maya.OpenMayaUI,
+                        'maya.api': maya.api,
+                        'maya.api.OpenMaya': maya.api.OpenMaya})
+    _install_qt()
+    return cmds
+
+
+def _install_qt():
+    class Widget(object):
+        def __init__(self, *args, **kwargs):
+            pass
+
+    qt_widgets = types.ModuleType('PySide2.QtWidgets')
+    qt_widgets.QWidget = Widget
+    qt_widgets.QDialog = Widget
+    qt_core = types.ModuleType('PySide2.QtCore')
+    qt_core.Slot = lambda *types_: (lambda function: function)
+    qt_core.Qt = types.SimpleNamespace(Checked=2, Unchecked=0)
+    pyside = types.ModuleType('PySide2')
+    pyside.QtWidgets = qt_widgets
+    pyside.QtCore = qt_core
+    shiboken = types.ModuleType('shiboken2')
+    shiboken.wrapInstance = lambda pointer, cls: None
+    sys.modules.update({'PySide2': pyside,
+                        'PySide2.QtWidgets': qt_widgets,
+                        'PySide2.QtCore': qt_core,
+                        'shiboken2': shiboken})
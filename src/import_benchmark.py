@@ -0,0 +1,197 @@
+"""Cold-start import times of the tool modules.
+
+Imports every module in a fresh interpreter, a few times over, and reports
+the median import time and which heavy modules (PySide2, shiboken2, pymel)
+the import loaded. The core modules, scene_file, scatter_tool and
+scatter_batch, must not load any of them; the run fails if one does, or if
+a core or UI module cannot be imported at all.
+pymel.core is timed as well, for reference, since importing it is what the
+core split saves every headless job and shelf click.
+
+The baseline is the tree from before the split, exported from git at
+PRE_SPLIT_REV, or --before. There SceneFile and ScatterTool were imported
+from the dialog modules, so scene_file and scatter_tool are compared with
+importing smartsave and scatter from that tree.
+
+With --fake the fake PySide2, shiboken2 and pymel modules are hidden until
+something imports them, so they count as loaded just like the real ones.
+
+Run it with mayapy for real numbers, or with --fake outside of Maya, where
+only the cost of the tool modules themselves is measured:
+
+    mayapy import_benchmark.py
+    python import_benchmark.py --fake
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+log = logging.getLogger(__name__)
+
+CORE_MODULES = ('scene_file', 'scatter_tool', 'scatter_batch')
+UI_MODULES = ('smartsave', 'scatter')
+REFERENCE_MODULES = ('pymel.core',)
+HEAVY_MODULES = ('PySide2', 'shiboken2', 'pymel')
+# The last commit before SceneFile and ScatterTool left the dialog modules.
+PRE_SPLIT_REV = 'd79b861~1'
+PRE_SPLIT_MODULES = (('scene_file', 'smartsave'), ('scatter_tool', 'scatter'))
+DEFAULT_REPEAT = 5
+
+_CHILD = """
+import importlib.abc, importlib.util, json, sys, time
+sys.path.insert(0, {src!r})
+if {fake!r}:
+    import fakemaya
+    fakemaya.install()
+    hidden = dict((name, sys.modules.pop(name)) for name in list(sys.modules)
+                  if name.split('.')[0] in {heavy!r})
+
+    class HiddenFakes(importlib.abc.MetaPathFinder, importlib.abc.Loader):
+        def find_spec(self, name, path=None, target=None):
+            if name not in hidden:
+                return None
+            package = any(other.startswith(name + '.') for other in hidden)
+            return importlib.util.spec_from_loader(name, self,
+                                                   is_package=package)
+
+        def create_module(self, spec):
+            return hidden[spec.name]
+
+        def exec_module(self, module):
+            pass
+
+    sys.meta_path.insert(0, HiddenFakes())
+before = set(sys.modules)
+start = time.perf_counter()
+error = None
+try:
+    __import__({module!r})
+except Exception as err:
+    error = repr(err)
+seconds = time.perf_counter() - start
+loaded = set(sys.modules) - before
+print(json.dumps({{'seconds': seconds, 'error': error,
+                  'heavy': sorted(name for name in {heavy!r}
+                                  if name in loaded)}}))
+"""
+
+
+def time_import(module, python=sys.executable, fake=False, src=None):
+    """Import module in a new interpreter and return what it cost.
+
+    Args:
+        src (str): Folder to import from, this one when None.
+
+    Returns:
+        dict: seconds, the heavy modules loaded and the error, if any.
+    """
+    src = src or os.path.dirname(os.path.abspath(__file__))
+    code = _CHILD.format(src=src, fake=fake, module=module,
+                         heavy=HEAVY_MODULES)
+    output = subprocess.check_output([python, '-c', code])
+    return json.loads(output.decode('utf-8').strip().splitlines()[-1])
+
+
+def run_suite(modules, repeat, python=sys.executable, fake=False, src=None):
+    """Time every module repeat times and return the results by module."""
+    results = {}
+    for module in modules:
+        runs = [time_import(module, python, fake, src)
+                for _ in range(repeat)]
+        seconds = sorted(run['seconds'] for run in runs)
+        results[module] = {'median': seconds[len(seconds) // 2],
+                           'min': seconds[0],
+                           'heavy': runs[-1]['heavy'],
+                           'error': runs[-1]['error']}
+        if results[module]['error']:
+            log.warning("%-14s failed: %s", module, results[module]['error'])
+            continue
+        log.info("%-14s median %8.4fs  min %8.4fs  loads %s", module,
+                 results[module]['median'], results[module]['min'],
+                 ", ".join(results[module]['heavy']) or "nothing heavy")
+    return results
+
+
+def export_tree(rev, folder):
+    """Write the src folder of a git revision into folder.
+
+    Returns:
+        str: The exported src folder, or None if git could not export it.
+    """
+    src = os.path.dirname(os.path.abspath(__file__))
+    try:
+        archive = subprocess.check_output(
+            ['git', 'archive', '--format=tar', rev, '.'], cwd=src)
+        subprocess.run(['tar', '-x', '-C', folder], input=archive,
+                       check=True)
+    except (OSError, subprocess.CalledProcessError) as err:
+        log.warning("Could not export %s: %s", rev, err)
+        return None
+    return folder
+
+
+def run_pre_split(rev, repeat, python=sys.executable, fake=False):
+    """Time the pre-split imports of SceneFile and ScatterTool.
+
+    Returns:
+        dict: The results by module, empty if the tree could not be exported.
+    """
+    folder = tempfile.mkdtemp(prefix='import_benchmark_')
+    try:
+        src = export_tree(rev, folder)
+        if src is None:
+            return {}
+        log.info("Before the split, at %s:", rev)
+        return run_suite([old for _, old in PRE_SPLIT_MODULES], repeat,
+                         python, fake, src)
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--python', default=sys.executable,
+                        help="Interpreter to import with, e.g. mayapy.")
+    parser.add_argument('--fake', action='store_true',
+                        help="Import against the fake Maya modules.")
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT)
+    parser.add_argument('--before', default=PRE_SPLIT_REV,
+                        help="Git revision of the tree before the split.")
+    parser.add_argument('--output', help="Write the results to this JSON.")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    modules = CORE_MODULES + UI_MODULES
+    if not args.fake:
+        modules += REFERENCE_MODULES
+    results = run_suite(modules, args.repeat, args.python, args.fake)
+    before = run_pre_split(args.before, args.repeat, args.python, args.fake)
+    for module, old in PRE_SPLIT_MODULES:
+        if old in before and not before[old]['error'] and \
+                not results[module]['error']:
+            log.info("%-14s %8.4fs, was %8.4fs importing %s before the "
+                     "split", module, results[module]['median'],
+                     before[old]['median'], old)
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump({'modules': results, 'before_split': before}, output,
+                      indent=2, sort_keys=True)
+    broken = [module for module in CORE_MODULES + UI_MODULES
+              if results[module]['error']]
+    for module in broken:
+        log.error("FAILED: %s does not import: %s", module,
+                  results[module]['error'])
+    heavy_cores = [module for module in CORE_MODULES
+                   if results[module]['heavy']]
+    for module in heavy_cores:
+        log.error("FAILED: %s loads %s", module,
+                  ", ".join(results[module]['heavy']))
+    return 1 if broken or heavy_cores else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,138 @@
+"""Per-stage timing and counters shared by the tools.
+
+A Profiler collects named timing spans and counters while a scatter or a
+save runs. It is disabled by default, and a disabled profiler hands out a
+shared no-op span, so instrumented code costs no more than a flag check.
+"""
+import collections
+import json
+import time
+
+
+class _Span(object):
+    """Times one pass through a stage and adds it to the profiler."""
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler.add_span(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class _NullSpan(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Profiler(object):
+    """Named timing spans and counters of one run of a tool.
+
+    Args:
+        enabled (bool): Collect spans and counters. When False every call is
+            a flag check and nothing is recorded.
+        label (str): What is profiled, the start of the summary.
+    """
+
+    def __init__(self, enabled=False, label='Profile'):
+        self.enabled = enabled
+        self.label = label
+        self.seconds = collections.OrderedDict()
+        self.passes = collections.Counter()
+        self.counters = collections.OrderedDict()
+
+    def span(self, name):
+        """Return a context manager timing the named stage."""
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name)
+
+    def add_span(self, name, seconds, passes=1):
+        self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+        self.passes[name] += passes
+
+    def count(self, name, amount=1):
+        """Add amount to the named counter."""
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def reset(self):
+        self.seconds.clear()
+        self.passes.clear()
+        self.counters.clear()
+
+    def merge(self, stats):
+        """Add the spans and counters of an as_dict result, e.g. a worker's."""
+        if not self.enabled or not stats:
+            return
+        for name, span in stats['spans'].items():
+            self.add_span(name, span['seconds'], span['passes'])
+        for name, amount in stats['counters'].items():
+            self.count(name, amount)
+
+    def as_dict(self):
+        """Return the spans and counters as plain, JSON friendly data."""
+        return {'spans': collections.OrderedDict(
+                    (name, {'seconds': seconds, 'passes': self.passes[name]})
+                    for name, seconds in self.seconds.items()),
+                'counters': dict(self.counters)}
+
+    def to_json(self, **kwargs):
+        return json.dumps(self.as_dict(), **kwargs)
+
+    def summary(self):
+        """Return a one line summary of the spans and counters."""
+        spans = ", ".join("{} {:.3f}s".format(name, seconds)
+                          for name, seconds in self.seconds.items())
+        counters = ", ".join("{} {}".format(name, amount)
+                             for name, amount in self.counters.items())
+        return "{}: {} | {}".format(self.label, spans or "no spans",
+                                    counters or "no counters")
+
+
+class CallCounter(object):
+    """Proxy that counts every call made through it to a scene backend."""
+
+    def __init__(self, backend):
+        self._backend = backend
+        self.calls = collections.Counter()
+
+    def __getattr__(self, name):
+        attribute = getattr(self._backend, name)
+        if name.startswith('_') or not callable(attribute):
+            return attribute
+
+        def counted(*args, **kwargs):
+            self.calls[name] += 1
+            return attribute(*args, **kwargs)
+        return counted
+
+    @property
+    def backend(self):
+        return self._backend
+
+    @backend.setter
+    def backend(self, backend):
+        self._backend = backend
+
+    @property
+    def total_calls(self):
+        return sum(self.calls.values())
+
+    def reset(self):
+        self.calls.clear()
+
+
+DISABLED = Profiler()
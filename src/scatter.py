@@ -4,16 +4,22 @@ from PySide2 import QtWidgets, QtCore
 from shiboken2 import wrapInstance
 import maya.OpenMayaUI as omui
 import maya.cmds as cmds
-import pymel.core as pmc
 import random as rand
 
+import scatter_density
+import scatter_mesh
+import scatter_preview
+from scatter_engine import (SAMPLE_VERTICES, SAMPLE_SURFACE,
+                            OUTPUT_TRANSFORMS, OUTPUT_INSTANCER)
+from scatter_tool import ScatterTool
+
 log = logging.getLogger(__name__)
 
 
 def maya_main_window():
     """Return the maya main window widget"""
     main_window = omui.MQtUtil.mainWindow()
-    return wrapInstance(long(main_window), QtWidgets.QWidget)
+    return wrapInstance(int(main_window), QtWidgets.QWidget)
 
 
 class ScatterToolUI(QtWidgets.QDialog):
@@ -24,6 +30,10 @@ class ScatterToolUI(QtWidgets.QDialog):
         self.open_tool_window()
         self.align_normals = False
         self.undo = False
+        self.replace = False
+        self.preview = scatter_preview.ScatterPreview(cmds)
+        self._preview_seed = None
+        self._preview_density = scatter_density.DensityCache()
 
     def open_tool_window(self):
         if len(self.scatter_tool.selection) == 2:
@@ -58,6 +68,21 @@ class ScatterToolUI(QtWidgets.QDialog):
     def create_connections(self):
         """Connect Signals and Slots"""
         self.scatter_btn.clicked.connect(self._scatter)
+        self.cancel_btn.clicked.connect(self._cancel_scatter)
+        self.import_layout_btn.clicked.connect(self._import_layout)
+        self._live_preview_checkbox.stateChanged.connect(
+            self._toggle_preview)
+        for spin_box in (self.min_scale_sbx, self.max_scale_sbx,
+                         self.min_x_rotation_sbx, self.max_x_rotation_sbx,
+                         self.min_y_rotation_sbx, self.max_y_rotation_sbx,
+                         self.min_z_rotation_sbx, self.max_z_rotation_sbx,
+                         self.density_sbx, self.min_distance_sbx,
+                         self.seed_sbx):
+            spin_box.valueChanged.connect(self._update_preview)
+        self.sampling_cmb.currentIndexChanged.connect(self._update_preview)
+        self._align_to_normals_checkbox.stateChanged.connect(
+            self._update_preview)
+        self.density_map_le.editingFinished.connect(self._reload_density_map)
         self.selection_btn.clicked.connect(self._add_selection)
         self.swap_btn.clicked.connect(self._swap_selection)
 
@@ -106,32 +131,156 @@ class ScatterToolUI(QtWidgets.QDialog):
 
     @QtCore.Slot()
     def _scatter(self):
-        """Scatter objects"""
-        self._set_scatter_properties_from_ui()
-        self.scatter_tool.scatter()
+        """Scatter objects a batch at a time, updating the progress bar"""
+        try:
+            self._set_scatter_properties_from_ui()
+        except ValueError as err:
+            log.warning("Not scattering: %s", err)
+            return
+        if self.preview.nodes:
+            if self.scatter_tool.seed is None:
+                self.scatter_tool.seed = self._preview_seed
+            self.preview.clear()
+        self._run_batches(self.scatter_tool.iter_scatter())
         if self.scatter_tool.close is True:
             self.close()
 
-    def _set_scatter_properties_from_ui(self):
+    @QtCore.Slot()
+    def _import_layout(self):
+        """Recreate a saved layout, updating the progress bar"""
+        path, _ = QtWidgets.QFileDialog.getOpenFileName(
+            self, "Import Scatter Layout", "",
+            "Scatter Layouts (*.scatter);;All Files (*)")
+        if not path:
+            return
         self.scatter_tool = ScatterTool()
+        self.scatter_tool.output_mode = self.output_mode_cmb.currentData()
+        self._run_batches(self.scatter_tool.iter_import_layout(path))
+
+    def _run_batches(self, batches):
+        """Drain a batch generator, keeping the UI responsive"""
+        self._cancelled = False
+        self.scatter_btn.setEnabled(False)
+        self.import_layout_btn.setEnabled(False)
+        self.cancel_btn.setEnabled(True)
+        self.progress_bar.setValue(0)
+        try:
+            for written, total in batches:
+                self.progress_bar.setMaximum(max(total, 1))
+                self.progress_bar.setValue(written)
+                QtWidgets.QApplication.processEvents()
+                if self._cancelled:
+                    log.warning("Scatter cancelled after %d of %d "
+                                "instances", written, total)
+                    break
+        except ValueError as err:
+            log.warning("Scatter stopped: %s", err)
+        finally:
+            batches.close()
+            self.scatter_btn.setEnabled(True)
+            self.import_layout_btn.setEnabled(True)
+            self.cancel_btn.setEnabled(False)
+
+    @QtCore.Slot()
+    def _toggle_preview(self, state):
+        """Show or remove the live preview"""
+        if state == QtCore.Qt.Checked:
+            self._update_preview()
+        else:
+            self.preview.clear()
+
+    @QtCore.Slot()
+    def _reload_density_map(self):
+        """Read the density map again, it may have been painted"""
+        self._preview_density.reload()
+        self._update_preview()
+
+    @QtCore.Slot()
+    def _update_preview(self, *args):
+        """Rewrite only the preview channels changed since the last update"""
+        if not self._live_preview_checkbox.isChecked() or \
+                not hasattr(self, 'object_to_scatter_to'):
+            return
+        try:
+            self._set_scatter_properties_from_ui(new_tool=False)
+            target = str(self.object_to_scatter_to)
+            mesh = scatter_mesh.GEOMETRY_CACHE.fetch(
+                self.scatter_tool.source_factory(target))
+            density = self._preview_density.fetch(
+                mesh, self.scatter_tool.density_map,
+                self.scatter_tool.sampling)
+        except ValueError as err:
+            log.warning("Preview not updated: %s", err)
+            return
+        seed = self.scatter_tool.seed
+        if seed is None:
+            if self._preview_seed is None:
+                self._preview_seed = rand.randrange(2147483647)
+            seed = self._preview_seed
+        self.preview.update(
+            str(self.object_to_scatter_with), target, mesh,
+            self.scatter_tool.layout_settings(mesh), seed,
+            workers=self.scatter_tool.workers, density=density)
+
+    def closeEvent(self, event):
+        self.preview.clear()
+        super(ScatterToolUI, self).closeEvent(event)
+
+    @QtCore.Slot()
+    def _cancel_scatter(self):
+        """Stop the running scatter after the current batch"""
+        self._cancelled = True
+
+    def _set_scatter_properties_from_ui(self, new_tool=True):
+        """Copy the UI settings onto the scatter tool.
+
+        Args:
+            new_tool (bool): Start from a new ScatterTool of the current
+                selection. The preview updates the one it has instead.
+        """
+        if new_tool:
+            self.scatter_tool = ScatterTool()
         self.scatter_tool.selection[0] = self.object_to_scatter_with
         self.scatter_tool.selection[1] = self.object_to_scatter_to
         self.scatter_tool.min_scale = self.min_scale_sbx.value()
         self.scatter_tool.max_scale = self.max_scale_sbx.value()
         self.scatter_tool.min_rotate_x = self.min_x_rotation_sbx.value()
-        self.scatter_tool.min_rotate_x = self.min_x_rotation_sbx.value()
-        self.scatter_tool.min_rotate_y = self.min_y_rotation_sbx.value()
+        self.scatter_tool.max_rotate_x = self.max_x_rotation_sbx.value()
         self.scatter_tool.min_rotate_y = self.min_y_rotation_sbx.value()
+        self.scatter_tool.max_rotate_y = self.max_y_rotation_sbx.value()
         self.scatter_tool.min_rotate_z = self.min_z_rotation_sbx.value()
-        self.scatter_tool.min_rotate_z = self.min_z_rotation_sbx.value()
+        self.scatter_tool.max_rotate_z = self.max_z_rotation_sbx.value()
         self.scatter_tool.density = self.density_sbx.value()
         self.scatter_tool.align = self.align_normals
         self.scatter_tool.undo = self.undo
+        self.scatter_tool.replace = self.replace
+        self.scatter_tool.output_mode = self.output_mode_cmb.currentData()
+        self.scatter_tool.sampling = self.sampling_cmb.currentData()
+        self.scatter_tool.min_distance = self.min_distance_sbx.value()
+        self.scatter_tool.avoid_overlap = \
+            self._avoid_overlap_checkbox.isChecked()
+        self.scatter_tool.density_map = scatter_density.from_name(
+            cmds, str(self.object_to_scatter_to),
+            self.density_map_le.text().strip())
+        self.scatter_tool.layout_path = \
+            self.layout_path_le.text().strip() or None
+        if self.seed_sbx.value() == self.seed_sbx.minimum():
+            self.scatter_tool.seed = None
+        else:
+            self.scatter_tool.seed = self.seed_sbx.value()
 
     def _create_button_ui(self):
         self.scatter_btn = QtWidgets.QPushButton("Scatter")
+        self.cancel_btn = QtWidgets.QPushButton("Cancel")
+        self.cancel_btn.setEnabled(False)
+        self.import_layout_btn = QtWidgets.QPushButton("Import Layout...")
+        self.progress_bar = QtWidgets.QProgressBar()
+        self.progress_bar.setValue(0)
         layout = QtWidgets.QHBoxLayout()
+        layout.addWidget(self.progress_bar)
         layout.addWidget(self.scatter_btn)
+        layout.addWidget(self.cancel_btn)
+        layout.addWidget(self.import_layout_btn)
         return layout
 
     def _create_modifier_headers(self):
@@ -164,6 +313,15 @@ class ScatterToolUI(QtWidgets.QDialog):
         self._create_density_ui(layout)
         self._create_align_checkbox(layout)
         self._create_undo_checkbox(layout)
+        self._create_replace_checkbox(layout)
+        self._create_live_preview_checkbox(layout)
+        self._create_avoid_overlap_checkbox(layout)
+        self._create_output_mode_ui(layout)
+        self._create_sampling_ui(layout)
+        self._create_min_distance_ui(layout)
+        self._create_seed_ui(layout)
+        self._create_density_map_ui(layout)
+        self._create_layout_path_ui(layout)
 
     def _create_density_ui(self, layout):
         self.density_sbx = QtWidgets.QDoubleSpinBox()
@@ -171,7 +329,7 @@ class ScatterToolUI(QtWidgets.QDialog):
             setButtonSymbols(QtWidgets.QAbstractSpinBox.PlusMinus)
         self.density_sbx.setSingleStep(0.1)
         self.density_sbx.setFixedWidth(100)
-        self.density_sbx.setMaximum(1.0)
+        self.density_sbx.setMaximum(100.0)
         self.density_sbx.setMinimum(0.0)
         self.density_sbx.setValue(self.scatter_tool.density)
         layout.addWidget(QtWidgets.QLabel("Density Multiplier "
@@ -179,6 +337,71 @@ class ScatterToolUI(QtWidgets.QDialog):
                          2)
         layout.addWidget(self.density_sbx, 10, 2, 1, 1)
 
+    def _create_sampling_ui(self, layout):
+        self.sampling_cmb = QtWidgets.QComboBox()
+        self.sampling_cmb.addItem("Vertices", SAMPLE_VERTICES)
+        self.sampling_cmb.addItem("Surface", SAMPLE_SURFACE)
+        self.sampling_cmb.setFixedWidth(100)
+        self.sampling_cmb.setCurrentIndex(
+            self.sampling_cmb.findData(self.scatter_tool.sampling))
+        layout.addWidget(QtWidgets.QLabel("Sampling (Surface is Area "
+                                          "Weighted)"), 12, 0, 1, 2)
+        layout.addWidget(self.sampling_cmb, 12, 2, 1, 1)
+
+    def _create_min_distance_ui(self, layout):
+        self.min_distance_sbx = QtWidgets.QDoubleSpinBox()
+        self.min_distance_sbx. \
+            setButtonSymbols(QtWidgets.QAbstractSpinBox.PlusMinus)
+        self.min_distance_sbx.setSingleStep(0.1)
+        self.min_distance_sbx.setFixedWidth(100)
+        self.min_distance_sbx.setMinimum(0.0)
+        self.min_distance_sbx.setMaximum(10000.0)
+        self.min_distance_sbx.setValue(self.scatter_tool.min_distance)
+        layout.addWidget(QtWidgets.QLabel("Minimum Distance (Surface "
+                                          "Only)"), 13, 0, 1, 2)
+        layout.addWidget(self.min_distance_sbx, 13, 2, 1, 1)
+
+    def _create_density_map_ui(self, layout):
+        self.density_map_le = QtWidgets.QLineEdit()
+        self.density_map_le.setPlaceholderText("None")
+        layout.addWidget(QtWidgets.QLabel("Density Map (Color Set or "
+                                          "Texture)"), 16, 0, 1, 2)
+        layout.addWidget(self.density_map_le, 16, 2, 1, 2)
+
+    def _create_layout_path_ui(self, layout):
+        self.layout_path_le = QtWidgets.QLineEdit()
+        self.layout_path_le.setPlaceholderText("Don't Save")
+        layout.addWidget(QtWidgets.QLabel("Save Layout To (.scatter "
+                                          "File)"), 17, 0, 1, 2)
+        layout.addWidget(self.layout_path_le, 17, 2, 1, 2)
+
+    def _create_seed_ui(self, layout):
+        self.seed_sbx = QtWidgets.QSpinBox()
+        self.seed_sbx. \
+            setButtonSymbols(QtWidgets.QAbstractSpinBox.PlusMinus)
+        self.seed_sbx.setFixedWidth(100)
+        self.seed_sbx.setMinimum(-1)
+        self.seed_sbx.setMaximum(2147483647)
+        self.seed_sbx.setSpecialValueText("Random")
+        if self.scatter_tool.seed is None:
+            self.seed_sbx.setValue(-1)
+        else:
+            self.seed_sbx.setValue(self.scatter_tool.seed)
+        layout.addWidget(QtWidgets.QLabel("Seed (Same Seed Gives the Same "
+                                          "Layout)"), 14, 0, 1, 2)
+        layout.addWidget(self.seed_sbx, 14, 2, 1, 1)
+
+    def _create_output_mode_ui(self, layout):
+        self.output_mode_cmb = QtWidgets.QComboBox()
+        self.output_mode_cmb.addItem("Transforms", OUTPUT_TRANSFORMS)
+        self.output_mode_cmb.addItem("Instancer", OUTPUT_INSTANCER)
+        self.output_mode_cmb.setFixedWidth(100)
+        self.output_mode_cmb.setCurrentIndex(
+            self.output_mode_cmb.findData(self.scatter_tool.output_mode))
+        layout.addWidget(QtWidgets.QLabel("Output (Instancer for Large "
+                                          "Counts)"), 11, 0, 1, 2)
+        layout.addWidget(self.output_mode_cmb, 11, 2, 1, 1)
+
     def _create_align_checkbox(self, layout):
         self._align_to_normals_checkbox = QtWidgets.QCheckBox("Align to "
                                                               "Normals", self)
@@ -204,6 +427,28 @@ class ScatterToolUI(QtWidgets.QDialog):
         else:
             self.undo = False
 
+    def _create_live_preview_checkbox(self, layout):
+        self._live_preview_checkbox = QtWidgets.QCheckBox("Live Preview",
+                                                          self)
+        layout.addWidget(self._live_preview_checkbox, 15, 0, 1, 1)
+
+    def _create_avoid_overlap_checkbox(self, layout):
+        self._avoid_overlap_checkbox = QtWidgets.QCheckBox("Avoid Overlaps",
+                                                           self)
+        layout.addWidget(self._avoid_overlap_checkbox, 15, 1, 1, 2)
+
+    def _create_replace_checkbox(self, layout):
+        self._replace_checkbox = QtWidgets.QCheckBox("Replace Previous "
+                                                     "Scatter", self)
+        self._replace_checkbox.stateChanged.connect(self._check_for_replace)
+        layout.addWidget(self._replace_checkbox, 9, 3, 1, 1)
+
+    def _check_for_replace(self, state):
+        if state == QtCore.Qt.Checked:
+            self.replace = True
+        else:
+            self.replace = False
+
     def _create_max_z_rotation_ui(self, layout):
         self.max_z_rotation_sbx = QtWidgets.QSpinBox()
         self.max_z_rotation_sbx. \
@@ -289,99 +534,3 @@ class ScatterToolUI(QtWidgets.QDialog):
         self.min_scale_sbx.setValue(self.scatter_tool.min_scale)
         layout.addWidget(QtWidgets.QLabel("Minimum Scale:"), 3, 0, 1, 1)
         layout.addWidget(self.min_scale_sbx, 3, 1, 1, 1)
-
-
-class ScatterTool(object):
-
-    def __init__(self):
-        self.selection = cmds.ls(os=True, fl=True)
-        self.max_rotate_z = 0
-        self.min_rotate_z = 0
-        self.max_rotate_y = 0
-        self.min_rotate_y = 0
-        self.max_rotate_x = 0
-        self.min_rotate_x = 0
-        self.min_scale = 1.0
-        self.max_scale = 1.0
-        self.density = 1.0
-        self.align = False
-        self.undo = False
-        self.close = False
-
-    def scatter(self):
-        """Scatter object along the vertices of another object"""
-        vertex_list = cmds.ls(str(self.selection[1]) + '.vtx[*]', fl=True)
-        object_to_instance = self.selection[0]
-        density_amount = len(vertex_list) * self.density
-        scatter_vertices = rand.sample(vertex_list, int(density_amount))
-        if cmds.objectType(object_to_instance) == 'transform':
-            self.scatter_logic(object_to_instance, scatter_vertices)
-        else:
-            print("Please ensure the object you select is a transform")
-
-    def scatter_logic(self, object_to_instance, scatter_vertices):
-        for vertex in scatter_vertices:
-            if self.undo is False:
-                new_instance = cmds.instance(object_to_instance)
-                position = cmds.pointPosition(vertex, w=True)
-                pmc.move(position[0], position[1], position[2],
-                         new_instance, a=True, ws=True)
-                if self.align is True:
-                    self.align_to_faces(new_instance, vertex)
-                self.random_rotation(new_instance)
-                self.random_scale(new_instance)
-                cmds.select(self.selection)
-                self.close = False
-            else:
-                cmds.select(all=True)
-                cmds.select(object_to_instance, self.selection[1], d=True)
-                instances = cmds.ls(os=True, fl=True)
-                cmds.delete(instances)
-                self.close = True
-
-    @staticmethod
-    def align_to_faces(new_instance, vertex):
-        faces = cmds.polyListComponentConversion(vertex, fromVertex=True,
-                                                 toFace=True)
-        faces = cmds.filterExpand(faces, selectionMask=34,
-                                  expand=True)
-        ave_vtx_normal, tangent, tangent2 = ScatterTool.find_average_normal(
-            faces)
-        pos = cmds.xform(vertex, query=True, worldSpace=True,
-                         translation=True)
-        matrix = [tangent2.x, tangent2.y, tangent2.z, 0.0,
-                  ave_vtx_normal.x, ave_vtx_normal.y,
-                  ave_vtx_normal.z, 0.0,
-                  tangent.x, tangent.y, tangent.z, 0.0,
-                  pos[0], pos[1], pos[2], 1.0]
-        cmds.xform(new_instance, worldSpace=True, matrix=matrix)
-
-    @staticmethod
-    def find_average_normal(faces):
-        face_normals = []
-        for face in faces:
-            mesh_face = pmc.MeshFace(face)
-            face_normals.append(mesh_face.getNormal())
-        sum_of_normals = sum(face_normals)
-        ave_vtx_normal = sum_of_normals / len(sum_of_normals)
-        ave_vtx_normal.normalize()
-        tangent = ave_vtx_normal.cross(pmc.dt.Vector(0, 1, 0))
-        tangent.normalize()
-        tangent2 = ave_vtx_normal.cross(tangent)
-        tangent2.normalize()
-        return ave_vtx_normal, tangent, tangent2
-
-    def random_scale(self, new_instance):
-        rand_scale = rand.uniform(self.min_scale, self.max_scale)
-        cmds.scale(rand_scale, rand_scale, rand_scale, new_instance,
-                   r=True)
-
-    def random_rotation(self, new_instance):
-        rand_rotation_x = \
-            rand.uniform(self.min_rotate_x, self.max_rotate_x)
-        rand_rotation_y = \
-            rand.uniform(self.min_rotate_y, self.max_rotate_y)
-        rand_rotation_z = \
-            rand.uniform(self.min_rotate_z, self.max_rotate_z)
-        cmds.rotate(rand_rotation_x, rand_rotation_y, rand_rotation_z,
-                    new_instance, r=True)
@@ -0,0 +1,294 @@
+"""Headless batch scatter runner.
+
+Scatters many weighted source objects onto many targets from a JSON job file,
+without the scatter UI or a selection. Every job names a target, the source
+objects with their weights and the scatter parameters; a top level "defaults"
+object holds parameters shared by all jobs:
+
+    {
+        "defaults": {"density": 0.2, "sampling": "surface",
+                     "max_rotation": [0, 360, 0]},
+        "jobs": [
+            {"target": "groundShape",
+             "sources": {"rockA": 3, "rockB": 1, "bush": 0.5},
+             "seed": 7, "align": true, "min_distance": 0.5}
+        ]
+    }
+
+Extracted geometry goes through the shared geometry cache, so jobs hitting
+the same target fetch it from the scene once. Each point picks its source
+from an alias table, which is O(1) per point regardless of how many sources a
+job has, and the picks use their own seeded stream, so a job file always
+produces the same scene.
+
+Run it in mayapy on a scene, or against the fake backend to check a job
+file without Maya:
+
+    mayapy scatter_batch.py jobs.json --scene set.mb --output set_dressed.mb
+    python scatter_batch.py jobs.json --fake
+"""
+import argparse
+import collections
+import json
+import logging
+import sys
+
+import numpy as np
+
+import profiling
+import scatter_engine
+import scatter_jobs
+import scatter_layout
+import scatter_mesh
+import scatter_parallel
+import scatter_sampling
+
+log = logging.getLogger(__name__)
+
+FAKE_GRID_SIZE = 100
+
+
+class BatchJob(object):
+    """One target and the weighted sources scattered onto it.
+
+    Args:
+        target (str): Name of the object to scatter to.
+        sources (dict): Weight of every source object, by name.
+        seed (int): Seed of the scatter.
+        density (float): Instances per target vertex.
+        sampling (str): SAMPLE_VERTICES or SAMPLE_SURFACE.
+        min_distance (float): Minimum spacing of surface samples.
+        align (bool): Align the instances to the target normals.
+        min_rotation: Minimum X, Y and Z rotation in degrees.
+        max_rotation: Maximum X, Y and Z rotation in degrees.
+        min_scale (float): Minimum uniform scale.
+        max_scale (float): Maximum uniform scale.
+        output_mode (str): OUTPUT_TRANSFORMS or OUTPUT_INSTANCER.
+        replace (bool): Delete earlier scatters of the sources onto the
+            target first.
+        layout_path (str): Optionally save the layout of the job to this
+            layout file.
+    """
+
+    def __init__(self, target, sources, seed=0, density=1.0,
+                 sampling=scatter_engine.SAMPLE_VERTICES, min_distance=0.0,
+                 align=False, min_rotation=(0.0, 0.0, 0.0),
+                 max_rotation=(0.0, 0.0, 0.0), min_scale=1.0, max_scale=1.0,
+                 output_mode=scatter_engine.OUTPUT_TRANSFORMS, replace=True,
+                 layout_path=None):
+        if not sources:
+            raise ValueError("Batch job for {} has no sources".format(target))
+        self.target = target
+        self.sources = collections.OrderedDict(sources)
+        self.seed = int(seed)
+        self.density = density
+        self.sampling = sampling
+        self.min_distance = min_distance
+        self.align = align
+        self.min_rotation = tuple(min_rotation)
+        self.max_rotation = tuple(max_rotation)
+        self.min_scale = min_scale
+        self.max_scale = max_scale
+        self.output_mode = output_mode
+        self.replace = replace
+        self.layout_path = layout_path
+
+    @classmethod
+    def from_dict(cls, data, defaults=None):
+        """Build a job from its job file entry, filling in the defaults."""
+        fields = dict(defaults or {})
+        fields.update(data)
+        try:
+            return cls(**fields)
+        except TypeError as error:
+            raise ValueError("Invalid batch job {}: {}".format(data, error))
+
+    def layout_settings(self, mesh):
+        """Return the LayoutSettings of this job for the given mesh."""
+        count = scatter_engine.scatter_count(mesh.vertex_count, self.density,
+                                             self.sampling)
+        return scatter_engine.LayoutSettings(
+            count, sampling=self.sampling, min_distance=self.min_distance,
+            align=self.align, min_rotation=self.min_rotation,
+            max_rotation=self.max_rotation, min_scale=self.min_scale,
+            max_scale=self.max_scale)
+
+
+def load_jobs(path):
+    """Read the jobs of a job file.
+
+    Returns:
+        list: The BatchJob of every entry, in file order.
+    """
+    with open(path) as job_file:
+        spec = json.load(job_file,
+                         object_pairs_hook=collections.OrderedDict)
+    defaults = spec.get('defaults', {})
+    return [BatchJob.from_dict(entry, defaults)
+            for entry in spec.get('jobs', [])]
+
+
+class BatchScatter(object):
+    """Runs batch jobs against a scene backend.
+
+    Args:
+        cmds: The maya.cmds module or a stand-in with the same interface.
+        source_factory: Builds the MeshSource of a target name.
+        cache (GeometryCache): Cache of extracted target geometry.
+        workers (int): Number of processes used to build the layouts.
+        profiler (Profiler): Collects timings across all jobs.
+    """
+
+    def __init__(self, cmds, source_factory=scatter_mesh.MayaMeshSource,
+                 cache=scatter_mesh.GEOMETRY_CACHE, workers=1,
+                 profiler=profiling.DISABLED):
+        self.cmds = cmds
+        self.source_factory = source_factory
+        self.cache = cache
+        self.workers = workers
+        self.profiler = profiler
+
+    def run(self, jobs):
+        """Run every job in order.
+
+        Returns:
+            list: Instance count by source name of every job.
+        """
+        return [self.run_job(job) for job in jobs]
+
+    def run_job(self, job):
+        """Scatter the sources of one job onto its target as one undo step.
+
+        Every source gets its own scatter job record, so the scatter UI can
+        undo or replace the result per source.
+
+        Returns:
+            OrderedDict: Instance count by source name.
+        """
+        with self.profiler.span('fetch_mesh'):
+            mesh = self.cache.fetch(self.source_factory(job.target))
+        settings = job.layout_settings(mesh)
+        names = list(job.sources)
+        table = scatter_sampling.AliasTable(list(job.sources.values()))
+        counts = collections.OrderedDict((name, 0) for name in names)
+        records = {}
+        instancers = None
+        if job.output_mode == scatter_engine.OUTPUT_INSTANCER:
+            instancers = scatter_engine.InstancerBuffer()
+        writer = None
+        if job.layout_path:
+            writer = scatter_layout.LayoutWriter(
+                job.layout_path, names,
+                {'target': job.target, 'seed': job.seed,
+                 'parameters': dict(vars(settings),
+                                    output_mode=job.output_mode)})
+        self.cmds.undoInfo(openChunk=True)
+        try:
+            if job.replace:
+                self._delete_previous(job)
+            layout = scatter_parallel.iter_layout(
+                mesh, settings, job.seed, workers=self.workers,
+                profiler=self.profiler)
+            for chunk_index, transforms in enumerate(layout):
+                self.profiler.merge(transforms.stats)
+                rng = scatter_parallel.chunk_rng(
+                    job.seed, scatter_parallel.STREAM_SOURCES, chunk_index)
+                with self.profiler.span('pick_sources'):
+                    picks = table.sample(rng, len(transforms))
+                for source_index in np.unique(picks):
+                    name = names[source_index]
+                    subset = transforms.subset(picks == source_index)
+                    if name not in records:
+                        records[name] = scatter_jobs.ScatterJob.create(
+                            self.cmds, name, job.target, job.seed)
+                    if instancers is not None:
+                        instancers.add(name, subset)
+                    else:
+                        records[name].add(self._write(name, subset))
+                    counts[name] += len(subset)
+                if writer is not None:
+                    with self.profiler.span('save_layout'):
+                        writer.write(transforms, picks)
+        finally:
+            if instancers is not None:
+                for name, nodes in instancers.flush(
+                        self.cmds, profiler=self.profiler).items():
+                    records[name].add(nodes)
+            self.cmds.undoInfo(closeChunk=True)
+            if writer is not None:
+                writer.close()
+        log.info("Scattered %d instances of %d sources onto %s",
+                 sum(counts.values()), len(names), job.target)
+        return counts
+
+    def _delete_previous(self, job):
+        with self.profiler.span('delete_previous'):
+            previous = []
+            for name in job.sources:
+                previous.extend(scatter_jobs.find_jobs(self.cmds, name,
+                                                       job.target))
+            scatter_jobs.delete_jobs(self.cmds, previous)
+
+    def _write(self, object_to_instance, transforms):
+        return scatter_engine.apply_transforms(self.cmds, object_to_instance,
+                                               transforms,
+                                               profiler=self.profiler)
+
+
+def _fake_scene(jobs, grid_size):
+    """Return a fake backend holding every object the jobs refer to."""
+    import fakemaya
+    cmds = fakemaya.FakeCmds()
+    sources = {}
+    for job in jobs:
+        if job.target not in sources:
+            cmds.add_node(job.target, 'mesh')
+            sources[job.target] = fakemaya.FakeMeshSource.grid(
+                job.target, grid_size, grid_size)
+        for name in job.sources:
+            if not cmds.objExists(name):
+                cmds.add_node(name)
+    return cmds, sources.__getitem__
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('job_file', help="JSON job file to run.")
+    parser.add_argument('--scene', help="Scene to open before scattering.")
+    parser.add_argument('--output', help="Save the dressed scene here.")
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--profile', action='store_true',
+                        help="Log stage timings when done.")
+    parser.add_argument('--fake', action='store_true',
+                        help="Run against the fake backend, with a grid "
+                             "mesh standing in for every target.")
+    parser.add_argument('--fake-grid-size', type=int,
+                        default=FAKE_GRID_SIZE)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    jobs = load_jobs(args.job_file)
+    if args.fake:
+        cmds, source_factory = _fake_scene(jobs, args.fake_grid_size)
+    else:
+        import maya.standalone
+        maya.standalone.initialize()
+        from maya import cmds
+        source_factory = scatter_mesh.MayaMeshSource
+        if args.scene:
+            cmds.file(args.scene, open=True, force=True)
+    profiler = profiling.Profiler(enabled=args.profile,
+                                  label='Scatter profile')
+    BatchScatter(cmds, source_factory, workers=args.workers,
+                 profiler=profiler).run(jobs)
+    if profiler.enabled:
+        log.info(profiler.summary())
+    if args.output and not args.fake:
+        cmds.file(rename=args.output)
+        file_type = 'mayaBinary' if args.output.lower().endswith('.mb') \
+            else 'mayaAscii'
+        cmds.file(save=True, force=True, type=file_type)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
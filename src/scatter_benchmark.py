@@ -0,0 +1,187 @@
+"""Benchmark suite for ScatterTool.
+
+Runs ScatterTool.scatter against the in-memory fake maya.cmds backend on
+synthetic grid meshes, and reports wall time, peak memory and the number of
+scene calls made per instance. Results can be stored as a baseline and later
+runs compared against it, flagging regressions.
+
+Run it outside of Maya from the src folder:
+
+    python scatter_benchmark.py --save-baseline scatter_baseline.json
+    python scatter_benchmark.py --baseline scatter_baseline.json
+"""
+import argparse
+import json
+import logging
+import math
+import sys
+import time
+import tracemalloc
+
+import fakemaya
+
+log = logging.getLogger(__name__)
+
+DEFAULT_SIZES = (1000, 10000, 100000, 1000000)
+DEFAULT_DENSITIES = (0.01, 0.1, 1.0)
+DEFAULT_TOLERANCE = 0.25
+NOISE_FLOOR_SECONDS = 0.05
+SOURCE = 'scatterSource'
+TARGET = 'scatterTarget'
+
+
+class BenchmarkCase(object):
+    """One combination of mesh size, alignment, density and output mode."""
+
+    def __init__(self, vertex_count, align, density, output_mode,
+                 sampling='vertices'):
+        self.vertex_count = vertex_count
+        self.align = align
+        self.density = density
+        self.output_mode = output_mode
+        self.sampling = sampling
+
+    @property
+    def key(self):
+        return "{}v_{}_{}_d{}_{}".format(
+            self.vertex_count, 'align' if self.align else 'noalign',
+            self.sampling, self.density, self.output_mode)
+
+
+def grid_source(vertex_count):
+    """Return a square FakeMeshSource with roughly vertex_count vertices."""
+    side = max(int(round(math.sqrt(vertex_count))) - 1, 1)
+    return fakemaya.FakeMeshSource.grid(TARGET, side, side)
+
+
+def run_case(case, cmds, scatter_tool):
+    """Scatter one case into a fresh fake scene and measure it.
+
+    Returns:
+        dict: seconds, peak_bytes, instances, calls and calls_per_instance.
+    """
+    backend = fakemaya.FakeCmds()
+    backend.add_node(SOURCE)
+    backend.add_node(TARGET, 'mesh')
+    backend.select(SOURCE, TARGET)
+    cmds.backend = backend
+    source = grid_source(case.vertex_count)
+    scatter_tool.scatter_mesh.GEOMETRY_CACHE.invalidate()
+    tool = scatter_tool.ScatterTool()
+    tool.source_factory = lambda name: source
+    tool.seed = 1
+    tool.align = case.align
+    tool.density = case.density
+    tool.sampling = case.sampling
+    tool.output_mode = case.output_mode
+    tool.max_rotate_y = 360
+    tool.max_scale = 2.0
+    cmds.reset()
+    tracemalloc.start()
+    start = time.perf_counter()
+    instances = 0
+    for instances, _ in tool.iter_scatter():
+        pass
+    seconds = time.perf_counter() - start
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    calls = cmds.total_calls
+    return {'seconds': seconds,
+            'peak_bytes': peak_bytes,
+            'instances': instances,
+            'calls': calls,
+            'calls_per_instance': calls / float(max(instances, 1))}
+
+
+def run_suite(cases):
+    """Run every case and return the results keyed by case."""
+    cmds = fakemaya.install()
+    import scatter_tool
+    logging.getLogger(scatter_tool.__name__).setLevel(logging.WARNING)
+    if cases:
+        # Warm up imports and caches so the first case is not penalised.
+        run_case(BenchmarkCase(1000, True, 0.1, cases[0].output_mode),
+                 cmds, scatter_tool)
+    results = {}
+    for case in cases:
+        results[case.key] = run_case(case, cmds, scatter_tool)
+        log.info("%-48s %9.3fs %10.1fMB %8.2f calls/instance", case.key,
+                 results[case.key]['seconds'],
+                 results[case.key]['peak_bytes'] / 1048576.0,
+                 results[case.key]['calls_per_instance'])
+    return results
+
+
+def find_regressions(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """Compare results to a baseline.
+
+    Time and memory regress when they grow by more than tolerance, ignoring
+    times under the noise floor; the call count is deterministic, so any
+    increase in calls per instance regresses.
+
+    Returns:
+        list: One message per regression.
+    """
+    regressions = []
+    for key, result in sorted(results.items()):
+        expected = baseline.get(key)
+        if expected is None:
+            continue
+        for metric in ('seconds', 'peak_bytes'):
+            if metric == 'seconds' and \
+                    result[metric] < NOISE_FLOOR_SECONDS:
+                continue
+            if result[metric] > expected[metric] * (1.0 + tolerance):
+                regressions.append("{} {}: {:.4g} > baseline {:.4g}".format(
+                    key, metric, result[metric], expected[metric]))
+        if result['calls_per_instance'] > \
+                expected['calls_per_instance'] + 1e-9:
+            regressions.append(
+                "{} calls_per_instance: {:.4g} > baseline {:.4g}".format(
+                    key, result['calls_per_instance'],
+                    expected['calls_per_instance']))
+    return regressions
+
+
+def build_cases(sizes, densities, output_modes, sampling):
+    return [BenchmarkCase(size, align, density, output_mode, sampling)
+            for size in sizes
+            for align in (False, True)
+            for density in densities
+            for output_mode in output_modes]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=list(DEFAULT_SIZES))
+    parser.add_argument('--densities', type=float, nargs='+',
+                        default=list(DEFAULT_DENSITIES))
+    parser.add_argument('--output-modes', nargs='+',
+                        default=['transforms', 'instancer'])
+    parser.add_argument('--sampling', default='vertices',
+                        choices=['vertices', 'surface'])
+    parser.add_argument('--baseline', help="Baseline JSON to compare with.")
+    parser.add_argument('--save-baseline',
+                        help="Write the results to this baseline JSON.")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    results = run_suite(build_cases(args.sizes, args.densities,
+                                    args.output_modes, args.sampling))
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as baseline_file:
+            json.dump(results, baseline_file, indent=2, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = find_regressions(results, json.load(baseline_file),
+                                           args.tolerance)
+        for regression in regressions:
+            log.error("REGRESSION %s", regression)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
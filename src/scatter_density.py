@@ -0,0 +1,302 @@
+"""Density maps for the scatter tool.
+
+A density map gives every vertex or face of the target a weight, read from a
+color set or a texture, and the scatter places instances in proportion to it.
+Surface sampling draws triangles from an alias table built from the triangle
+areas times the map, so each point costs O(1) however many triangles there
+are. Vertex sampling draws distinct vertices with probability following the
+map.
+
+The table built from a map is stored on the MeshData it was built for, so it
+is cached alongside the geometry and a repeated scatter with the same map
+reuses it. The live preview keeps its table in a DensityCache, which does not
+even read the map again until the map or the target changes.
+"""
+import hashlib
+import logging
+
+import numpy as np
+
+import scatter_engine
+import scatter_mesh
+import scatter_sampling
+
+CHANNEL_LUMINANCE = 'luminance'
+CHANNELS = {'r': 0, 'g': 1, 'b': 2, 'a': 3}
+LUMINANCE_WEIGHTS = np.array([0.2126, 0.7152, 0.0722])
+
+log = logging.getLogger(__name__)
+
+
+class DensityMap(object):
+    """Base class for weights over the vertices or faces of a mesh.
+
+    Args:
+        mesh (str): Name of the mesh the weights belong to.
+        per_face (bool): The weights are per face rather than per vertex.
+    """
+
+    def __init__(self, mesh, per_face=False):
+        self.mesh = mesh
+        self.per_face = per_face
+
+    def weights(self):
+        """Return the non-negative weight of every vertex or face.
+
+        Returns:
+            numpy.ndarray: One weight per vertex, or per face when per_face.
+        """
+        raise NotImplementedError
+
+    def source_key(self):
+        """Return a cheap key of where the weights are read from, or None.
+
+        Unlike the weights it does not change when the map is painted, so it
+        only tells maps apart. None means reading the map is the only way.
+        """
+        return None
+
+
+class ArrayDensity(DensityMap):
+    """Weights given directly as an array."""
+
+    def __init__(self, mesh, values, per_face=False):
+        super(ArrayDensity, self).__init__(mesh, per_face)
+        self.values = np.asarray(values, dtype=np.float64)
+
+    def weights(self):
+        return self.values
+
+
+class ColorSetDensity(DensityMap):
+    """Weights read from a color set of the mesh.
+
+    Vertices without a color count as black, so only painted areas receive
+    instances.
+
+    Args:
+        mesh (str): Name of the mesh.
+        color_set (str): Color set to read. The current one when None.
+        channel (str): 'luminance', 'r', 'g', 'b' or 'a'.
+        per_face (bool): Average the colors of every face instead of
+            reading them per vertex.
+    """
+
+    def __init__(self, mesh, color_set=None, channel=CHANNEL_LUMINANCE,
+                 per_face=False):
+        super(ColorSetDensity, self).__init__(mesh, per_face)
+        self.color_set = color_set
+        self.channel = channel
+
+    def source_key(self):
+        return ('colorSet', self.mesh, self.color_set, self.channel,
+                self.per_face)
+
+    def weights(self):
+        import maya.api.OpenMaya as om
+        fn_mesh = scatter_mesh.maya_mesh_fn(self.mesh)
+        color_set = self.color_set or fn_mesh.currentColorSetName()
+        black = om.MColor((0.0, 0.0, 0.0, 0.0))
+        if not self.per_face:
+            colors = fn_mesh.getVertexColors(color_set, black)
+            return channel_weights(_color_array(colors), self.channel)
+        colors = fn_mesh.getFaceVertexColors(color_set, black)
+        face_counts, _ = fn_mesh.getVertices()
+        face_counts = np.asarray(face_counts, dtype=np.int64)
+        face_ids = np.repeat(np.arange(len(face_counts)), face_counts)
+        totals = np.bincount(
+            face_ids, channel_weights(_color_array(colors), self.channel),
+            minlength=len(face_counts))
+        return totals / np.maximum(face_counts, 1)
+
+
+class TextureDensity(DensityMap):
+    """Weights sampled from a texture node at the UVs of every vertex.
+
+    The texture is evaluated in one colorAtPoint call for all vertices.
+    Vertices without UVs get zero weight.
+
+    Args:
+        mesh (str): Name of the mesh.
+        texture (str): Texture node to evaluate, e.g. a file or ramp node.
+        uv_set (str): UV set to look up. The current one when None.
+        channel (str): 'luminance', 'r', 'g', 'b' or 'a'.
+    """
+
+    def __init__(self, mesh, texture, uv_set=None, channel=CHANNEL_LUMINANCE):
+        super(TextureDensity, self).__init__(mesh, per_face=False)
+        self.texture = texture
+        self.uv_set = uv_set
+        self.channel = channel
+
+    def source_key(self):
+        """Key on the texture node and, for file nodes, the image file."""
+        import maya.cmds as cmds
+        image = None
+        if cmds.attributeQuery('fileTextureName', node=self.texture,
+                               exists=True):
+            image = cmds.getAttr(self.texture + '.fileTextureName')
+        return ('texture', self.mesh, self.texture, image, self.uv_set,
+                self.channel)
+
+    def weights(self):
+        import maya.cmds as cmds
+        fn_mesh = scatter_mesh.maya_mesh_fn(self.mesh)
+        uv_set = self.uv_set or fn_mesh.currentUVSetName()
+        us, vs = fn_mesh.getUVs(uv_set)
+        uv_counts, uv_ids = fn_mesh.getAssignedUVs(uv_set)
+        face_counts, face_indices = fn_mesh.getVertices()
+        # uv_ids only lists the face vertices of faces that have UVs.
+        mapped_faces = np.repeat(np.asarray(uv_counts) > 0,
+                                 np.asarray(face_counts))
+        vertex_uvs = np.full(fn_mesh.numVertices, -1, dtype=np.int64)
+        vertex_uvs[np.asarray(face_indices, dtype=np.int64)[mapped_faces]] = \
+            np.asarray(uv_ids, dtype=np.int64)
+        weights = np.zeros(len(vertex_uvs))
+        mapped = vertex_uvs >= 0
+        if not mapped.any():
+            return weights
+        us = np.asarray(us)[vertex_uvs[mapped]]
+        vs = np.asarray(vs)[vertex_uvs[mapped]]
+        colors = cmds.colorAtPoint(self.texture, output='RGBA',
+                                   coordU=us.tolist(), coordV=vs.tolist())
+        weights[mapped] = channel_weights(
+            np.asarray(colors, dtype=np.float64).reshape(-1, 4),
+            self.channel)
+        return weights
+
+
+def channel_weights(colors, channel=CHANNEL_LUMINANCE):
+    """Return one weight per (N, 4) RGBA color."""
+    if channel == CHANNEL_LUMINANCE:
+        weights = colors[:, :3].dot(LUMINANCE_WEIGHTS)
+    else:
+        weights = colors[:, CHANNELS[channel]]
+    return np.maximum(weights, 0.0)
+
+
+def _color_array(colors):
+    return np.array([(color.r, color.g, color.b, color.a)
+                     for color in colors], dtype=np.float64).reshape(-1, 4)
+
+
+def from_name(cmds, mesh, name):
+    """Return the density map a name in the scatter UI refers to.
+
+    A name of an existing node is read as a texture, anything else as a color
+    set of the mesh. An empty name means no density map.
+
+    Raises:
+        ValueError: The name is neither a node nor a color set of the mesh.
+    """
+    if not name:
+        return None
+    if cmds.objExists(name):
+        return TextureDensity(mesh, name)
+    if name not in (cmds.polyColorSet(mesh, query=True, allColorSets=True)
+                    or []):
+        raise ValueError("Density map {} is neither a texture node nor a "
+                         "color set of {}".format(name, mesh))
+    return ColorSetDensity(mesh, color_set=name)
+
+
+class DensityCache(object):
+    """The sampling table of one density map, read once and then reused.
+
+    Reading a map and hashing its weights is the slow part of a preview
+    update, so the table is kept until the map's source_key, the sampling
+    or the target geometry changes, or until reload is called after the map
+    was painted. Geometry is compared by MeshData, which the geometry cache
+    keys on the mesh signature, so an edited or different target reads the
+    map again.
+    """
+
+    def __init__(self):
+        self.table = None
+        self._key = None
+        self._mesh = None
+
+    def fetch(self, mesh, density_map, sampling):
+        """Return the table of density_map over mesh, or None without one.
+
+        Args:
+            mesh (MeshData): Geometry of the target.
+            density_map (DensityMap): Weights over the target, or None.
+            sampling (str): SAMPLE_VERTICES or SAMPLE_SURFACE.
+        """
+        if density_map is None:
+            self.reload()
+            return None
+        key = (density_map.source_key(), sampling)
+        if key[0] is None or key != self._key or mesh is not self._mesh:
+            self.table = density_table(mesh, density_map, sampling)
+            self._key = key
+            self._mesh = mesh
+        return self.table
+
+    def reload(self):
+        """Read the map again on the next fetch."""
+        self.table = None
+        self._key = None
+        self._mesh = None
+
+
+def density_table(mesh, density_map, sampling):
+    """Return the sampling table of a density map, cached on the mesh.
+
+    The table is keyed on a hash of the weights, so reading the map again is
+    the only cost of a repeated scatter with an unchanged map. A map that is
+    zero everywhere, such as an unpainted color set, places no instances
+    in either sampling mode, and a warning is logged.
+
+    Args:
+        mesh (MeshData): Geometry of the target.
+        density_map (DensityMap): Weights over the target.
+        sampling (str): SAMPLE_VERTICES or SAMPLE_SURFACE.
+
+    Returns:
+        An AliasTable over the fan triangles for surface sampling, or the
+        weight of every vertex for vertex sampling.
+
+    Raises:
+        ValueError: The map could not be read, or does not fit the mesh.
+    """
+    try:
+        weights = np.ascontiguousarray(density_map.weights(),
+                                       dtype=np.float64)
+    except RuntimeError as err:
+        raise ValueError("Could not read the density map of {}: {}".format(
+            density_map.mesh, err))
+    expected = mesh.face_count if density_map.per_face else mesh.vertex_count
+    if len(weights) != expected:
+        raise ValueError("Density map of {} has {} weights, expected {}"
+                         .format(density_map.mesh, len(weights), expected))
+    if not (weights > 0.0).any():
+        log.warning("Density map of %s is zero everywhere, nothing will be "
+                    "scattered", density_map.mesh)
+    key = ('density', sampling, density_map.per_face,
+           hashlib.sha1(weights.tobytes()).hexdigest())
+    return mesh.derived(key, lambda: _build_table(mesh, weights,
+                                                  density_map.per_face,
+                                                  sampling))
+
+
+def _build_table(mesh, weights, per_face, sampling):
+    if sampling != scatter_engine.SAMPLE_SURFACE:
+        if not per_face:
+            return weights
+        face_ids = np.repeat(np.arange(mesh.face_count), mesh.face_counts)
+        totals = np.bincount(mesh.face_indices, weights[face_ids],
+                             minlength=mesh.vertex_count)
+        valence = np.bincount(mesh.face_indices,
+                              minlength=mesh.vertex_count)
+        return totals / np.maximum(valence, 1)
+    surface = scatter_sampling.surface_triangles(mesh)
+    triangles = surface.triangles
+    areas = surface.areas
+    if per_face:
+        triangle_weights = weights[
+            scatter_sampling.triangle_faces(mesh.face_counts)]
+    else:
+        triangle_weights = weights[triangles].mean(axis=1)
+    return scatter_sampling.AliasTable(areas * triangle_weights)
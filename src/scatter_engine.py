@@ -0,0 +1,369 @@
+"""Batched transform engine for the scatter tool.
+
+Scattering is split into two stages. The compute stage builds the position,
+random rotation and random scale of every instance as NumPy arrays in a single
+pass. The apply stage writes those arrays to the scene in bulk. Neither stage
+imports Maya; the scene backend is passed in so both can run against an
+in-memory stand-in for maya.cmds.
+"""
+import collections
+
+import numpy as np
+
+import profiling
+
+SAMPLE_VERTICES = 'vertices'
+SAMPLE_SURFACE = 'surface'
+OUTPUT_TRANSFORMS = 'transforms'
+OUTPUT_INSTANCER = 'instancer'
+
+
+def scatter_count(vertex_count, density, sampling=SAMPLE_VERTICES):
+    """Return the number of instances a density asks for on a mesh.
+
+    The density multiplies the vertex count of the mesh. Vertex sampling can
+    never place more points than there are vertices, surface sampling can.
+    """
+    count = int(vertex_count * density)
+    if sampling != SAMPLE_SURFACE:
+        count = min(count, vertex_count)
+    return count
+
+
+class LayoutSettings(object):
+    """Parameters that decide where instances land and how they are posed.
+
+    Args:
+        count (int): Number of instances requested.
+        sampling (str): SAMPLE_VERTICES or SAMPLE_SURFACE.
+        min_distance (float): Minimum spacing of surface samples.
+        align (bool): Align the instances to the surface normals.
+        min_rotation: Minimum x, y and z rotation in degrees.
+        max_rotation: Maximum x, y and z rotation in degrees.
+        min_scale (float): Minimum uniform scale.
+        max_scale (float): Maximum uniform scale.
+    """
+
+    def __init__(self, count, sampling=SAMPLE_VERTICES, min_distance=0.0,
+                 align=False, min_rotation=(0, 0, 0), max_rotation=(0, 0, 0),
+                 min_scale=1.0, max_scale=1.0):
+        self.count = count
+        self.sampling = sampling
+        self.min_distance = min_distance
+        self.align = align
+        self.min_rotation = tuple(min_rotation)
+        self.max_rotation = tuple(max_rotation)
+        self.min_scale = min_scale
+        self.max_scale = max_scale
+
+
+class ScatterTransforms(object):
+    """Arrays describing the transform of every scattered instance.
+
+    ``stats`` optionally holds the profile of the chunk that built them, as
+    returned by Profiler.as_dict, so it can travel back from a worker.
+    """
+
+    stats = None
+
+    def __init__(self, positions, rotations, scales, frames=None):
+        self.positions = np.asarray(positions, dtype=np.float64)
+        self.rotations = np.asarray(rotations, dtype=np.float64)
+        self.scales = np.asarray(scales, dtype=np.float64)
+        if frames is not None:
+            frames = np.asarray(frames, dtype=np.float64)
+        self.frames = frames
+
+    def __len__(self):
+        return len(self.positions)
+
+    def subset(self, selection):
+        """Return the transforms picked by an index array or boolean mask."""
+        frames = None if self.frames is None else self.frames[selection]
+        return ScatterTransforms(self.positions[selection],
+                                 self.rotations[selection],
+                                 self.scales[selection], frames=frames)
+
+    def rotation_matrices(self):
+        """Return the random rotations as (N, 3, 3) xyz Euler matrices."""
+        return euler_to_matrices(self.rotations)
+
+    def orientations(self):
+        """Return the random rotation combined with the alignment frame."""
+        orientations = self.rotation_matrices()
+        if self.frames is not None:
+            orientations = np.matmul(orientations, self.frames)
+        return orientations
+
+    def euler_rotations(self):
+        """Return the orientations as (N, 3) xyz Euler angles in degrees."""
+        return matrices_to_euler(self.orientations())
+
+    def matrices(self):
+        """Return the world matrices of every instance as an (N, 4, 4) array.
+
+        Matrices use Maya's row-vector layout: the random scale and rotation
+        are applied in object space, then the optional alignment frame, then
+        the translation held in the last row.
+        """
+        count = len(self)
+        basis = self.orientations() * self.scales[:, None, None]
+        matrices = np.zeros((count, 4, 4))
+        matrices[:, :3, :3] = basis
+        matrices[:, 3, :3] = self.positions
+        matrices[:, 3, 3] = 1.0
+        return matrices
+
+
+def concatenate_transforms(chunks):
+    """Join a sequence of ScatterTransforms into one."""
+    chunks = list(chunks)
+    if not chunks:
+        return ScatterTransforms(np.zeros((0, 3)), np.zeros((0, 3)),
+                                 np.zeros(0))
+    frames = None
+    if chunks[0].frames is not None:
+        frames = np.concatenate([chunk.frames for chunk in chunks])
+    return ScatterTransforms(
+        np.concatenate([chunk.positions for chunk in chunks]),
+        np.concatenate([chunk.rotations for chunk in chunks]),
+        np.concatenate([chunk.scales for chunk in chunks]),
+        frames=frames)
+
+
+def euler_to_matrices(rotations):
+    """Convert (N, 3) xyz Euler angles in degrees to (N, 3, 3) matrices."""
+    radians = np.radians(np.asarray(rotations, dtype=np.float64))
+    cos = np.cos(radians)
+    sin = np.sin(radians)
+    count = len(radians)
+    rot_x = np.zeros((count, 3, 3))
+    rot_x[:, 0, 0] = 1.0
+    rot_x[:, 1, 1] = cos[:, 0]
+    rot_x[:, 1, 2] = sin[:, 0]
+    rot_x[:, 2, 1] = -sin[:, 0]
+    rot_x[:, 2, 2] = cos[:, 0]
+    rot_y = np.zeros((count, 3, 3))
+    rot_y[:, 1, 1] = 1.0
+    rot_y[:, 0, 0] = cos[:, 1]
+    rot_y[:, 0, 2] = -sin[:, 1]
+    rot_y[:, 2, 0] = sin[:, 1]
+    rot_y[:, 2, 2] = cos[:, 1]
+    rot_z = np.zeros((count, 3, 3))
+    rot_z[:, 2, 2] = 1.0
+    rot_z[:, 0, 0] = cos[:, 2]
+    rot_z[:, 0, 1] = sin[:, 2]
+    rot_z[:, 1, 0] = -sin[:, 2]
+    rot_z[:, 1, 1] = cos[:, 2]
+    return np.matmul(np.matmul(rot_x, rot_y), rot_z)
+
+
+def matrices_to_euler(matrices):
+    """Convert (N, 3, 3) rotation matrices to xyz Euler angles in degrees.
+
+    This is the inverse of euler_to_matrices. In gimbal lock the z rotation
+    is set to zero and folded into x.
+    """
+    matrices = np.asarray(matrices, dtype=np.float64).reshape(-1, 3, 3)
+    sin_y = np.clip(-matrices[:, 0, 2], -1.0, 1.0)
+    rotations = np.empty((len(matrices), 3))
+    rotations[:, 1] = np.arcsin(sin_y)
+    locked = np.abs(sin_y) > 1.0 - 1e-9
+    free = ~locked
+    rotations[free, 0] = np.arctan2(matrices[free, 1, 2],
+                                    matrices[free, 2, 2])
+    rotations[free, 2] = np.arctan2(matrices[free, 0, 1],
+                                    matrices[free, 0, 0])
+    rotations[locked, 0] = np.arctan2(-matrices[locked, 2, 1],
+                                      matrices[locked, 1, 1])
+    rotations[locked, 2] = 0.0
+    return np.degrees(rotations)
+
+
+def compute_transforms(positions, min_rotation, max_rotation, min_scale,
+                       max_scale, frames=None, rng=None):
+    """Build the transforms of every instance in one pass.
+
+    Args:
+        positions: (N, 3) world positions of the instances.
+        min_rotation: Minimum x, y and z rotation in degrees.
+        max_rotation: Maximum x, y and z rotation in degrees.
+        min_scale: Minimum uniform scale.
+        max_scale: Maximum uniform scale.
+        frames: Optional (N, 3, 3) alignment frames, one per instance.
+        rng: Optional numpy Generator used for the random draws.
+
+    Returns:
+        ScatterTransforms: The positions, rotations and scales as arrays.
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    positions = np.asarray(positions, dtype=np.float64).reshape(-1, 3)
+    count = len(positions)
+    rotations = rng.uniform(np.asarray(min_rotation, dtype=np.float64),
+                            np.asarray(max_rotation, dtype=np.float64),
+                            size=(count, 3))
+    scales = rng.uniform(min_scale, max_scale, size=count)
+    return ScatterTransforms(positions, rotations, scales, frames=frames)
+
+
+def bounding_radius(cmds, object_to_instance):
+    """Return the radius around the pivot enclosing the object at scale 1.
+
+    The radius is taken from the object space bounding box, so it does not
+    depend on where the object sits or how it is transformed in the scene.
+    """
+    bounds = np.asarray(cmds.xform(object_to_instance, query=True,
+                                   boundingBox=True, objectSpace=True),
+                        dtype=np.float64)
+    corners = np.maximum(np.abs(bounds[:3]), np.abs(bounds[3:]))
+    return float(np.sqrt(np.dot(corners, corners)))
+
+
+def apply_transforms(cmds, object_to_instance, transforms,
+                     profiler=profiling.DISABLED):
+    """Write computed transforms to the scene as instances.
+
+    Each instance costs one instance call and one matrix write, and the whole
+    batch is wrapped in a single undo chunk. Nodes are created first and the
+    matrices written after, so the two stages can be timed separately.
+
+    Args:
+        cmds: The scene backend, maya.cmds or a stand-in for it.
+        object_to_instance: Transform to instance.
+        transforms (ScatterTransforms): The transforms to write.
+        profiler (Profiler): Collects the stage timings.
+
+    Returns:
+        list: The names of the created instances.
+    """
+    matrices = transforms.matrices().reshape(-1, 16).tolist()
+    cmds.undoInfo(openChunk=True)
+    try:
+        with profiler.span('create_nodes'):
+            new_instances = [cmds.instance(object_to_instance)[0]
+                             for _ in matrices]
+        with profiler.span('write_transforms'):
+            for new_instance, matrix in zip(new_instances, matrices):
+                cmds.xform(new_instance, worldSpace=True, matrix=matrix)
+    finally:
+        cmds.undoInfo(closeChunk=True)
+    profiler.count('nodes_created', len(new_instances))
+    return new_instances
+
+
+def apply_instancer(cmds, object_to_instance, transforms,
+                    name='scatterInstancer',
+                    profiler=profiling.DISABLED):
+    """Write computed transforms to the scene as a single instancer.
+
+    The positions become the particles of one particle object, and the
+    rotations and scales are stored as per-particle vector arrays that drive
+    a particle instancer. The scene holds the same three nodes no matter how
+    many instances there are.
+
+    Args:
+        cmds: The scene backend, maya.cmds or a stand-in for it.
+        object_to_instance: Transform to instance.
+        transforms (ScatterTransforms): The transforms to write.
+        name (str): Base name of the created nodes.
+        profiler (Profiler): Collects the stage timings.
+
+    Returns:
+        list: The particle transform, its shape and the instancer node.
+    """
+    return write_instancer(cmds, object_to_instance, transforms.positions,
+                           transforms.euler_rotations(), transforms.scales,
+                           name=name, profiler=profiler)
+
+
+def write_instancer(cmds, object_to_instance, positions, rotations, scales,
+                    name='scatterInstancer',
+                    profiler=profiling.DISABLED):
+    """Create one particle instancer from per-particle arrays.
+
+    maya.cmds only takes vector arrays as Python lists of tuples, which
+    are several times the size of the arrays. Only one of the three lists
+    is built at a time, so the peak is one list on top of the arrays.
+
+    Args:
+        positions (ndarray): (N, 3) particle positions.
+        rotations (ndarray): (N, 3) xyz Euler rotations in degrees.
+        scales (ndarray): (N,) uniform scales.
+
+    Returns:
+        list: The particle transform, its shape and the instancer node.
+    """
+    cmds.undoInfo(openChunk=True)
+    try:
+        with profiler.span('create_nodes'):
+            particle, particle_shape = cmds.particle(
+                position=[tuple(position)
+                          for position in positions.tolist()],
+                name=name + 'Particle')
+            for attribute in ('rotationPP', 'scalePP'):
+                for suffix in ('', '0'):
+                    cmds.addAttr(particle_shape,
+                                 longName=attribute + suffix,
+                                 dataType='vectorArray')
+            instancer = cmds.particleInstancer(
+                particle_shape, addObject=True, object=object_to_instance,
+                rotation='rotationPP', scale='scalePP', name=name)
+        with profiler.span('write_transforms'):
+            cmds.setAttr(particle_shape + '.rotationPP',
+                         [tuple(rotation) for rotation in rotations.tolist()],
+                         type='vectorArray')
+            cmds.setAttr(particle_shape + '.scalePP',
+                         [(scale, scale, scale) for scale in scales.tolist()],
+                         type='vectorArray')
+            cmds.saveInitialState(particle_shape)
+    finally:
+        cmds.undoInfo(closeChunk=True)
+    profiler.count('nodes_created', 3)
+    return [particle, particle_shape, instancer]
+
+
+class InstancerBuffer(object):
+    """Per-particle arrays of batched scatters, written as one instancer.
+
+    Instancer output is only arrays, so batches are gathered here, reduced
+    to positions, Euler rotations and scales, and flush writes a single
+    particle instancer per instanced object. The scene cost stays three
+    nodes per object however many batches a scatter takes.
+
+    The price is memory: unlike transform output, the buffer holds every
+    instance of the scatter until flush, at 56 bytes per instance (seven
+    float64 values), and write_instancer briefly adds a list of tuples on
+    top of that.
+    """
+
+    def __init__(self):
+        self._batches = collections.OrderedDict()
+
+    def __len__(self):
+        return sum(len(positions) for batches in self._batches.values()
+                   for positions, _, _ in batches)
+
+    def add(self, object_to_instance, transforms):
+        if len(transforms):
+            self._batches.setdefault(object_to_instance, []).append(
+                (transforms.positions, transforms.euler_rotations(),
+                 transforms.scales))
+
+    def flush(self, cmds, profiler=profiling.DISABLED):
+        """Write one instancer per object and empty the buffer.
+
+        Returns:
+            OrderedDict: The particle and instancer nodes by object.
+        """
+        nodes = collections.OrderedDict()
+        for object_to_instance, batches in self._batches.items():
+            particle, _, instancer = write_instancer(
+                cmds, object_to_instance,
+                np.concatenate([batch[0] for batch in batches]),
+                np.concatenate([batch[1] for batch in batches]),
+                np.concatenate([batch[2] for batch in batches]),
+                profiler=profiler)
+            nodes[object_to_instance] = [particle, instancer]
+        self._batches.clear()
+        return nodes
@@ -0,0 +1,90 @@
+"""Registry of scatter runs.
+
+Every scatter run is recorded as a job: an object set holding the nodes that
+run created, tagged with the source and target objects. Undoing or replacing
+a scatter deletes exactly those nodes with a single delete call, so the cost
+does not depend on how big the rest of the scene is.
+"""
+import logging
+
+log = logging.getLogger(__name__)
+
+JOB_SET_NAME = 'scatterJob'
+SOURCE_ATTRIBUTE = 'scatterSource'
+TARGET_ATTRIBUTE = 'scatterTarget'
+SEED_ATTRIBUTE = 'scatterSeed'
+
+
+class ScatterJob(object):
+    """A recorded scatter run and the nodes it created."""
+
+    def __init__(self, cmds, name):
+        self.cmds = cmds
+        self.name = name
+
+    @classmethod
+    def create(cls, cmds, object_to_instance, target, seed=None):
+        """Create an empty job for scattering object_to_instance to target."""
+        name = cmds.sets(empty=True, name=JOB_SET_NAME + '1')
+        for attribute, value in ((SOURCE_ATTRIBUTE, object_to_instance),
+                                 (TARGET_ATTRIBUTE, target)):
+            cmds.addAttr(name, longName=attribute, dataType='string')
+            cmds.setAttr(name + '.' + attribute, str(value), type='string')
+        if seed is not None:
+            cmds.addAttr(name, longName=SEED_ATTRIBUTE, attributeType='long')
+            cmds.setAttr(name + '.' + SEED_ATTRIBUTE, seed)
+        return cls(cmds, name)
+
+    @property
+    def source(self):
+        return self.cmds.getAttr(self.name + '.' + SOURCE_ATTRIBUTE)
+
+    @property
+    def target(self):
+        return self.cmds.getAttr(self.name + '.' + TARGET_ATTRIBUTE)
+
+    def add(self, nodes):
+        """Record nodes created by this job."""
+        if nodes:
+            self.cmds.sets(nodes, add=self.name)
+
+    def nodes(self):
+        """Return the nodes created by this job that still exist."""
+        return self.cmds.sets(self.name, query=True) or []
+
+    def delete(self):
+        """Delete the nodes of this job and the job itself in one call."""
+        delete_jobs(self.cmds, [self])
+
+
+def find_jobs(cmds, object_to_instance=None, target=None):
+    """Return the recorded jobs, optionally filtered by source and target."""
+    jobs = []
+    for name in cmds.ls(JOB_SET_NAME + '*', type='objectSet') or []:
+        job = ScatterJob(cmds, name)
+        if not cmds.attributeQuery(SOURCE_ATTRIBUTE, node=name,
+                                   exists=True):
+            continue
+        if object_to_instance is not None and \
+                job.source != str(object_to_instance):
+            continue
+        if target is not None and job.target != str(target):
+            continue
+        jobs.append(job)
+    return jobs
+
+
+def delete_jobs(cmds, jobs):
+    """Delete the nodes of every job and the jobs with a single delete call.
+
+    Returns:
+        int: The number of scattered nodes deleted.
+    """
+    nodes = []
+    for job in jobs:
+        nodes.extend(job.nodes())
+    if jobs:
+        cmds.delete(nodes + [job.name for job in jobs])
+        log.info("Deleted %d scattered nodes from %d scatter jobs",
+                 len(nodes), len(jobs))
+    return len(nodes)
@@ -0,0 +1,215 @@
+"""Compact binary files of finished scatter layouts.
+
+A layout file stores one fixed size record per instance (source id, world
+position, XYZ Euler rotation and uniform scale) followed by a JSON block of
+metadata: the source names the ids refer to, the target, the seed and the
+scatter parameters. The layout is written batch by batch while the scatter
+runs, and read back through a memory map a batch at a time, so neither side
+parses text per instance, and neither holds the whole layout in memory,
+except when it is applied as instancers: those gather the arrays of every
+instance to write one instancer per source.
+
+File layout, little endian:
+
+    HEADER_SIZE bytes   magic, format version, record size, instance count,
+                        metadata offset and metadata length
+    count records       RECORD_DTYPE
+    metadata            UTF-8 JSON
+"""
+import json
+import logging
+import struct
+
+import numpy as np
+
+import profiling
+import scatter_engine
+import scatter_jobs
+import scatter_parallel
+
+log = logging.getLogger(__name__)
+
+MAGIC = b'SCATLYT\x00'
+FORMAT_VERSION = 1
+HEADER_FORMAT = '<8sHHQQQ'
+HEADER_SIZE = 64
+RECORD_DTYPE = np.dtype([('source', '<u4'),
+                         ('position', '<f8', (3,)),
+                         ('rotation', '<f4', (3,)),
+                         ('scale', '<f4')])
+
+
+class LayoutWriter(object):
+    """Streams the batches of a scatter to a layout file.
+
+    Args:
+        path (str): File to write.
+        sources (list): Names of the instanced objects, indexed by source id.
+        metadata (dict): JSON friendly description of the scatter, such as
+            the target, seed and parameters.
+    """
+
+    def __init__(self, path, sources, metadata=None):
+        self.path = path
+        self.sources = list(sources)
+        self.metadata = dict(metadata or {})
+        self.count = 0
+        self._file = open(path, 'wb')
+        self._file.write(b'\0' * HEADER_SIZE)
+
+    def write(self, transforms, source_ids=None):
+        """Append a batch of transforms.
+
+        Args:
+            transforms (ScatterTransforms): The batch to store. Aligned
+                batches are stored with their frames folded into the Euler
+                rotations.
+            source_ids: Index into sources of every instance. All instances
+                use the first source when omitted.
+        """
+        records = np.zeros(len(transforms), dtype=RECORD_DTYPE)
+        if source_ids is not None:
+            records['source'] = source_ids
+        records['position'] = transforms.positions
+        records['rotation'] = transforms.euler_rotations()
+        records['scale'] = transforms.scales
+        self._file.write(records.tobytes())
+        self.count += len(records)
+
+    def close(self):
+        """Write the metadata and header, completing the file."""
+        if self._file is None:
+            return
+        metadata = dict(self.metadata, sources=self.sources)
+        block = json.dumps(metadata, sort_keys=True).encode('utf-8')
+        metadata_offset = HEADER_SIZE + self.count * RECORD_DTYPE.itemsize
+        self._file.write(block)
+        self._file.seek(0)
+        self._file.write(struct.pack(HEADER_FORMAT, MAGIC, FORMAT_VERSION,
+                                     RECORD_DTYPE.itemsize, self.count,
+                                     metadata_offset, len(block)))
+        self._file.close()
+        self._file = None
+        log.info("Saved %d instances to %s", self.count, self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+
+class LayoutFile(object):
+    """Read only, memory mapped view of a layout file.
+
+    Raises:
+        ValueError: The file is not a layout file, or was written by a newer
+            format version.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as layout_file:
+            header = layout_file.read(struct.calcsize(HEADER_FORMAT))
+            if len(header) < struct.calcsize(HEADER_FORMAT):
+                raise ValueError("{} is not a layout file".format(path))
+            (magic, version, record_size, self.count, metadata_offset,
+             metadata_length) = struct.unpack(HEADER_FORMAT, header)
+            if magic != MAGIC:
+                raise ValueError("{} is not a layout file".format(path))
+            if version > FORMAT_VERSION or \
+                    record_size != RECORD_DTYPE.itemsize:
+                raise ValueError("{} uses unsupported layout format "
+                                 "version {}".format(path, version))
+            layout_file.seek(metadata_offset)
+            self.metadata = json.loads(
+                layout_file.read(metadata_length).decode('utf-8'))
+        self.version = version
+        self.sources = self.metadata.get('sources', [])
+        self.records = np.memmap(path, dtype=RECORD_DTYPE, mode='r',
+                                 offset=HEADER_SIZE, shape=(self.count,)) \
+            if self.count else np.zeros(0, dtype=RECORD_DTYPE)
+
+    def __len__(self):
+        return self.count
+
+    def iter_batches(self, batch_size=scatter_parallel.CHUNK_SIZE):
+        """Yield the source ids and ScatterTransforms of every batch.
+
+        Only the pages of the current batch are read from disk.
+        """
+        for start, stop in scatter_parallel.chunk_ranges(self.count,
+                                                         batch_size):
+            records = self.records[start:stop]
+            yield records['source'], scatter_engine.ScatterTransforms(
+                np.array(records['position'], dtype=np.float64),
+                np.array(records['rotation'], dtype=np.float64),
+                np.array(records['scale'], dtype=np.float64))
+
+
+def iter_apply_layout(cmds, path,
+                      output_mode=scatter_engine.OUTPUT_TRANSFORMS,
+                      sources=None, batch_size=scatter_parallel.CHUNK_SIZE,
+                      profiler=profiling.DISABLED):
+    """Recreate a saved layout in the scene a batch at a time.
+
+    The whole layout is a single undo step, and every source is recorded as
+    a scatter job onto the saved target. With OUTPUT_INSTANCER the arrays of
+    every instance are kept until the end, see InstancerBuffer.
+
+    Args:
+        cmds: The maya.cmds module or a stand-in with the same interface.
+        path (str): Layout file to load.
+        output_mode (str): OUTPUT_TRANSFORMS or OUTPUT_INSTANCER.
+        sources (dict): Optional replacement object by saved source name,
+            e.g. to restore a layout with updated assets.
+        batch_size (int): Number of instances read and written per batch.
+        profiler (Profiler): Collects the write timings.
+
+    Yields:
+        tuple: Instances written so far and instances in the file.
+    """
+    layout = LayoutFile(path)
+    names = [(sources or {}).get(name, name) for name in layout.sources]
+    target = layout.metadata.get('target', '')
+    seed = layout.metadata.get('seed')
+    jobs = {}
+    instancers = None
+    if output_mode == scatter_engine.OUTPUT_INSTANCER:
+        instancers = scatter_engine.InstancerBuffer()
+    written = 0
+    cmds.undoInfo(openChunk=True)
+    try:
+        for source_ids, transforms in layout.iter_batches(batch_size):
+            for source_id in np.unique(source_ids):
+                name = names[source_id]
+                subset = transforms.subset(source_ids == source_id)
+                if name not in jobs:
+                    jobs[name] = scatter_jobs.ScatterJob.create(
+                        cmds, name, target, seed)
+                if instancers is not None:
+                    instancers.add(name, subset)
+                else:
+                    jobs[name].add(scatter_engine.apply_transforms(
+                        cmds, name, subset, profiler=profiler))
+            written += len(transforms)
+            yield written, len(layout)
+    finally:
+        if instancers is not None:
+            for name, nodes in instancers.flush(
+                    cmds, profiler=profiler).items():
+                jobs[name].add(nodes)
+        cmds.undoInfo(closeChunk=True)
+
+
+def apply_layout(cmds, path, **kwargs):
+    """Recreate a saved layout in the scene, see iter_apply_layout.
+
+    Returns:
+        int: The number of instances created.
+    """
+    written = 0
+    for written, _ in iter_apply_layout(cmds, path, **kwargs):
+        pass
+    return written
@@ -0,0 +1,274 @@
+"""Mesh sources for the scatter tool.
+
+A mesh source fetches the geometry of a mesh in a single call and returns it
+as contiguous arrays, so sampling picks indices into arrays instead of
+building and re-parsing one component string per vertex. Fetched geometry is
+kept in a GeometryCache keyed on the mesh and a cheap signature of its
+content, so repeated scatters onto an unchanged mesh skip extraction.
+"""
+import collections
+import hashlib
+import logging
+
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+DEFAULT_CACHE_BYTES = 512 * 1024 * 1024
+
+WORLD_UP = np.array([0.0, 1.0, 0.0])
+UPRIGHT_REFERENCE = np.array([-1.0, 0.0, 0.0])
+PARALLEL_TOLERANCE = 1e-8
+
+
+class MeshData(object):
+    """Vertex positions, face-vertex topology and normals of a mesh.
+
+    Args:
+        points: (N, 3) world space vertex positions.
+        face_counts: Number of vertices of each face.
+        face_indices: Flattened vertex indices of every face.
+        normals: Optional (N, 3) vertex normals. When omitted they are
+            computed from the topology on first access.
+    """
+
+    def __init__(self, points, face_counts, face_indices, normals=None):
+        self.points = np.ascontiguousarray(points,
+                                           dtype=np.float64).reshape(-1, 3)
+        self.face_counts = np.ascontiguousarray(face_counts, dtype=np.int64)
+        self.face_indices = np.ascontiguousarray(face_indices,
+                                                 dtype=np.int64)
+        if normals is not None:
+            normals = np.ascontiguousarray(normals,
+                                           dtype=np.float64).reshape(-1, 3)
+        self._normals = normals
+        self._derived = {}
+
+    @property
+    def normals(self):
+        if self._normals is None:
+            self._normals = vertex_normals(self.points, self.face_counts,
+                                           self.face_indices)
+        return self._normals
+
+    @property
+    def vertex_count(self):
+        return len(self.points)
+
+    @property
+    def face_count(self):
+        return len(self.face_counts)
+
+    @property
+    def nbytes(self):
+        """Memory held by the arrays of the mesh, including cached normals."""
+        size = self.points.nbytes + self.face_counts.nbytes + \
+            self.face_indices.nbytes
+        if self._normals is not None:
+            size += self._normals.nbytes
+        for value in self._derived.values():
+            size += getattr(value, 'nbytes', 0)
+        return size
+
+    def derived(self, key, build):
+        """Return data derived from the mesh, building it on first use.
+
+        Derived data lives as long as the mesh does, so it shares the mesh's
+        entry in the geometry cache and goes stale with it.
+
+        Args:
+            key: Hashable key of the derived data.
+            build: Called without arguments to build the data on a miss.
+        """
+        value = self._derived.get(key)
+        if value is None:
+            value = build()
+            self._derived[key] = value
+        return value
+
+
+class MeshSource(object):
+    """Base class for objects that fetch a mesh as MeshData."""
+
+    def __init__(self, mesh):
+        self.mesh = mesh
+
+    def fetch(self):
+        """Return the geometry of the mesh.
+
+        Returns:
+            MeshData: The positions, topology and normals of the mesh.
+        """
+        raise NotImplementedError
+
+    def signature(self):
+        """Return a cheap hash that changes when the mesh content changes.
+
+        It must be much cheaper than fetch, since it is computed on every
+        cache lookup.
+        """
+        raise NotImplementedError
+
+
+class MayaMeshSource(MeshSource):
+    """Fetch a mesh from the Maya scene in bulk."""
+
+    def fetch(self):
+        import maya.cmds as cmds
+        points = cmds.xform(self.mesh + '.vtx[*]', query=True,
+                            worldSpace=True, translation=True)
+        face_counts, face_indices = maya_mesh_fn(self.mesh).getVertices()
+        return MeshData(points, list(face_counts), list(face_indices))
+
+    def signature(self):
+        """Hash the topology counts, world matrix, bounds and surface area.
+
+        These are all computed inside Maya without touching individual
+        vertices from Python. An edit that keeps every one of them the same,
+        such as sliding a vertex within its plane, is not detected; use
+        GeometryCache.invalidate for those.
+        """
+        import maya.cmds as cmds
+        content = (cmds.polyEvaluate(self.mesh, vertex=True),
+                   cmds.polyEvaluate(self.mesh, face=True),
+                   cmds.polyEvaluate(self.mesh, edge=True),
+                   cmds.polyEvaluate(self.mesh, worldArea=True),
+                   cmds.exactWorldBoundingBox(self.mesh),
+                   cmds.xform(self.mesh, query=True, worldSpace=True,
+                              matrix=True))
+        return hashlib.sha1(repr(content).encode('utf-8')).hexdigest()
+
+
+def maya_mesh_fn(mesh):
+    """Return an OpenMaya 2.0 MFnMesh of the shape under mesh."""
+    import maya.api.OpenMaya as om
+    selection = om.MSelectionList()
+    selection.add(mesh)
+    dag_path = selection.getDagPath(0)
+    dag_path.extendToShape()
+    return om.MFnMesh(dag_path)
+
+
+class GeometryCache(object):
+    """Least recently used cache of MeshData with a memory cap.
+
+    Entries are keyed on the mesh name and the signature of its source, so an
+    edited mesh misses the cache and its stale entry ages out.
+
+    Args:
+        max_bytes (int): Memory the cached arrays may hold before the least
+            recently used entries are evicted.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def nbytes(self):
+        return sum(mesh.nbytes for mesh in self._entries.values())
+
+    def fetch(self, source):
+        """Return the MeshData of source, extracting it only on a miss."""
+        key = (source.mesh, source.signature())
+        mesh = self._entries.get(key)
+        if mesh is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return mesh
+        self.misses += 1
+        mesh = source.fetch()
+        self._entries[key] = mesh
+        self.evict()
+        return mesh
+
+    def evict(self):
+        """Drop least recently used entries until under max_bytes.
+
+        The most recent entry is always kept, even if it alone is larger.
+        """
+        while len(self._entries) > 1 and self.nbytes > self.max_bytes:
+            key, _ = self._entries.popitem(last=False)
+            log.debug("Evicted cached geometry of %s", key[0])
+
+    def invalidate(self, mesh=None):
+        """Forget the cached geometry of one mesh, or of every mesh."""
+        for key in list(self._entries):
+            if mesh is None or key[0] == mesh:
+                del self._entries[key]
+
+
+GEOMETRY_CACHE = GeometryCache()
+
+
+def face_normals(points, face_counts, face_indices):
+    """Return the unit normal of every face using Newell's method.
+
+    Returns:
+        numpy.ndarray: (F, 3) face normals.
+    """
+    face_count = len(face_counts)
+    face_ids = np.repeat(np.arange(face_count), face_counts)
+    offsets = np.cumsum(face_counts) - face_counts
+    local = np.arange(len(face_indices)) - offsets[face_ids]
+    following = offsets[face_ids] + (local + 1) % face_counts[face_ids]
+    current_points = points[face_indices]
+    following_points = points[face_indices[following]]
+    terms = (current_points - following_points)[:, [1, 2, 0]] * \
+        (current_points + following_points)[:, [2, 0, 1]]
+    normals = np.empty((face_count, 3))
+    for axis in range(3):
+        normals[:, axis] = np.bincount(face_ids, weights=terms[:, axis],
+                                       minlength=face_count)
+    return _normalized(normals)
+
+
+def vertex_normals(points, face_counts, face_indices):
+    """Return every vertex normal as the average of its adjacent faces.
+
+    This is the vectorized equivalent of averaging the normals of the faces
+    around each vertex one vertex at a time.
+
+    Returns:
+        numpy.ndarray: (N, 3) vertex normals.
+    """
+    per_face = face_normals(points, face_counts, face_indices)
+    face_ids = np.repeat(np.arange(len(face_counts)), face_counts)
+    normals = np.empty((len(points), 3))
+    for axis in range(3):
+        normals[:, axis] = np.bincount(face_indices,
+                                       weights=per_face[face_ids, axis],
+                                       minlength=len(points))
+    return _normalized(normals)
+
+
+def normal_frames(normals):
+    """Return the rows of a normal aligned frame for every normal.
+
+    Each frame holds a tangent, the normal and a second tangent, with the
+    first tangent built from the cross product of the normal and world Y.
+    Normals parallel to world Y use world -X instead, which gives an upright
+    normal the identity frame.
+
+    Returns:
+        numpy.ndarray: (N, 3, 3) frames, the normal in the middle row.
+    """
+    normals = np.asarray(normals, dtype=np.float64).reshape(-1, 3)
+    tangents = np.cross(normals, WORLD_UP)
+    parallel = np.einsum('ij,ij->i', tangents, tangents) < \
+        PARALLEL_TOLERANCE
+    tangents[parallel] = np.cross(normals[parallel], UPRIGHT_REFERENCE)
+    tangents = _normalized(tangents)
+    tangents2 = _normalized(np.cross(normals, tangents))
+    return np.stack([tangents2, normals, tangents], axis=1)
+
+
+def _normalized(vectors):
+    lengths = np.sqrt(np.einsum('ij,ij->i', vectors, vectors))
+    lengths[lengths == 0.0] = 1.0
+    return vectors / lengths[:, None]
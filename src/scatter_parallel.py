@@ -0,0 +1,221 @@
+"""Seeded, chunked generation of scatter layouts.
+
+Every scatter is driven by a single integer seed. Points are split into chunks
+of a fixed size and every chunk draws from its own random stream, derived
+from the seed, the stage and the chunk index. Because the chunk boundaries and
+streams never depend on how many workers there are, the chunks can be run in a
+process pool and the result is bit-identical to a serial run.
+"""
+import collections
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import profiling
+import scatter_engine
+import scatter_mesh
+import scatter_sampling
+
+CHUNK_SIZE = 8192
+STREAM_SAMPLING = 0
+STREAM_TRANSFORMS = 1
+STREAM_SOURCES = 2
+STREAM_OVERLAP = 3
+JOB_SURFACE = 'surface'
+JOB_VERTICES = 'vertices'
+JOB_POINTS = 'points'
+
+_worker_mesh = None
+_worker_density = None
+
+
+def chunk_rng(seed, stream, chunk_index):
+    """Return the independent random generator of one chunk."""
+    return np.random.default_rng(
+        np.random.SeedSequence(seed, spawn_key=(stream, chunk_index)))
+
+
+def chunk_ranges(count, chunk_size=CHUNK_SIZE):
+    """Return the (start, stop) bounds of every chunk of count items."""
+    return [(start, min(start + chunk_size, count))
+            for start in range(0, count, chunk_size)]
+
+
+def iter_chunks(function, jobs, workers=1, initializer=None, initargs=()):
+    """Run function over every job and yield the results in job order.
+
+    Jobs are consumed lazily. With more than one worker they run in a process
+    pool with at most one job per worker in flight, otherwise they run one at
+    a time in this process, so only a bounded number of results are ever held.
+    """
+    if workers <= 1:
+        if initializer is not None:
+            initializer(*initargs)
+        for job in jobs:
+            yield function(job)
+        return
+    with ProcessPoolExecutor(max_workers=workers,
+                             mp_context=_spawn_context(),
+                             initializer=initializer,
+                             initargs=initargs) as pool:
+        pending = collections.deque()
+        for job in jobs:
+            pending.append(pool.submit(function, job))
+            if len(pending) >= workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def _spawn_context():
+    """Return a spawn context that launches mayapy rather than the GUI.
+
+    Inside the Maya GUI sys.executable is maya.bin, maya.exe or Maya, and
+    mayapy sits next to it in the same bin folder on every platform.
+    """
+    context = multiprocessing.get_context('spawn')
+    executable_dir, executable = os.path.split(sys.executable)
+    if executable.lower().startswith('maya') and \
+            not executable.lower().startswith('mayapy'):
+        mayapy = os.path.join(executable_dir, 'mayapy')
+        if sys.platform == 'win32':
+            mayapy += '.exe'
+        context.set_executable(mayapy)
+    return context
+
+
+def _set_worker_mesh(mesh, density=None):
+    global _worker_mesh, _worker_density
+    _worker_mesh = mesh
+    _worker_density = density
+
+
+def iter_layout(mesh, settings, seed, workers=1, chunk_size=CHUNK_SIZE,
+                profiler=profiling.DISABLED, density=None):
+    """Sample the mesh and build the instance transforms chunk by chunk.
+
+    Vertex sampling picks every vertex index up front and spaced surface
+    sampling places every point up front, since each point depends on the
+    ones before it; the transforms of those points are still built a chunk
+    at a time. Unconstrained surface sampling is done entirely per chunk.
+
+    Args:
+        mesh (MeshData): Geometry of the object to scatter to.
+        settings (LayoutSettings): Where and how to place the instances.
+        seed (int): Seed of the scatter.
+        workers (int): Number of processes to spread the chunks over.
+        chunk_size (int): Number of instances per chunk.
+        profiler (Profiler): Collects the up front stage timings.
+            When enabled each chunk also profiles itself and returns its
+            profile in the stats of its transforms.
+        density: Optional table from scatter_density.density_table for the
+            sampling of settings, weighting where the instances land.
+
+    Yields:
+        ScatterTransforms: The transforms of each chunk, in order.
+    """
+    # Vertex normals and the surface triangles are computed once here,
+    # rather than once per worker or per chunk, and travel with the mesh.
+    if settings.align and settings.sampling != scatter_engine.SAMPLE_SURFACE:
+        with profiler.span('normals'):
+            mesh.normals
+    if settings.sampling == scatter_engine.SAMPLE_SURFACE:
+        with profiler.span('triangulate'):
+            scatter_sampling.surface_triangles(mesh)
+    return iter_chunks(_layout_chunk,
+                       _layout_jobs(mesh, settings, seed, chunk_size,
+                                    profiler, density),
+                       workers, initializer=_set_worker_mesh,
+                       initargs=(mesh, density))
+
+
+def _layout_jobs(mesh, settings, seed, chunk_size, profiler, density):
+    """Yield one job per chunk holding only that chunk's slice of points."""
+    profile = profiler.enabled
+    if settings.sampling == scatter_engine.SAMPLE_SURFACE:
+        if settings.min_distance <= 0.0:
+            for index, (start, stop) in enumerate(
+                    chunk_ranges(settings.count, chunk_size)):
+                yield (JOB_SURFACE, stop - start, settings, seed, index,
+                       profile)
+            return
+        with profiler.span('sample'):
+            positions, normals = scatter_sampling.sample_surface(
+                mesh, settings.count, min_distance=settings.min_distance,
+                with_normals=settings.align,
+                rng=chunk_rng(seed, STREAM_SAMPLING, 0), table=density)
+        for index, (start, stop) in enumerate(
+                chunk_ranges(len(positions), chunk_size)):
+            chunk_normals = None
+            if normals is not None:
+                chunk_normals = normals[start:stop]
+            yield (JOB_POINTS, (positions[start:stop], chunk_normals),
+                   settings, seed, index, profile)
+        return
+    with profiler.span('sample'):
+        indices = sample_vertices(mesh, settings.count, seed,
+                                  weights=density)
+    for index, (start, stop) in enumerate(
+            chunk_ranges(len(indices), chunk_size)):
+        yield (JOB_VERTICES, indices[start:stop], settings, seed, index,
+               profile)
+
+
+def _layout_chunk(job):
+    kind, payload, settings, seed, chunk_index, profile = job
+    profiler = profiling.Profiler(enabled=profile)
+    normals = None
+    with profiler.span('sample'):
+        if kind == JOB_SURFACE:
+            positions, normals = scatter_sampling.sample_surface(
+                _worker_mesh, payload, with_normals=settings.align,
+                rng=chunk_rng(seed, STREAM_SAMPLING, chunk_index),
+                table=_worker_density)
+        elif kind == JOB_VERTICES:
+            positions = _worker_mesh.points[payload]
+            if settings.align:
+                normals = _worker_mesh.normals[payload]
+        else:
+            positions, normals = payload
+    frames = None
+    if settings.align and normals is not None:
+        with profiler.span('normals'):
+            frames = scatter_mesh.normal_frames(normals)
+    with profiler.span('transforms'):
+        transforms = scatter_engine.compute_transforms(
+            positions, settings.min_rotation, settings.max_rotation,
+            settings.min_scale, settings.max_scale, frames=frames,
+            rng=chunk_rng(seed, STREAM_TRANSFORMS, chunk_index))
+    if profile:
+        transforms.stats = profiler.as_dict()
+    return transforms
+
+
+def sample_vertices(mesh, count, seed, weights=None):
+    """Pick count distinct vertices of the mesh.
+
+    Args:
+        mesh (MeshData): The mesh to sample.
+        count (int): Number of vertices to pick.
+        seed (int): Seed of the scatter.
+        weights: Optional weight of every vertex. Vertices are then picked
+            in one pass with Efraimidis-Spirakis keys, and vertices of zero
+            weight are never picked.
+
+    Returns:
+        numpy.ndarray: The indices of the picked vertices.
+    """
+    rng = chunk_rng(seed, STREAM_SAMPLING, 0)
+    if weights is None:
+        return rng.choice(mesh.vertex_count,
+                          size=min(count, mesh.vertex_count), replace=False)
+    count = min(count, int(np.count_nonzero(weights > 0.0)))
+    if count <= 0:
+        return np.zeros(0, dtype=np.int64)
+    with np.errstate(divide='ignore'):
+        keys = np.log(rng.random(mesh.vertex_count)) / weights
+    picked = np.argpartition(-keys, count - 1)[:count]
+    return picked[np.argsort(-keys[picked], kind='stable')]
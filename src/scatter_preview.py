@@ -0,0 +1,162 @@
+"""Live, incremental preview of a scatter.
+
+The preview caches the sampled points and the raw random draws of every
+channel. Changing a rotation range only rewrites the rotations and changing a
+scale range only rewrites the scales; only the count, sampling, seed, density
+map or target mesh trigger a resample. The preview is drawn with a single
+particle instancer, so a rewrite is one array write no matter how many
+instances there are, and it matches the final scatter made with the same seed.
+"""
+import numpy as np
+
+import scatter_engine
+import scatter_parallel
+
+CHANNEL_SAMPLES = 'samples'
+CHANNEL_ROTATION = 'rotation'
+CHANNEL_SCALE = 'scale'
+
+
+class ScatterPreview(object):
+    """Cached draws of a scatter and the instancer that displays them."""
+
+    def __init__(self, cmds, name='scatterPreview'):
+        self.cmds = cmds
+        self.name = name
+        self.nodes = []
+        self._sample_key = None
+        self._mesh = None
+        self._density = None
+        self._rotation_key = None
+        self._scale_key = None
+        self.positions = None
+        self.frames = None
+        self.rotation_draws = None
+        self.scale_draws = None
+
+    def update(self, object_to_instance, target, mesh, settings, seed,
+               workers=1, density=None):
+        """Bring the preview in line with settings, redoing only what changed.
+
+        Preview edits are kept out of the undo queue so dragging a slider
+        does not flush the artist's undo history.
+
+        Args:
+            object_to_instance: Transform to instance.
+            target: Name of the object scattered to.
+            mesh (MeshData): Geometry of the target.
+            settings (LayoutSettings): Where and how to place the instances.
+            seed (int): Seed of the scatter.
+            workers (int): Number of processes used to resample.
+            density: Optional density map table, see
+                scatter_density.density_table.
+
+        Returns:
+            set: The channels that were rewritten.
+        """
+        sample_key = (object_to_instance, target, settings.count,
+                      settings.sampling, settings.min_distance, seed)
+        rotation_key = (settings.min_rotation, settings.max_rotation,
+                        settings.align)
+        scale_key = (settings.min_scale, settings.max_scale)
+        undo_state = self.cmds.undoInfo(query=True, state=True)
+        self.cmds.undoInfo(stateWithoutFlush=False)
+        try:
+            changed = self._update(object_to_instance, mesh, settings, seed,
+                                   workers, density, sample_key,
+                                   rotation_key, scale_key)
+        finally:
+            self.cmds.undoInfo(stateWithoutFlush=undo_state)
+        self._sample_key = sample_key
+        self._mesh = mesh
+        self._density = density
+        self._rotation_key = rotation_key
+        self._scale_key = scale_key
+        return changed
+
+    def _update(self, object_to_instance, mesh, settings, seed, workers,
+                density, sample_key, rotation_key, scale_key):
+        if sample_key != self._sample_key or mesh is not self._mesh or \
+                density is not self._density or not self._exists():
+            self._resample(mesh, settings, seed, workers, density)
+            self._rebuild(object_to_instance, settings)
+            changed = set([CHANNEL_SAMPLES, CHANNEL_ROTATION, CHANNEL_SCALE])
+        else:
+            changed = set()
+            if rotation_key != self._rotation_key:
+                self._write_rotations(settings)
+                changed.add(CHANNEL_ROTATION)
+            if scale_key != self._scale_key:
+                self._write_scales(settings)
+                changed.add(CHANNEL_SCALE)
+            if changed and self.nodes:
+                self.cmds.saveInitialState(self.nodes[1])
+        return changed
+
+    def clear(self):
+        """Delete the preview nodes and forget the cached draws."""
+        if self._exists():
+            self.cmds.delete([self.nodes[0], self.nodes[2]])
+        self.nodes = []
+        self._sample_key = None
+        self._mesh = None
+        self._density = None
+
+    def _exists(self):
+        return bool(self.nodes) and self.cmds.objExists(self.nodes[0])
+
+    def _resample(self, mesh, settings, seed, workers, density):
+        """Cache the points and the unit draws of every channel.
+
+        Running the layout with unit ranges makes the rotations and scales
+        equal to the raw draws, which are mapped onto the real ranges later
+        with the same arithmetic as the final scatter.
+        """
+        unit_settings = scatter_engine.LayoutSettings(
+            settings.count, sampling=settings.sampling,
+            min_distance=settings.min_distance, align=True,
+            min_rotation=(0.0, 0.0, 0.0), max_rotation=(1.0, 1.0, 1.0),
+            min_scale=0.0, max_scale=1.0)
+        draws = scatter_engine.concatenate_transforms(
+            scatter_parallel.iter_layout(mesh, unit_settings, seed,
+                                         workers=workers, density=density))
+        self.positions = draws.positions
+        self.frames = draws.frames
+        self.rotation_draws = draws.rotations
+        self.scale_draws = draws.scales
+
+    def transforms(self, settings):
+        """Return the cached draws mapped onto the ranges of settings."""
+        min_rotation = np.asarray(settings.min_rotation, dtype=np.float64)
+        max_rotation = np.asarray(settings.max_rotation, dtype=np.float64)
+        rotations = min_rotation + \
+            (max_rotation - min_rotation) * self.rotation_draws
+        scales = settings.min_scale + \
+            (settings.max_scale - settings.min_scale) * self.scale_draws
+        frames = self.frames if settings.align else None
+        return scatter_engine.ScatterTransforms(self.positions, rotations,
+                                                scales, frames=frames)
+
+    def _rebuild(self, object_to_instance, settings):
+        self.clear()
+        if self.positions is None or not len(self.positions):
+            return
+        self.nodes = scatter_engine.apply_instancer(
+            self.cmds, object_to_instance, self.transforms(settings),
+            name=self.name)
+
+    def _write_rotations(self, settings):
+        if not self.nodes:
+            return
+        rotations = self.transforms(settings).euler_rotations().tolist()
+        self.cmds.setAttr(self.nodes[1] + '.rotationPP',
+                          [tuple(rotation) for rotation in rotations],
+                          type='vectorArray')
+
+    def _write_scales(self, settings):
+        if not self.nodes:
+            return
+        scales = self.transforms(settings).scales.tolist()
+        self.cmds.setAttr(self.nodes[1] + '.scalePP',
+                          [(scale, scale, scale) for scale in scales],
+                          type='vectorArray')
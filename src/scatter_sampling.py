@@ -0,0 +1,358 @@
+"""Sampling strategies for the scatter tool.
+
+Surface sampling places points on the triangles of a mesh with probability
+proportional to triangle area, so the result does not depend on how dense the
+topology is. An optional minimum distance gives blue-noise spacing; candidates
+are checked against a uniform spatial hash grid so each rejection test only
+looks at the neighbouring cells.
+"""
+import numpy as np
+
+CANDIDATE_BATCH_SIZE = 4096
+MAX_CANDIDATES_PER_POINT = 30
+MAX_OVERLAP_RETRIES = 8
+
+
+class SpatialHashGrid(object):
+    """Uniform grid of points hashed by integer cell coordinates.
+
+    With the cell size equal to the minimum distance, any point closer than
+    that distance lies in one of the 27 cells around the query, so each test
+    is constant time regardless of how many points are stored.
+    """
+
+    def __init__(self, cell_size):
+        self.cell_size = float(cell_size)
+        self.cells = {}
+
+    def _cell(self, point):
+        return (int(np.floor(point[0] / self.cell_size)),
+                int(np.floor(point[1] / self.cell_size)),
+                int(np.floor(point[2] / self.cell_size)))
+
+    def insert(self, point):
+        self.cells.setdefault(self._cell(point), []).append(point)
+
+    def has_neighbour(self, point, radius):
+        """Return True if a stored point lies closer than radius."""
+        radius_squared = radius * radius
+        cell_x, cell_y, cell_z = self._cell(point)
+        for offset_x in (-1, 0, 1):
+            for offset_y in (-1, 0, 1):
+                for offset_z in (-1, 0, 1):
+                    neighbours = self.cells.get((cell_x + offset_x,
+                                                 cell_y + offset_y,
+                                                 cell_z + offset_z))
+                    if not neighbours:
+                        continue
+                    for other in neighbours:
+                        delta_x = point[0] - other[0]
+                        delta_y = point[1] - other[1]
+                        delta_z = point[2] - other[2]
+                        if delta_x * delta_x + delta_y * delta_y + \
+                                delta_z * delta_z < radius_squared:
+                            return True
+        return False
+
+
+class SphereHashGrid(SpatialHashGrid):
+    """Spatial hash of spheres of varying radius.
+
+    With the cell size at least the largest diameter stored or queried, two
+    overlapping spheres are always in neighbouring cells.
+    """
+
+    def insert(self, centre, radius):
+        self.cells.setdefault(self._cell(centre), []).append(
+            (centre[0], centre[1], centre[2], radius))
+
+    def overlaps(self, centre, radius):
+        """Return True if the sphere overlaps a stored sphere."""
+        cell_x, cell_y, cell_z = self._cell(centre)
+        for offset_x in (-1, 0, 1):
+            for offset_y in (-1, 0, 1):
+                for offset_z in (-1, 0, 1):
+                    neighbours = self.cells.get((cell_x + offset_x,
+                                                 cell_y + offset_y,
+                                                 cell_z + offset_z))
+                    if not neighbours:
+                        continue
+                    for other in neighbours:
+                        delta_x = centre[0] - other[0]
+                        delta_y = centre[1] - other[1]
+                        delta_z = centre[2] - other[2]
+                        reach = radius + other[3]
+                        if delta_x * delta_x + delta_y * delta_y + \
+                                delta_z * delta_z < reach * reach:
+                            return True
+        return False
+
+
+class OverlapFilter(object):
+    """Drops instances whose scaled bounding spheres overlap earlier ones.
+
+    Instances are kept first come, first served, and the spheres of every
+    kept instance stay in the grid, so chunks can be filtered one after the
+    other. An overlapping instance redraws a smaller scale up to max_retries
+    times before it is dropped.
+
+    Args:
+        radius (float): Bounding radius of the instanced object at scale 1.
+        min_scale (float): Smallest scale a retry may draw.
+        max_scale (float): Largest scale of any instance.
+        max_retries (int): Scale redraws allowed per instance.
+    """
+
+    def __init__(self, radius, min_scale, max_scale,
+                 max_retries=MAX_OVERLAP_RETRIES):
+        self.radius = float(radius)
+        self.min_scale = min(min_scale, max_scale)
+        self.max_retries = max_retries
+        largest = self.radius * max(abs(min_scale), abs(max_scale))
+        self.grid = SphereHashGrid(max(2.0 * largest, 1e-6))
+        self.rejected = 0
+
+    def filter(self, transforms, rng):
+        """Return the transforms that do not overlap, with retried scales.
+
+        Args:
+            transforms (ScatterTransforms): Candidate instances.
+            rng: numpy Generator used for the scale redraws.
+        """
+        scales = transforms.scales.copy()
+        keep = np.zeros(len(transforms), dtype=bool)
+        positions = transforms.positions.tolist()
+        for index, scale in enumerate(scales.tolist()):
+            centre = positions[index]
+            radius = self.radius * abs(scale)
+            overlapping = self.grid.overlaps(centre, radius)
+            retries = 0
+            while overlapping and retries < self.max_retries and \
+                    scale > self.min_scale:
+                retries += 1
+                scale = rng.uniform(self.min_scale, scale)
+                radius = self.radius * abs(scale)
+                overlapping = self.grid.overlaps(centre, radius)
+            if overlapping:
+                continue
+            self.grid.insert(centre, radius)
+            scales[index] = scale
+            keep[index] = True
+        self.rejected += len(keep) - int(keep.sum())
+        kept = transforms.subset(keep)
+        kept.scales = scales[keep]
+        return kept
+
+
+class AliasTable(object):
+    """Walker's alias table for O(1) draws from a discrete distribution.
+
+    Building the table is O(N) in the number of weights; every draw after
+    that costs one uniform integer and one uniform float.
+
+    Weights that are all zero give an empty table, which nothing can be
+    drawn from.
+
+    Args:
+        weights: Non-negative weight of each outcome.
+    """
+
+    def __init__(self, weights):
+        weights = np.asarray(weights, dtype=np.float64).ravel()
+        total = weights.sum()
+        if len(weights) == 0 or total <= 0.0:
+            self.probability = np.zeros(0)
+            self.alias = np.zeros(0, dtype=np.int64)
+            return
+        count = len(weights)
+        scaled = (weights * (count / total)).tolist()
+        probability = [1.0] * count
+        alias = list(range(count))
+        small = [index for index, value in enumerate(scaled) if value < 1.0]
+        large = [index for index, value in enumerate(scaled) if value >= 1.0]
+        while small and large:
+            less = small.pop()
+            more = large.pop()
+            probability[less] = scaled[less]
+            alias[less] = more
+            scaled[more] = scaled[more] + scaled[less] - 1.0
+            if scaled[more] < 1.0:
+                small.append(more)
+            else:
+                large.append(more)
+        self.probability = np.array(probability)
+        self.alias = np.array(alias, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.probability)
+
+    @property
+    def nbytes(self):
+        return self.probability.nbytes + self.alias.nbytes
+
+    def sample(self, rng, count):
+        """Draw count outcome indices.
+
+        Returns:
+            numpy.ndarray: The drawn indices.
+        """
+        columns = rng.integers(0, len(self.probability), size=count)
+        keep = rng.random(count) < self.probability[columns]
+        return np.where(keep, columns, self.alias[columns])
+
+
+def triangulate(face_counts, face_indices):
+    """Fan triangulate polygons into an (T, 3) array of vertex indices."""
+    face_counts = np.asarray(face_counts, dtype=np.int64)
+    face_indices = np.asarray(face_indices, dtype=np.int64)
+    offsets = np.cumsum(face_counts) - face_counts
+    triangle_counts = np.maximum(face_counts - 2, 0)
+    face_ids = np.repeat(np.arange(len(face_counts)), triangle_counts)
+    corners = np.arange(triangle_counts.sum()) - \
+        np.repeat(np.cumsum(triangle_counts) - triangle_counts,
+                  triangle_counts)
+    starts = offsets[face_ids]
+    return np.stack([face_indices[starts],
+                     face_indices[starts + corners + 1],
+                     face_indices[starts + corners + 2]], axis=1)
+
+
+def triangle_areas(points, triangles):
+    """Return the area of every triangle."""
+    edges_a = points[triangles[:, 1]] - points[triangles[:, 0]]
+    edges_b = points[triangles[:, 2]] - points[triangles[:, 0]]
+    crossed = np.cross(edges_a, edges_b)
+    return 0.5 * np.sqrt(np.einsum('ij,ij->i', crossed, crossed))
+
+
+def triangle_faces(face_counts):
+    """Return the index of the face every fan triangle belongs to."""
+    face_counts = np.asarray(face_counts, dtype=np.int64)
+    return np.repeat(np.arange(len(face_counts)),
+                     np.maximum(face_counts - 2, 0))
+
+
+class SurfaceTriangles(object):
+    """Fan triangles of a mesh, their areas and the running total."""
+
+    def __init__(self, triangles, areas):
+        self.triangles = triangles
+        self.areas = areas
+        self.cumulative_areas = np.cumsum(areas)
+
+    @property
+    def total_area(self):
+        if not len(self.cumulative_areas):
+            return 0.0
+        return self.cumulative_areas[-1]
+
+    @property
+    def nbytes(self):
+        return self.triangles.nbytes + self.areas.nbytes + \
+            self.cumulative_areas.nbytes
+
+
+def surface_triangles(mesh):
+    """Return the SurfaceTriangles of a mesh, cached on the mesh.
+
+    Triangulating and measuring is O(F), so it is done once per mesh rather
+    than once per sampled chunk.
+    """
+    def build():
+        triangles = triangulate(mesh.face_counts, mesh.face_indices)
+        return SurfaceTriangles(triangles,
+                                triangle_areas(mesh.points, triangles))
+    return mesh.derived('surface_triangles', build)
+
+
+def sample_surface(mesh, count, min_distance=0.0, with_normals=False,
+                   rng=None, table=None):
+    """Sample points on the surface of a mesh weighted by triangle area.
+
+    Args:
+        mesh (MeshData): The mesh to sample.
+        count (int): Number of points to place.
+        min_distance (float): Minimum spacing between points. Zero disables
+            the blue-noise constraint. When the surface is too small to fit
+            count points at that spacing fewer points are returned.
+        with_normals (bool): Also return interpolated vertex normals.
+        rng: Optional numpy Generator used for the random draws.
+        table (AliasTable): Optional weight of every fan triangle, used in
+            place of the triangle areas, e.g. from a density map. No points
+            are placed when the table is empty.
+
+    Returns:
+        tuple: (N, 3) positions and (N, 3) normals, or None for the normals
+            when with_normals is False.
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    surface = surface_triangles(mesh)
+    triangles = surface.triangles
+    if table is None:
+        cumulative_areas = surface.cumulative_areas
+        if surface.total_area <= 0.0:
+            count = 0
+
+        def pick(size):
+            picked = np.searchsorted(
+                cumulative_areas, rng.random(size) * surface.total_area,
+                side='right')
+            return np.minimum(picked, len(cumulative_areas) - 1)
+    else:
+        if not len(table):
+            count = 0
+
+        def pick(size):
+            return table.sample(rng, size)
+    if count <= 0:
+        empty = np.zeros((0, 3))
+        return empty, (empty if with_normals else None)
+    if min_distance <= 0.0:
+        triangle_ids, weights = _draw(rng, pick, count)
+        return _interpolate(mesh, triangles, triangle_ids, weights,
+                            with_normals)
+    grid = SpatialHashGrid(min_distance)
+    accepted_ids = []
+    accepted_weights = []
+    remaining_candidates = count * MAX_CANDIDATES_PER_POINT
+    while len(accepted_ids) < count and remaining_candidates > 0:
+        batch_size = min(CANDIDATE_BATCH_SIZE, remaining_candidates)
+        remaining_candidates -= batch_size
+        triangle_ids, weights = _draw(rng, pick, batch_size)
+        candidates, _ = _interpolate(mesh, triangles, triangle_ids, weights,
+                                     False)
+        for index, candidate in enumerate(candidates.tolist()):
+            if grid.has_neighbour(candidate, min_distance):
+                continue
+            grid.insert(candidate)
+            accepted_ids.append(triangle_ids[index])
+            accepted_weights.append(weights[index])
+            if len(accepted_ids) == count:
+                break
+    return _interpolate(mesh, triangles,
+                        np.asarray(accepted_ids, dtype=np.int64),
+                        np.asarray(accepted_weights).reshape(-1, 3),
+                        with_normals)
+
+
+def _draw(rng, pick, count):
+    """Pick weighted triangles and uniform barycentric weights."""
+    triangle_ids = pick(count)
+    root = np.sqrt(rng.random(count))
+    second = rng.random(count)
+    weights = np.stack([1.0 - root, root * (1.0 - second), root * second],
+                       axis=1)
+    return triangle_ids, weights
+
+
+def _interpolate(mesh, triangles, triangle_ids, weights, with_normals):
+    corners = triangles[triangle_ids]
+    positions = np.einsum('ij,ijk->ik', weights, mesh.points[corners])
+    normals = None
+    if with_normals:
+        normals = np.einsum('ij,ijk->ik', weights, mesh.normals[corners])
+        lengths = np.sqrt(np.einsum('ij,ij->i', normals, normals))
+        lengths[lengths == 0.0] = 1.0
+        normals /= lengths[:, None]
+    return positions, normals
@@ -0,0 +1,290 @@
+"""Scattering logic of the scatter tool, usable without its UI.
+
+ScatterTool depends on maya.cmds and the scatter_* modules only, so batch
+jobs and scripts can import and run it without loading PySide2. The dialog
+lives in scatter.py.
+"""
+import logging
+import random as rand
+
+import maya.cmds as cmds
+
+import profiling
+import scatter_density
+import scatter_engine
+import scatter_jobs
+import scatter_layout
+import scatter_mesh
+import scatter_parallel
+import scatter_sampling
+from scatter_engine import (OUTPUT_INSTANCER, OUTPUT_TRANSFORMS,
+                            SAMPLE_VERTICES)
+
+log = logging.getLogger(__name__)
+
+
+class ScatterTool(object):
+
+    source_factory = scatter_mesh.MayaMeshSource
+
+    def __init__(self):
+        self.selection = cmds.ls(os=True, fl=True)
+        self.max_rotate_z = 0
+        self.min_rotate_z = 0
+        self.max_rotate_y = 0
+        self.min_rotate_y = 0
+        self.max_rotate_x = 0
+        self.min_rotate_x = 0
+        self.min_scale = 1.0
+        self.max_scale = 1.0
+        self.density = 1.0
+        self.align = False
+        self.undo = False
+        self.replace = False
+        self.job = None
+        self.output_mode = OUTPUT_TRANSFORMS
+        self.sampling = SAMPLE_VERTICES
+        self.min_distance = 0.0
+        self.avoid_overlap = False
+        self.density_map = None
+        self.layout_path = None
+        self.overlap_retries = scatter_sampling.MAX_OVERLAP_RETRIES
+        self.seed = None
+        self.last_seed = None
+        self.workers = 1
+        self.profiler = profiling.Profiler(label='Scatter profile')
+        self.log_profile = False
+        self._scene = cmds
+        self.close = False
+
+    def scatter(self):
+        """Scatter object along the vertices or surface of another object"""
+        for _ in self.iter_scatter():
+            pass
+
+    def iter_scatter(self):
+        """Scatter in batches, yielding progress after each batch is written.
+
+        Sampling, transform generation and scene writes happen one batch at a
+        time. With transform output no more than one batch of intermediate
+        data is held. Instancer output keeps the positions, rotations and
+        scales of every batch, 56 bytes per instance, until the end, where
+        they are written as one instancer, see InstancerBuffer. The whole
+        scatter is a single undo step, even when it is stopped early by
+        closing the generator. The created nodes are recorded in a scatter
+        job, so undo and replace delete exactly the nodes of earlier runs of
+        the same source onto the same target.
+
+        Yields:
+            tuple: Instances written so far and instances requested.
+        """
+        object_to_instance = self.selection[0]
+        self._scene = cmds
+        if self.profiler.enabled:
+            self.profiler.reset()
+            self._scene = profiling.CallCounter(cmds)
+        scene = self._scene
+        if scene.objectType(object_to_instance) != 'transform':
+            print("Please ensure the object you select is a transform")
+            return
+        if self.undo is True:
+            self.delete_previous_jobs()
+            self.close = True
+            return
+        with self.profiler.span('fetch_mesh'):
+            mesh = scatter_mesh.GEOMETRY_CACHE.fetch(
+                self.source_factory(str(self.selection[1])))
+        self.last_seed = self.seed
+        if self.last_seed is None:
+            self.last_seed = rand.randrange(2147483647)
+        log.info("Scattering with seed %d", self.last_seed)
+        with self.profiler.span('density_map'):
+            density = self.density_table(mesh)
+        settings = self.layout_settings(mesh)
+        overlap = self.overlap_filter(object_to_instance)
+        writer = self.layout_writer(object_to_instance, settings)
+        instancers = None
+        if self.output_mode == OUTPUT_INSTANCER:
+            instancers = scatter_engine.InstancerBuffer()
+        written = 0
+        scene.undoInfo(openChunk=True)
+        try:
+            if self.replace is True:
+                self.delete_previous_jobs()
+            self.job = scatter_jobs.ScatterJob.create(
+                scene, object_to_instance, self.selection[1], self.last_seed)
+            for chunk_index, transforms in enumerate(
+                    scatter_parallel.iter_layout(
+                        mesh, settings, self.last_seed,
+                        workers=self.workers, profiler=self.profiler,
+                        density=density)):
+                self.profiler.merge(transforms.stats)
+                if overlap is not None:
+                    with self.profiler.span('reject_overlaps'):
+                        transforms = overlap.filter(
+                            transforms, scatter_parallel.chunk_rng(
+                                self.last_seed,
+                                scatter_parallel.STREAM_OVERLAP,
+                                chunk_index))
+                nodes = self.scatter_logic(object_to_instance, transforms,
+                                           instancers)
+                with self.profiler.span('register_job'):
+                    self.job.add(nodes)
+                if writer is not None:
+                    with self.profiler.span('save_layout'):
+                        writer.write(transforms)
+                written += len(transforms)
+                yield written, settings.count
+        finally:
+            if instancers is not None and len(instancers):
+                for nodes in instancers.flush(
+                        scene, profiler=self.profiler).values():
+                    self.job.add(nodes)
+            scene.undoInfo(closeChunk=True)
+            scene.select(self.selection)
+            if writer is not None:
+                writer.close()
+            if overlap is not None:
+                log.info("Rejected %d overlapping instances",
+                         overlap.rejected)
+                self.profiler.count('overlaps_rejected', overlap.rejected)
+            self._finish_profile(written)
+        self.close = False
+
+    def _finish_profile(self, instances):
+        if not self.profiler.enabled:
+            return
+        self.profiler.count('instances', instances)
+        self.profiler.count('scene_calls', self._scene.total_calls)
+        if self.log_profile:
+            log.info(self.profiler.summary())
+
+    def profile(self):
+        """Return the stage timings and counters of the last profiled run.
+
+        Profiling is off by default; set profiler.enabled to collect it.
+
+        Returns:
+            dict: Timing spans by stage name and counters by name.
+        """
+        return self.profiler.as_dict()
+
+    def delete_previous_jobs(self):
+        """Delete every earlier scatter of the source onto the target.
+
+        Returns:
+            int: The number of scattered nodes deleted.
+        """
+        with self.profiler.span('delete_previous'):
+            jobs = scatter_jobs.find_jobs(self._scene, self.selection[0],
+                                          self.selection[1])
+            return scatter_jobs.delete_jobs(self._scene, jobs)
+
+    def layout_settings(self, mesh):
+        """Return the LayoutSettings of this scatter for the given mesh."""
+        count = scatter_engine.scatter_count(mesh.vertex_count, self.density,
+                                             self.sampling)
+        return scatter_engine.LayoutSettings(
+            count, sampling=self.sampling, min_distance=self.min_distance,
+            align=self.align is True,
+            min_rotation=(self.min_rotate_x, self.min_rotate_y,
+                          self.min_rotate_z),
+            max_rotation=(self.max_rotate_x, self.max_rotate_y,
+                          self.max_rotate_z),
+            min_scale=self.min_scale, max_scale=self.max_scale)
+
+    def layout_writer(self, object_to_instance, settings):
+        """Return a LayoutWriter for layout_path, or None when not saving.
+
+        The file records the seed and parameters next to the instances, so
+        a saved layout documents how it was made.
+        """
+        if not self.layout_path:
+            return None
+        parameters = dict(vars(settings), output_mode=self.output_mode,
+                          avoid_overlap=self.avoid_overlap,
+                          density_map=type(self.density_map).__name__
+                          if self.density_map is not None else None)
+        return scatter_layout.LayoutWriter(
+            self.layout_path, [str(object_to_instance)],
+            {'target': str(self.selection[1]), 'seed': self.last_seed,
+             'parameters': parameters})
+
+    def import_layout(self, path):
+        """Recreate a layout saved with layout_path in the scene.
+
+        Returns:
+            int: The number of instances created.
+        """
+        written = 0
+        for written, _ in self.iter_import_layout(path):
+            pass
+        return written
+
+    def iter_import_layout(self, path):
+        """Recreate a saved layout a batch at a time with the output mode.
+
+        The file is memory mapped and read one batch at a time, so with
+        transform output even a layout of millions of instances is never
+        fully loaded. Instancer output gathers every instance into one
+        instancer, see InstancerBuffer.
+
+        Yields:
+            tuple: Instances written so far and instances in the file.
+        """
+        self._scene = cmds
+        return scatter_layout.iter_apply_layout(
+            self._scene, path, output_mode=self.output_mode,
+            profiler=self.profiler)
+
+    def density_table(self, mesh):
+        """Return the sampling table of the density map, or None.
+
+        The table is cached on the mesh, so it is only rebuilt when the map
+        or the geometry changes.
+        """
+        if self.density_map is None:
+            return None
+        return scatter_density.density_table(mesh, self.density_map,
+                                             self.sampling)
+
+    def overlap_filter(self, object_to_instance):
+        """Return the OverlapFilter of this scatter, or None when disabled.
+
+        The filter runs on the computed transforms of every batch before they
+        are written, so rejected instances never reach the scene.
+        """
+        if not self.avoid_overlap:
+            return None
+        radius = scatter_engine.bounding_radius(self._scene,
+                                                object_to_instance)
+        if radius <= 0.0:
+            return None
+        return scatter_sampling.OverlapFilter(
+            radius, self.min_scale, self.max_scale,
+            max_retries=self.overlap_retries)
+
+    def scatter_logic(self, object_to_instance, transforms, instancers=None):
+        """Write one batch of transforms with the current output mode.
+
+        In instancer mode with an InstancerBuffer the batch is only added to
+        it, and flushing the buffer writes a single instancer for the whole
+        scatter. Without one, the batch gets an instancer of its own.
+
+        Returns:
+            list: The top level nodes created for the batch.
+        """
+        if not len(transforms):
+            return []
+        if self.output_mode == OUTPUT_INSTANCER and instancers is not None:
+            instancers.add(object_to_instance, transforms)
+            return []
+        if self.output_mode == OUTPUT_INSTANCER:
+            particle, _, instancer = scatter_engine.apply_instancer(
+                self._scene, object_to_instance, transforms,
+                profiler=self.profiler)
+            return [particle, instancer]
+        return scatter_engine.apply_transforms(self._scene,
+                                               object_to_instance,
+                                               transforms,
+                                               profiler=self.profiler)
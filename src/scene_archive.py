@@ -0,0 +1,246 @@
+"""Compression and deduplication of superseded scene versions.
+
+An archive pass keeps the newest versions of every scene in a folder as they
+are and replaces each older version with a gzip compressed copy named after
+it with ARCHIVE_SUFFIX, e.g. main_model_v003.ma.gz. The compressed data is
+content addressed: it is stored once per distinct file content in the
+folder's STORE_NAME directory and every archived version with that content
+is a hard link to it, so byte-identical versions cost the space of one.
+
+Archived names still follow the scene naming rules, so they keep their
+version numbers taken. resolve returns a readable path for any version,
+decompressing archived ones into a local restore folder.
+
+Archiving is opt in and runs on a background thread, off the save path:
+
+    python scene_archive.py /project/scenes --keep 5
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import scene_versions
+
+log = logging.getLogger(__name__)
+
+STORE_NAME = '.smartsave_archive'
+DEFAULT_KEEP = 5
+COMPRESS_LEVEL = 6
+READ_SIZE = 1024 * 1024
+STAMP_SUFFIX = '.source.json'
+
+
+class ArchiveStats(object):
+    """What an archive pass did."""
+
+    def __init__(self):
+        self.archived = 0
+        self.deduplicated = 0
+        self.bytes_before = 0
+        self.bytes_after = 0
+
+    def __repr__(self):
+        return ("ArchiveStats(archived={}, deduplicated={}, "
+                "bytes_before={}, bytes_after={})".format(
+                    self.archived, self.deduplicated, self.bytes_before,
+                    self.bytes_after))
+
+
+def content_hash(path):
+    """Return the SHA-256 hex digest of a file, read in blocks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as scene:
+        for block in iter(lambda: scene.read(READ_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def archive_folder(folder, keep=DEFAULT_KEEP):
+    """Archive all but the newest keep versions of every scene in folder.
+
+    Empty files are skipped, since they are versions reserved by a save that
+    has not landed yet.
+
+    Returns:
+        ArchiveStats: Counts of what was archived.
+    """
+    stats = ArchiveStats()
+    # A private index, since passes run off the thread saves are made on.
+    index = scene_versions.VersionIndex(folder)
+    index.refresh(force=True)
+    for (descriptor, task, ext), versions in sorted(index.entries.items()):
+        for ver in versions[:-keep] if keep > 0 else versions:
+            path = os.path.join(folder, scene_versions.format_scene_name(
+                descriptor, task, ver, ext))
+            if os.path.isfile(path) and os.path.getsize(path) > 0:
+                archive_file(path, stats)
+    remove_unused_objects(os.path.join(folder, STORE_NAME))
+    index.refresh(force=True)
+    log.info("Archived %d versions in %s, %d deduplicated, %d -> %d bytes",
+             stats.archived, folder, stats.deduplicated, stats.bytes_before,
+             stats.bytes_after)
+    return stats
+
+
+def archive_file(path, stats=None):
+    """Replace a scene file with a hard link to its compressed content.
+
+    The archived name is in place before the original is removed, so the
+    version is never missing from the folder.
+
+    Returns:
+        str: The path of the archived version.
+    """
+    stats = stats if stats is not None else ArchiveStats()
+    folder = os.path.dirname(path)
+    digest = content_hash(path)
+    store = os.path.join(folder, STORE_NAME, digest[:2])
+    stored = os.path.join(store, digest + scene_versions.ARCHIVE_SUFFIX)
+    if os.path.exists(stored):
+        stats.deduplicated += 1
+    else:
+        if not os.path.isdir(store):
+            os.makedirs(store)
+        partial = "{}.{}.tmp".format(stored, uuid.uuid4().hex)
+        with open(path, 'rb') as scene, \
+                gzip.open(partial, 'wb', COMPRESS_LEVEL) as compressed:
+            shutil.copyfileobj(scene, compressed, READ_SIZE)
+        os.replace(partial, stored)
+        stats.bytes_after += os.path.getsize(stored)
+    archived = path + scene_versions.ARCHIVE_SUFFIX
+    partial = "{}.{}.tmp".format(archived, uuid.uuid4().hex)
+    try:
+        os.link(stored, partial)
+    except OSError:
+        # File systems without hard links get a copy of the compressed data.
+        shutil.copyfile(stored, partial)
+    os.replace(partial, archived)
+    stats.bytes_before += os.path.getsize(path)
+    os.remove(path)
+    stats.archived += 1
+    return archived
+
+
+def remove_unused_objects(store):
+    """Delete stored contents no archived version links to any more."""
+    if not os.path.isdir(store):
+        return
+    for root, _, names in os.walk(store, topdown=False):
+        for name in names:
+            path = os.path.join(root, name)
+            if os.stat(path).st_nlink == 1:
+                os.remove(path)
+        if root != store and not os.listdir(root):
+            os.rmdir(root)
+
+
+def resolve(path, restore_dir=None):
+    """Return a readable path of a scene version, archived or not.
+
+    An archived version is decompressed into its own folder under
+    restore_dir, named after the full path of the version, so versions of
+    different scenes with the same file name never share a restore. A
+    restore is reused only while the archive it came from is unchanged.
+
+    Returns:
+        str: The path to open, or None if the version does not exist.
+    """
+    path = str(path)
+    if os.path.exists(path):
+        return path
+    archived = path + scene_versions.ARCHIVE_SUFFIX
+    try:
+        stamp = _archive_stamp(archived)
+    except OSError:
+        return None
+    restore_dir = restore_dir or default_restore_dir()
+    folder = os.path.join(restore_dir, hashlib.sha1(
+        os.path.abspath(path).encode('utf-8')).hexdigest()[:16])
+    restored = os.path.join(folder, os.path.basename(path))
+    stamp_path = restored + STAMP_SUFFIX
+    if os.path.exists(restored) and _read_stamp(stamp_path) == stamp:
+        return restored
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+    partial = "{}.{}.tmp".format(restored, uuid.uuid4().hex)
+    with gzip.open(archived, 'rb') as compressed, \
+            open(partial, 'wb') as scene:
+        shutil.copyfileobj(compressed, scene, READ_SIZE)
+    os.replace(partial, restored)
+    with open(stamp_path, 'w') as stamp_file:
+        json.dump(stamp, stamp_file)
+    log.info("Restored archived %s to %s", path, restored)
+    return restored
+
+
+def _archive_stamp(archived):
+    """Return what identifies the content of an archive file."""
+    stat = os.stat(archived)
+    return {'archive': os.path.abspath(archived), 'inode': stat.st_ino,
+            'size': stat.st_size, 'mtime': stat.st_mtime_ns}
+
+
+def _read_stamp(stamp_path):
+    try:
+        with open(stamp_path) as stamp_file:
+            return json.load(stamp_file)
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def default_restore_dir():
+    return os.path.join(tempfile.gettempdir(), 'smartsave_restore')
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def archive_in_background(folder, keep=DEFAULT_KEEP):
+    """Queue an archive pass of folder on the background archive thread.
+
+    Passes run one at a time, so archiving never competes with itself for
+    the disk.
+
+    Returns:
+        Future: Resolves to the ArchiveStats of the pass.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=1)
+    return _executor.submit(_archive_logged, str(folder), keep)
+
+
+def _archive_logged(folder, keep):
+    try:
+        return archive_folder(folder, keep)
+    except (IOError, OSError) as err:
+        log.error("Archiving %s failed: %s", folder, err)
+        raise
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('folders', nargs='+', help="Scene folders.")
+    parser.add_argument('--keep', type=int, default=DEFAULT_KEEP,
+                        help="Newest versions of every scene to leave "
+                             "uncompressed.")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    for folder in args.folders:
+        archive_folder(folder, args.keep)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,233 @@
+"""Saving logic of the smart save tool, usable without its UI.
+
+SceneFile depends on maya.cmds only, so scripts and batch jobs can import
+it without loading PySide2 or pymel, whose import alone takes seconds. The
+dialog lives in smartsave.py.
+"""
+import logging
+import os
+import uuid
+
+import maya.cmds as cmds
+
+import profiling
+import scene_archive
+import scene_metrics
+import scene_transfer
+import scene_versions
+
+log = logging.getLogger(__name__)
+
+FILE_TYPES = {'.ma': 'mayaAscii', '.mb': 'mayaBinary'}
+
+
+def default_staging_dir():
+    """Return the local folder staged saves are written to"""
+    return os.path.join(cmds.internalVar(userAppDir=True),
+                        'smartsave_staging')
+
+
+def default_metrics_path():
+    """Return the local log save timings are appended to"""
+    return os.path.join(cmds.internalVar(userAppDir=True),
+                        scene_metrics.METRICS_NAME)
+
+
+def save_scene_as(path):
+    """Save the open scene to path, typed by its extension.
+
+    Raises:
+        RuntimeError: If the folder of path does not exist.
+    """
+    cmds.file(rename=path)
+    return cmds.file(save=True, type=FILE_TYPES.get(
+        os.path.splitext(path)[1], 'mayaAscii'))
+
+
+class SceneFile(object):
+    """Abstract representation of a Scene file."""
+    def __init__(self, path=None):
+        self._folder_path = os.path.join(
+            cmds.workspace(query=True, rootDirectory=True), "scenes")
+        self.descriptor = 'main'
+        self.task = 'model'
+        self.ver = 1
+        self.ext = '.ma'
+        self.staging_dir = None
+        self.archive_keep = None
+        self.metrics_path = None
+        self.profiler = profiling.Profiler(enabled=True,
+                                            label='Save profile')
+        self.last_save = None
+        scene = cmds.file(query=True, sceneName=True)
+        if not path and scene:
+            path = scene
+        if not path and not scene:
+            log.info("Initialize with default properties.")
+            return
+        self._init_from_path(path)
+
+    @property
+    def folder_path(self):
+        return self._folder_path
+
+    @folder_path.setter
+    def folder_path(self, val):
+        self._folder_path = str(val)
+
+    @property
+    def filename(self):
+        return scene_versions.format_scene_name(self.descriptor, self.task,
+                                                self.ver, self.ext)
+
+    @property
+    def path(self):
+        return os.path.join(self.folder_path, self.filename)
+
+    def _init_from_path(self, path):
+        path = str(path)
+        self.folder_path = os.path.dirname(path)
+        name = os.path.basename(path)
+        parsed = scene_versions.parse_scene_name(name)
+        if parsed is None:
+            raise ValueError("{} is not named descriptor_task_vNNN.ext"
+                             .format(name))
+        self.descriptor, self.task, self.ver, self.ext = parsed
+
+    def save(self):
+        """Saves the scene file.
+
+        With a staging_dir the scene is written there and copied to its
+        folder in the background, see save_staged.
+
+        Returns:
+            str: The path to the scene file if successful
+        """
+        self.profiler.reset()
+        return self._save('save')
+
+    def save_staged(self):
+        """Save to the local staging folder and transfer in the background.
+
+        Returns as soon as the local save is done. The open scene is renamed
+        to its final path, and an empty placeholder holds the version in the
+        folder until the transfer replaces it, so no session reuses a
+        version that is still in transfer.
+
+        Returns:
+            str: The path the scene file is transferred to.
+        """
+        self.profiler.reset()
+        return self._save_staged('save')
+
+    def _save(self, kind):
+        if self.staging_dir:
+            return self._save_staged(kind)
+        try:
+            with self.profiler.span('serialize'):
+                saved = save_scene_as(self.path)
+        except RuntimeError as err:
+            log.warning("Missing directories in path. Creating directories...")
+            self.profiler.count('serialize_retries')
+            with self.profiler.span('create_folders'):
+                if not os.path.isdir(self.folder_path):
+                    os.makedirs(self.folder_path)
+            with self.profiler.span('serialize'):
+                saved = save_scene_as(self.path)
+        with self.profiler.span('index_update'):
+            self.version_index().add(self.descriptor, self.task, self.ext,
+                                     self.ver)
+        self._record_save(kind, _file_size(self.path))
+        return saved
+
+    def _save_staged(self, kind):
+        with self.profiler.span('create_folders'):
+            if not os.path.isdir(self.staging_dir):
+                os.makedirs(self.staging_dir)
+        staged = os.path.join(self.staging_dir, "{}_{}".format(
+            uuid.uuid4().hex, self.filename))
+        with self.profiler.span('serialize'):
+            save_scene_as(staged)
+        size = _file_size(staged)
+        with self.profiler.span('index_update'):
+            self.version_index().hold(self.descriptor, self.task, self.ext,
+                                      self.ver)
+        with self.profiler.span('queue_transfer'):
+            cmds.file(rename=self.path)
+            scene_transfer.transfer_queue().submit(staged, self.path)
+        self._record_save(kind, size, staged=True)
+        return self.path
+
+    def _record_save(self, kind, size, staged=False):
+        """Keep the timings of the save just made and log them if asked."""
+        self.last_save = scene_metrics.save_record(
+            self.path, self.profiler.as_dict(), size, kind, staged)
+        if self.metrics_path:
+            scene_metrics.MetricsLog(self.metrics_path).append(self.last_save)
+
+    def version_index(self):
+        """Return the cached VersionIndex of the folder."""
+        return scene_versions.version_index(self.folder_path)
+
+    def next_avail_ver(self):
+        """Return the next available version number in the folder.
+
+        Versions are compared as numbers, so v1000 follows v999. The folder
+        is only listed when it changed since it was last indexed.
+        """
+        return self.version_index().next_version(self.descriptor, self.task,
+                                                 self.ext)
+
+    def save_increment(self):
+        """Increments the version and saves the scene file.
+
+        If the existing version of a file already exists, it should increment
+        from the largest version number available in the folder. The new
+        version is reserved atomically, so sessions incrementing the same
+        scene at the same time always get distinct versions. If the save
+        fails the reservation is released again and ver is left as it was.
+
+        Returns:
+            str: The path to the scene file if successful
+        """
+        self.profiler.reset()
+        previous = self.ver
+        with self.profiler.span('version_scan'):
+            self.ver = self.version_index().reserve(self.descriptor,
+                                                    self.task, self.ext)
+        try:
+            saved = self._save('increment')
+        except Exception:
+            self.version_index().release(self.descriptor, self.task,
+                                         self.ext, self.ver)
+            self.ver = previous
+            raise
+        if self.archive_keep:
+            scene_archive.archive_in_background(self.folder_path,
+                                                self.archive_keep)
+        return saved
+
+    def open(self):
+        """Open this version of the scene, archived or not.
+
+        An archived version is restored to a local folder and opened from
+        there, and the open scene is renamed back to its path in the folder.
+
+        Returns:
+            str: The path the scene was read from.
+        """
+        path = scene_archive.resolve(self.path)
+        if path is None:
+            raise IOError("No version {} of {}_{} in {}".format(
+                self.ver, self.descriptor, self.task, self.folder_path))
+        cmds.file(path, open=True, force=True)
+        if path != self.path:
+            cmds.file(rename=self.path)
+        return path
+
+
+def _file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return None
@@ -0,0 +1,202 @@
+"""Paged version history of one scene, with file details loaded lazily.
+
+The versions of a scene come from a VersionIndex of the folder, so checking
+for new versions costs a stat or two rather than a listing of the folder.
+Size, modification time and author need a stat of every file, which is slow
+on network storage with thousands of versions, so they are loaded a page at
+a time, and only for the pages that are shown. All of it runs on a worker
+thread, never on the thread the UI runs on, and the history only reads the
+folder: it never writes the version sidecar.
+"""
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import pwd
+except ImportError:
+    # Windows has no password database to look file owners up in.
+    pwd = None
+
+import scene_versions
+
+log = logging.getLogger(__name__)
+
+PAGE_SIZE = 50
+
+_AUTHORS = {}
+
+
+class VersionRecord(object):
+    """One version of a scene and, once loaded, its file details."""
+
+    def __init__(self, ver, path):
+        self.ver = ver
+        self.path = path
+        self.loaded = False
+        self.archived = False
+        self.size = None
+        self.mtime = None
+        self.author = None
+
+    def load(self):
+        """Stat the version's file, archived or not, and fill in details."""
+        try:
+            stat = os.stat(self.path)
+            self.archived = False
+        except OSError:
+            try:
+                stat = os.stat(self.path + scene_versions.ARCHIVE_SUFFIX)
+                self.archived = True
+            except OSError:
+                stat = None
+        if stat is not None:
+            self.size = stat.st_size
+            self.mtime = stat.st_mtime
+            self.author = file_owner(stat)
+        self.loaded = True
+        return self
+
+
+def file_owner(stat):
+    """Return the name of the user owning a stat'ed file, or None."""
+    if pwd is None:
+        return None
+    uid = stat.st_uid
+    if uid not in _AUTHORS:
+        try:
+            _AUTHORS[uid] = pwd.getpwuid(uid).pw_name
+        except KeyError:
+            _AUTHORS[uid] = str(uid)
+    return _AUTHORS[uid]
+
+
+class SceneHistory(object):
+    """The versions of one scene, newest first, shown a page at a time.
+
+    Args:
+        folder (str): The scene folder.
+        descriptor (str): Scene descriptor.
+        task (str): Scene task.
+        ext (str): Scene file extension.
+        page_size (int): Versions added to the shown ones by next_page.
+    """
+
+    def __init__(self, folder, descriptor, task, ext, page_size=PAGE_SIZE):
+        self.folder = str(folder)
+        self.descriptor = descriptor
+        self.task = task
+        self.ext = ext
+        self.page_size = page_size
+        self.index = scene_versions.VersionIndex(self.folder,
+                                                 write_sidecar=False)
+        self.records = []
+        self.shown = 0
+        self.generation = 0
+        self._refreshing = False
+        self._lock = threading.Lock()
+        self._pool = None
+
+    @property
+    def key(self):
+        return self.folder, self.descriptor, self.task, self.ext
+
+    def visible(self):
+        """Return the records of the shown pages, newest first."""
+        return self.records[:self.shown]
+
+    def has_more(self):
+        return self.shown < len(self.records)
+
+    def refresh(self):
+        """Queue a check of the folder for added or removed versions.
+
+        The check runs on the worker thread and is cheap when nothing
+        changed. Records of versions still in the folder keep their loaded
+        details, and details of new versions on the shown pages are loaded
+        right after. generation changes when there is something new to show.
+
+        Returns:
+            Future: Resolves to True if versions were added or removed, or
+                None when a check is already queued.
+        """
+        with self._lock:
+            if self._refreshing:
+                return None
+            self._refreshing = True
+        return self._submit(self._refresh)
+
+    def close(self):
+        """Stop the worker thread once its queued work is done."""
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False)
+
+    def _refresh(self):
+        try:
+            versions = self.index.versions(self.descriptor, self.task,
+                                           self.ext)
+            if [record.ver for record in self.records] == versions[::-1]:
+                return False
+            known = dict((record.ver, record) for record in self.records)
+            records = [known.get(ver) or VersionRecord(ver, self._path(ver))
+                       for ver in reversed(versions)]
+            with self._lock:
+                self.records = records
+                self.shown = min(max(self.shown, self.page_size),
+                                 len(records))
+                self.generation += 1
+            self._load_page(self.visible())
+            return True
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def next_page(self):
+        """Show one more page of older versions and load their details."""
+        start = self.shown
+        self.shown = min(self.shown + self.page_size, len(self.records))
+        self._changed()
+        self._load(self.records[start:self.shown])
+
+    def invalidate(self, ver):
+        """Load the details of a version again, after it was saved over."""
+        for record in self.visible():
+            if record.ver == ver:
+                record.loaded = False
+                self._load([record])
+
+    def _path(self, ver):
+        return os.path.join(self.folder, scene_versions.format_scene_name(
+            self.descriptor, self.task, ver, self.ext))
+
+    def _changed(self):
+        with self._lock:
+            self.generation += 1
+
+    def _load(self, records):
+        records = [record for record in records if not record.loaded]
+        if not records:
+            return None
+        return self._submit(self._load_page, records)
+
+    def _submit(self, function, *args):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=1)
+            return self._pool.submit(function, *args)
+
+    def _load_page(self, records):
+        records = [record for record in records if not record.loaded]
+        if not records:
+            return records
+        for record in records:
+            try:
+                record.load()
+            except (IOError, OSError) as err:
+                log.debug("Could not stat %s: %s", record.path, err)
+                record.loaded = True
+        self._changed()
+        return records
@@ -0,0 +1,128 @@
+"""Append-only log of scene save timings and sizes.
+
+SceneFile times every phase of a save (the version scan, serialising the
+scene, creating missing folders, updating the version index) and can append
+one JSON line per save to a local metrics log. Lines are written with a
+single append, so sessions sharing a log do not interleave their records.
+
+Summarise a log from the src folder:
+
+    python scene_metrics.py ~/maya/smartsave_metrics.jsonl
+"""
+import argparse
+import json
+import logging
+import os
+import socket
+import sys
+import time
+
+log = logging.getLogger(__name__)
+
+METRICS_NAME = 'smartsave_metrics.jsonl'
+PERCENTILES = (50, 95)
+
+
+class MetricsLog(object):
+    """A JSON lines file that save records are appended to.
+
+    Args:
+        path (str): The log file, created on the first append.
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+
+    def append(self, record):
+        line = (json.dumps(record, sort_keys=True) + "\n").encode('utf-8')
+        try:
+            folder = os.path.dirname(self.path)
+            if folder and not os.path.isdir(folder):
+                os.makedirs(folder)
+            handle = os.open(self.path,
+                             os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+            try:
+                os.write(handle, line)
+            finally:
+                os.close(handle)
+        except (IOError, OSError) as err:
+            # Metrics are never worth failing a save over.
+            log.debug("Could not append to %s: %s", self.path, err)
+
+    def records(self):
+        """Yield the records in the log, skipping damaged lines."""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path) as lines:
+            for line in lines:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+
+def save_record(path, profile, size, kind, staged=False):
+    """Return the log record of one save.
+
+    Args:
+        path (str): Where the scene was saved to.
+        profile (dict): The as_dict of the profiler the save was timed with.
+        size (int): Bytes written, or None if unknown.
+        kind (str): 'save' or 'increment'.
+        staged (bool): The scene was saved locally and transferred.
+    """
+    phases = dict((name, span['seconds'])
+                  for name, span in profile['spans'].items())
+    return {'time': time.time(),
+            'host': socket.gethostname(),
+            'path': str(path),
+            'kind': kind,
+            'staged': staged,
+            'bytes': size,
+            'seconds': sum(phases.values()),
+            'phases': phases,
+            'counters': profile['counters']}
+
+
+def percentile(values, percent):
+    """Return the nearest rank percentile of sorted values."""
+    if not values:
+        return None
+    rank = int(round(percent / 100.0 * (len(values) - 1)))
+    return values[rank]
+
+
+def summarize(records):
+    """Return count, mean and percentiles of the total and every phase."""
+    samples = {}
+    for record in records:
+        samples.setdefault('total', []).append(record['seconds'])
+        for name, seconds in record['phases'].items():
+            samples.setdefault(name, []).append(seconds)
+    summary = {}
+    for name, values in samples.items():
+        values.sort()
+        summary[name] = dict([('count', len(values)),
+                              ('mean', sum(values) / len(values)),
+                              ('max', values[-1])] +
+                             [('p{}'.format(percent),
+                               percentile(values, percent))
+                              for percent in PERCENTILES])
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('log', help="Metrics log to summarise.")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    summary = summarize(MetricsLog(args.log).records())
+    for name, stats in sorted(summary.items()):
+        log.info("%-16s %6d saves  mean %.3fs  p50 %.3fs  p95 %.3fs  "
+                 "max %.3fs", name, stats['count'], stats['mean'],
+                 stats['p50'], stats['p95'], stats['max'])
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
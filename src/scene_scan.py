@@ -0,0 +1,217 @@
+"""Report on and prune scene versions across a whole project tree.
+
+Every folder of the tree is listed once with os.scandir on a pool of worker
+threads, and scene files are recognised with the same naming rules SceneFile
+uses, archived versions included. Results are streamed a folder at a time,
+as the workers finish, so memory use does not grow with the size of the tree:
+
+    python scene_scan.py /projects/show --workers 16
+    python scene_scan.py /projects/show --prune 5 --dry-run
+
+Pruning deletes all but the newest N versions of every scene, N being at
+least one. Empty files are versions reserved by a save in progress and are
+never pruned, whatever their version.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import scene_archive
+import scene_versions
+
+log = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 8
+
+
+class AssetStats(object):
+    """The versions of one scene in one folder."""
+
+    def __init__(self, folder, descriptor, task, ext):
+        self.folder = folder
+        self.descriptor = descriptor
+        self.task = task
+        self.ext = ext
+        self.files = {}
+        self.size = 0
+        self.archived = 0
+        self.newest_mtime = 0
+        self.pruned = 0
+        self.pruned_size = 0
+
+    @property
+    def name(self):
+        return "{}_{}{}".format(self.descriptor, self.task, self.ext)
+
+    @property
+    def versions(self):
+        return sorted(self.files)
+
+    def add(self, ver, entry):
+        """Count a directory entry holding a version of the scene."""
+        stat = entry.stat(follow_symlinks=False)
+        self.files.setdefault(ver, []).append((entry.path, stat.st_size))
+        self.size += stat.st_size
+        self.newest_mtime = max(self.newest_mtime, stat.st_mtime)
+        if entry.name.endswith(scene_versions.ARCHIVE_SUFFIX):
+            self.archived += 1
+
+    def prune(self, keep, dry_run=False):
+        """Delete the files of all but the newest keep versions.
+
+        Reserved versions are always kept and do not count towards keep,
+        so the newest saved version is kept even while a save is running.
+
+        Returns:
+            list: The paths deleted, or that would be with dry_run.
+        """
+        if keep < 1:
+            raise ValueError("keep must be at least 1, not {}".format(keep))
+        removed = []
+        saved = [ver for ver in self.versions if not self.reserved(ver)]
+        for ver in saved[:-keep]:
+            for path, size in self.files.pop(ver):
+                if not dry_run:
+                    try:
+                        os.remove(path)
+                    except OSError as err:
+                        log.warning("Could not prune %s: %s", path, err)
+                        continue
+                removed.append(path)
+                if path.endswith(scene_versions.ARCHIVE_SUFFIX):
+                    self.archived -= 1
+                self.pruned += 1
+                self.pruned_size += size
+                self.size -= size
+        return removed
+
+    def reserved(self, ver):
+        """Return True if a version is an empty placeholder of a save."""
+        return any(size == 0 and
+                   not path.endswith(scene_versions.ARCHIVE_SUFFIX)
+                   for path, size in self.files[ver])
+
+    def as_dict(self):
+        versions = self.versions
+        return {'folder': self.folder, 'asset': self.name,
+                'versions': len(versions),
+                'first': versions[0] if versions else None,
+                'latest': versions[-1] if versions else None,
+                'archived': self.archived, 'bytes': self.size,
+                'newest_mtime': self.newest_mtime,
+                'pruned': self.pruned, 'pruned_bytes': self.pruned_size}
+
+
+def scan_folder(folder, keep=None, dry_run=False):
+    """List one folder, optionally pruning its scenes to keep versions.
+
+    Returns:
+        tuple: The subfolders to scan next and the AssetStats of the
+            folder's scenes.
+    """
+    subfolders = []
+    assets = {}
+    try:
+        entries = os.scandir(folder)
+    except OSError as err:
+        log.warning("Could not list %s: %s", folder, err)
+        return subfolders, []
+    with entries:
+        for entry in entries:
+            if entry.name.startswith('.'):
+                # Version sidecars and archive stores are not scenes.
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                subfolders.append(entry.path)
+                continue
+            parsed = scene_versions.parse_scene_name(entry.name)
+            if parsed is None or not entry.is_file(follow_symlinks=False):
+                continue
+            descriptor, task, ver, ext = parsed
+            stats = assets.get((descriptor, task, ext))
+            if stats is None:
+                stats = assets[(descriptor, task, ext)] = AssetStats(
+                    folder, descriptor, task, ext)
+            stats.add(ver, entry)
+    assets = [assets[key] for key in sorted(assets)]
+    if keep is not None:
+        removed = []
+        for stats in assets:
+            removed.extend(stats.prune(keep, dry_run))
+        if not dry_run and any(path.endswith(scene_versions.ARCHIVE_SUFFIX)
+                               for path in removed):
+            scene_archive.remove_unused_objects(
+                os.path.join(folder, scene_archive.STORE_NAME))
+    return subfolders, assets
+
+
+def scan_tree(root, workers=DEFAULT_WORKERS, keep=None, dry_run=False):
+    """Scan every folder under root on a pool of worker threads.
+
+    Yields:
+        AssetStats: The scenes of each folder, as its listing finishes.
+    """
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = set([pool.submit(scan_folder, str(root), keep, dry_run)])
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                subfolders, assets = future.result()
+                for folder in subfolders:
+                    pending.add(pool.submit(scan_folder, folder, keep,
+                                            dry_run))
+                for stats in assets:
+                    yield stats
+
+
+def positive_int(text):
+    """argparse type of a whole number of at least one."""
+    value = int(text)
+    if value < 1:
+        raise argparse.ArgumentTypeError(
+            "must be at least 1, not {}".format(value))
+    return value
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('roots', nargs='+', help="Project trees to scan.")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                        help="Folders listed at the same time.")
+    parser.add_argument('--prune', type=positive_int, metavar='N',
+                        help="Delete all but the newest N versions of every "
+                             "scene.")
+    parser.add_argument('--dry-run', action='store_true',
+                        help="Report what --prune would delete, but keep it.")
+    parser.add_argument('--json', action='store_true',
+                        help="Write one JSON object per scene.")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    assets = versions = size = pruned = pruned_size = 0
+    for root in args.roots:
+        for stats in scan_tree(root, args.workers, args.prune, args.dry_run):
+            row = stats.as_dict()
+            if args.json:
+                sys.stdout.write(json.dumps(row) + "\n")
+            else:
+                sys.stdout.write(
+                    "{folder}\t{asset}\t{versions} versions\t"
+                    "v{first}-v{latest}\t{bytes} bytes\t"
+                    "{pruned} pruned\n".format(**row))
+            assets += 1
+            versions += row['versions']
+            size += row['bytes']
+            pruned += row['pruned']
+            pruned_size += row['pruned_bytes']
+    log.info("%d scenes, %d versions, %d bytes; %s %d files, %d bytes",
+             assets, versions, size,
+             "would prune" if args.dry_run else "pruned", pruned,
+             pruned_size)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
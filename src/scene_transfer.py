@@ -0,0 +1,336 @@
+"""Background transfer of locally staged scene files to their folders.
+
+Saving a large scene straight onto network storage makes the artist wait on
+the network. A staged save writes the scene to a fast local staging folder
+instead and queues a transfer: a worker thread copies the file next to its
+destination under a temporary name and renames it into place, so the
+destination either holds the complete file or nothing.
+
+Saves of the same destination land in the order they were submitted: each
+submit gets a generation number per destination, and a transfer that has
+been superseded by a newer one is dropped instead of renamed into place.
+
+Every staged file has a small manifest next to it naming its destination
+and the session that staged it. A transfer deletes both once it lands, so
+anything left in the staging folder after a crash can be queued again with
+TransferQueue.recover. Each session holds a lock file in its staging folders
+while it runs, so recovery only picks up the files of sessions that ended.
+"""
+import atexit
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import fcntl
+    msvcrt = None
+except ImportError:
+    # Windows locks byte ranges of files instead.
+    fcntl = None
+    import msvcrt
+
+log = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 2
+MANIFEST_SUFFIX = '.transfer.json'
+PARTIAL_SUFFIX = '.part'
+SESSION_LOCK = '.session-{}.lock'
+
+STATUS_QUEUED = 'queued'
+STATUS_COPYING = 'copying'
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+STATUS_SUPERSEDED = 'superseded'
+
+
+class Transfer(object):
+    """One staged file on its way to its destination."""
+
+    def __init__(self, source, destination, generation=0):
+        self.source = source
+        self.destination = destination
+        self.generation = generation
+        self.status = STATUS_QUEUED
+        self.error = None
+        self.size = 0
+
+    @property
+    def manifest_path(self):
+        return self.source + MANIFEST_SUFFIX
+
+    @property
+    def finished(self):
+        return self.status in (STATUS_DONE, STATUS_FAILED,
+                               STATUS_SUPERSEDED)
+
+
+class TransferQueue(object):
+    """Copies staged files to their destinations on worker threads.
+
+    Args:
+        workers (int): Number of files copied at the same time.
+    """
+
+    def __init__(self, workers=DEFAULT_WORKERS):
+        self.workers = workers
+        self.session = uuid.uuid4().hex
+        self.transfers = []
+        self._futures = []
+        self._generations = {}
+        self._session_locks = {}
+        self._lock = threading.Lock()
+        self._pool = None
+
+    def submit(self, source, destination, submitted=None):
+        """Queue the copy of a staged file to its destination.
+
+        A later submit to the same destination supersedes this one.
+
+        Returns:
+            Transfer: The queued transfer, whose status updates as it runs.
+        """
+        self._hold_session_lock(os.path.dirname(source))
+        with self._lock:
+            generation = self._generations.get(destination, 0) + 1
+            self._generations[destination] = generation
+        transfer = Transfer(source, destination, generation)
+        with open(transfer.manifest_path, 'w') as manifest:
+            json.dump({'destination': destination, 'session': self.session,
+                       'submitted': submitted or time.time()}, manifest)
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers)
+            self.transfers.append(transfer)
+            self._futures.append(self._pool.submit(self._run, transfer))
+        return transfer
+
+    def recover(self, staging_dir):
+        """Queue the staged files of sessions that are no longer running.
+
+        Picks up the saves of a session that ended before its transfers did.
+        Files of sessions still running, this one included, are left to
+        them. Files for the same destination are queued oldest first.
+
+        Returns:
+            list: The queued transfers.
+        """
+        if not os.path.isdir(staging_dir):
+            return []
+        orphans = []
+        live = {self.session: True}
+        for root, _, names in os.walk(staging_dir):
+            for name in names:
+                if not name.endswith(MANIFEST_SUFFIX):
+                    continue
+                source = os.path.join(root, name[:-len(MANIFEST_SUFFIX)])
+                if not os.path.exists(source):
+                    continue
+                try:
+                    with open(os.path.join(root, name)) as manifest:
+                        data = json.load(manifest)
+                except (IOError, OSError, ValueError):
+                    continue
+                session = data.get('session')
+                if session not in live:
+                    live[session] = _session_running(root, session)
+                if not live[session]:
+                    orphans.append((data.get('submitted', 0), source,
+                                    data['destination']))
+        recovered = []
+        for submitted, source, destination in sorted(orphans):
+            log.warning("Recovering untransferred save %s", destination)
+            recovered.append(self.submit(source, destination, submitted))
+        return recovered
+
+    def pending(self):
+        """Return the transfers that have not finished yet."""
+        with self._lock:
+            return [transfer for transfer in self.transfers
+                    if not transfer.finished]
+
+    def failed(self):
+        with self._lock:
+            return [transfer for transfer in self.transfers
+                    if transfer.status == STATUS_FAILED]
+
+    def status(self):
+        """Return a one line summary of the transfers."""
+        pending = self.pending()
+        failed = self.failed()
+        if failed:
+            return "{} transfer(s) failed, last: {}".format(
+                len(failed), failed[-1].error)
+        if pending:
+            return "Transferring {} file(s) to network storage".format(
+                len(pending))
+        return "All saves transferred"
+
+    def flush(self, timeout=None):
+        """Wait until every queued transfer has finished.
+
+        Returns:
+            list: The transfers that failed. Their staged files are kept.
+        """
+        with self._lock:
+            futures = list(self._futures)
+        for future in futures:
+            future.result(timeout)
+        with self._lock:
+            self._futures = [future for future in self._futures
+                             if not future.done()]
+        return self.failed()
+
+    def retry_failed(self):
+        """Queue every failed transfer again."""
+        with self._lock:
+            failed = [transfer for transfer in self.transfers
+                      if transfer.status == STATUS_FAILED]
+            self.transfers = [transfer for transfer in self.transfers
+                              if transfer.status != STATUS_FAILED]
+        retried = []
+        for transfer in failed:
+            if self._superseded(transfer):
+                self._drop(transfer)
+            else:
+                retried.append(self.submit(transfer.source,
+                                           transfer.destination))
+        return retried
+
+    def release(self):
+        """Unlock and remove this session's lock files.
+
+        Staged files still here afterwards are recovered by the next session.
+        """
+        with self._lock:
+            locks, self._session_locks = self._session_locks, {}
+        for staging_dir, handle in locks.items():
+            handle.close()
+            try:
+                os.remove(os.path.join(staging_dir,
+                                       SESSION_LOCK.format(self.session)))
+            except OSError:
+                pass
+
+    def _superseded(self, transfer):
+        with self._lock:
+            return transfer.generation < \
+                self._generations[transfer.destination]
+
+    def _hold_session_lock(self, staging_dir):
+        """Lock this session's file in a staging folder, once."""
+        with self._lock:
+            if staging_dir in self._session_locks:
+                return
+            path = os.path.join(staging_dir, SESSION_LOCK.format(self.session))
+            handle = open(path, 'a+')
+            if not _try_lock(handle):
+                log.warning("Could not lock %s", path)
+            self._session_locks[staging_dir] = handle
+
+    def _run(self, transfer):
+        if self._superseded(transfer):
+            return self._drop(transfer)
+        transfer.status = STATUS_COPYING
+        partial = "{}.{}{}".format(transfer.destination, uuid.uuid4().hex,
+                                   PARTIAL_SUFFIX)
+        try:
+            folder = os.path.dirname(transfer.destination)
+            if folder and not os.path.isdir(folder):
+                os.makedirs(folder)
+            shutil.copyfile(transfer.source, partial)
+            transfer.size = os.path.getsize(partial)
+            # Checked and renamed under the lock, so a newer save that
+            # landed first is never replaced by an older one.
+            with self._lock:
+                superseded = transfer.generation < \
+                    self._generations[transfer.destination]
+                if not superseded:
+                    os.replace(partial, transfer.destination)
+            if superseded:
+                os.remove(partial)
+                return self._drop(transfer)
+        except (IOError, OSError) as err:
+            transfer.status = STATUS_FAILED
+            transfer.error = err
+            log.error("Could not transfer %s to %s: %s", transfer.source,
+                      transfer.destination, err)
+            if os.path.exists(partial):
+                os.remove(partial)
+            return transfer
+        os.remove(transfer.source)
+        os.remove(transfer.manifest_path)
+        transfer.status = STATUS_DONE
+        log.info("Transferred %s (%d bytes)", transfer.destination,
+                 transfer.size)
+        return transfer
+
+    def _drop(self, transfer):
+        """Discard a transfer a newer save of its destination replaces."""
+        os.remove(transfer.source)
+        os.remove(transfer.manifest_path)
+        transfer.status = STATUS_SUPERSEDED
+        log.info("Skipped superseded save of %s", transfer.destination)
+        return transfer
+
+
+def _try_lock(handle):
+    """Lock an open file without waiting, returning True if locked."""
+    try:
+        if fcntl is not None:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(handle.fileno(), msvcrt.LK_NBLCK, 1)
+    except (IOError, OSError):
+        return False
+    return True
+
+
+def _session_running(staging_dir, session):
+    """Return True if the session that staged files in a folder still runs.
+
+    A running session holds the lock on its lock file. The lock file of an
+    ended session is removed once it is found unlocked.
+    """
+    if not session:
+        return False
+    path = os.path.join(staging_dir, SESSION_LOCK.format(session))
+    if not os.path.exists(path):
+        return False
+    with open(path, 'a+') as handle:
+        if not _try_lock(handle):
+            return True
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+    return False
+
+
+_QUEUE = None
+
+
+def transfer_queue():
+    """Return the shared TransferQueue, flushed when the process exits."""
+    global _QUEUE
+    if _QUEUE is None:
+        _QUEUE = TransferQueue()
+        atexit.register(flush_on_exit)
+    return _QUEUE
+
+
+def flush_on_exit():
+    """Finish every queued transfer before the process goes away."""
+    if _QUEUE is None:
+        return
+    if _QUEUE.pending():
+        log.warning("Finishing %d scene transfer(s) before exit",
+                    len(_QUEUE.pending()))
+        for transfer in _QUEUE.flush():
+            log.error("Scene %s is still staged at %s", transfer.destination,
+                      transfer.source)
+    _QUEUE.release()
@@ -0,0 +1,300 @@
+"""Scene file naming rules and a cached index of the versions in a folder.
+
+Scene files are named descriptor_task_vNNN.ext. A VersionIndex maps every
+(descriptor, task, ext) in a folder to its versions, sorted numerically, and
+is only rebuilt when the folder changes: adding, removing or renaming a file
+updates the directory mtime, so checking that the index is current costs a
+single stat rather than a listing of the folder.
+
+The index is also stored in a sidecar file in the folder, so other sessions
+reuse it. The sidecar's own mtime is set to the mtime of the folder it
+describes, which keeps the check for a stale sidecar to two stat calls.
+
+New versions are reserved by creating the empty scene file with an
+exclusive create, which the file system grants to exactly one caller, so
+concurrent increments always end up with distinct versions.
+"""
+import bisect
+import collections
+import errno
+import json
+import logging
+import os
+import re
+import uuid
+
+log = logging.getLogger(__name__)
+
+ARCHIVE_SUFFIX = '.gz'
+SCENE_NAME_RE = re.compile(
+    r'^(?P<descriptor>[^_]+)_(?P<task>[^_]+)_v(?P<ver>\d+)(?P<ext>\.[^._]+)'
+    r'(?P<archived>' + re.escape(ARCHIVE_SUFFIX) + r')?$')
+SIDECAR_NAME = '.smartsave_versions.json'
+SIDECAR_FORMAT = 1
+MAX_INDEXES = 32
+
+
+def parse_scene_name(name):
+    """Split a scene file name into its parts.
+
+    Archived versions, the name followed by ARCHIVE_SUFFIX, parse to the
+    parts of the version they hold.
+
+    Returns:
+        tuple: (descriptor, task, ver, ext), or None when the name does not
+            follow descriptor_task_vNNN.ext.
+    """
+    match = SCENE_NAME_RE.match(name)
+    if match is None:
+        return None
+    return (match.group('descriptor'), match.group('task'),
+            int(match.group('ver')), match.group('ext'))
+
+
+def is_archived_name(name):
+    """Return True if name is an archived scene version."""
+    match = SCENE_NAME_RE.match(name)
+    return match is not None and match.group('archived') is not None
+
+
+def format_scene_name(descriptor, task, ver, ext):
+    """Return the file name of a scene version."""
+    return "{descriptor}_{task}_v{ver:03d}{ext}".format(
+        descriptor=descriptor, task=task, ver=ver, ext=ext)
+
+
+class VersionIndex(object):
+    """Versions of every descriptor, task and extension in one folder.
+
+    Args:
+        folder (str): The scene folder.
+        use_sidecar (bool): Read and write the sidecar index file.
+        write_sidecar (bool): Write the sidecar when it is stale. Off for
+            indexes that only look at a folder, such as the history view.
+    """
+
+    def __init__(self, folder, use_sidecar=True, write_sidecar=True):
+        self.folder = str(folder)
+        self.use_sidecar = use_sidecar
+        self.write_sidecar = write_sidecar
+        self.entries = {}
+        self.mtime = None
+        self.scans = 0
+        self.collisions = 0
+
+    @property
+    def sidecar_path(self):
+        return os.path.join(self.folder, SIDECAR_NAME)
+
+    def versions(self, descriptor, task, ext):
+        """Return the versions in the folder, in ascending numeric order."""
+        self.refresh()
+        return list(self.entries.get((descriptor, task, ext), []))
+
+    def latest(self, descriptor, task, ext):
+        """Return the highest version in the folder, or 0 if there is none."""
+        self.refresh()
+        versions = self.entries.get((descriptor, task, ext))
+        return versions[-1] if versions else 0
+
+    def next_version(self, descriptor, task, ext):
+        return self.latest(descriptor, task, ext) + 1
+
+    def refresh(self, force=False):
+        """Bring the index up to date with the folder.
+
+        Rescans only when the folder mtime differs from the one the index was
+        built at and the sidecar is stale as well.
+        """
+        mtime = _mtime(self.folder)
+        if mtime is None:
+            self.entries = {}
+            self.mtime = None
+            return
+        if not force and mtime == self.mtime:
+            return
+        if not force and self.use_sidecar and self._read_sidecar(mtime):
+            return
+        self._scan()
+        self.mtime = mtime
+        self._write_sidecar()
+
+    def add(self, descriptor, task, ext, ver):
+        """Record a version this session has just written to the folder.
+
+        Keeps the index current without a rescan when nothing else changed
+        the folder since the index was last brought up to date. Otherwise
+        the index is refreshed first, so the new stamp and sidecar never
+        hide versions other sessions saved in the meantime.
+        """
+        if _mtime(self.folder) != self.mtime:
+            self.refresh()
+        self._insert(descriptor, task, ext, ver)
+        self.mtime = _mtime(self.folder)
+        self._write_sidecar()
+
+    def reserve(self, descriptor, task, ext):
+        """Claim the next free version by creating its file exclusively.
+
+        The empty file holds the version until the scene is saved over it.
+        When another session created the file first, the next version is
+        tried, without listing the folder again.
+
+        Returns:
+            int: The reserved version.
+        """
+        self._make_folder()
+        ver = self.next_version(descriptor, task, ext)
+        while True:
+            path = os.path.join(self.folder, format_scene_name(
+                descriptor, task, ver, ext))
+            try:
+                handle = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except OSError as err:
+                if err.errno != errno.EEXIST:
+                    raise
+                self._insert(descriptor, task, ext, ver)
+                self.collisions += 1
+                ver += 1
+                continue
+            os.close(handle)
+            self.add(descriptor, task, ext, ver)
+            return ver
+
+    def hold(self, descriptor, task, ext, ver):
+        """Keep a version taken until its file arrives from elsewhere.
+
+        Creates the empty placeholder reserve would, unless the version
+        already has a file. A scene saved to a staging folder is only moved
+        into the folder once its transfer ends, and until then the
+        placeholder keeps the version taken, even for an index rebuilt
+        from the folder.
+        """
+        self._make_folder()
+        path = os.path.join(self.folder, format_scene_name(
+            descriptor, task, ver, ext))
+        try:
+            os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        except OSError as err:
+            if err.errno != errno.EEXIST:
+                raise
+        self.add(descriptor, task, ext, ver)
+
+    def release(self, descriptor, task, ext, ver):
+        """Give back a version reserved by a save that failed.
+
+        The placeholder is only removed while it is still empty, so a
+        version that was written, even in part, is never deleted.
+
+        Returns:
+            bool: True if the version is free again.
+        """
+        path = os.path.join(self.folder, format_scene_name(
+            descriptor, task, ver, ext))
+        if _mtime(self.folder) != self.mtime:
+            self.refresh()
+        try:
+            if os.path.getsize(path):
+                return False
+            os.remove(path)
+        except OSError as err:
+            if err.errno != errno.ENOENT:
+                log.warning("Could not release version %s: %s", path, err)
+                return False
+        versions = self.entries.get((descriptor, task, ext), [])
+        if ver in versions:
+            versions.remove(ver)
+        self.mtime = _mtime(self.folder)
+        self._write_sidecar()
+        return True
+
+    def _make_folder(self):
+        if not os.path.isdir(self.folder):
+            try:
+                os.makedirs(self.folder)
+            except OSError as err:
+                if err.errno != errno.EEXIST:
+                    raise
+
+    def _insert(self, descriptor, task, ext, ver):
+        versions = self.entries.setdefault((descriptor, task, ext), [])
+        position = bisect.bisect_left(versions, ver)
+        if position == len(versions) or versions[position] != ver:
+            versions.insert(position, ver)
+
+    def _scan(self):
+        entries = {}
+        for entry in os.scandir(self.folder):
+            parsed = parse_scene_name(entry.name)
+            if parsed is None or not entry.is_file():
+                continue
+            descriptor, task, ver, ext = parsed
+            entries.setdefault((descriptor, task, ext), set()).add(ver)
+        self.entries = dict((key, sorted(versions))
+                            for key, versions in entries.items())
+        self.scans += 1
+        log.debug("Indexed %d scene names in %s", len(entries), self.folder)
+
+    def _read_sidecar(self, mtime):
+        if _mtime(self.sidecar_path) != mtime:
+            return False
+        try:
+            with open(self.sidecar_path) as sidecar:
+                data = json.load(sidecar)
+        except (IOError, OSError, ValueError):
+            return False
+        if data.get('format') != SIDECAR_FORMAT:
+            return False
+        self.entries = dict(((descriptor, task, ext), versions)
+                            for descriptor, task, ext, versions
+                            in data['entries'])
+        self.mtime = mtime
+        return True
+
+    def _write_sidecar(self):
+        """Write the sidecar and stamp it with the folder mtime.
+
+        Writing the sidecar changes the folder mtime itself, so the mtime is
+        read again afterwards and the sidecar stamped with that value.
+        """
+        if not self.use_sidecar or not self.write_sidecar:
+            return
+        data = {'format': SIDECAR_FORMAT,
+                'entries': [[descriptor, task, ext, versions]
+                            for (descriptor, task, ext), versions
+                            in sorted(self.entries.items())]}
+        temp_path = "{}.{}.tmp".format(self.sidecar_path, uuid.uuid4().hex)
+        try:
+            with open(temp_path, 'w') as sidecar:
+                json.dump(data, sidecar)
+            os.replace(temp_path, self.sidecar_path)
+            self.mtime = _mtime(self.folder)
+            os.utime(self.sidecar_path, ns=(self.mtime, self.mtime))
+        except (IOError, OSError) as err:
+            log.debug("Could not write version sidecar %s: %s",
+                      self.sidecar_path, err)
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+_INDEXES = collections.OrderedDict()
+
+
+def version_index(folder):
+    """Return the shared VersionIndex of a folder.
+
+    The MAX_INDEXES most recently used folders keep their index.
+    """
+    folder = os.path.normpath(str(folder))
+    index = _INDEXES.pop(folder, None)
+    if index is None:
+        index = VersionIndex(folder)
+    _INDEXES[folder] = index
+    while len(_INDEXES) > MAX_INDEXES:
+        _INDEXES.popitem(last=False)
+    return index
@@ -1,19 +1,38 @@
+import datetime
 import logging
+import os
 
 from PySide2 import QtWidgets, QtCore
 from shiboken2 import wrapInstance
 import maya.OpenMayaUI as omui
 import maya.cmds as cmds
-import pymel.core as pmc
-from pymel.core.system import Path
+
+import scene_archive
+import scene_history
+import scene_transfer
+from scene_file import SceneFile, default_metrics_path, default_staging_dir
 
 log = logging.getLogger(__name__)
 
+STATUS_INTERVAL_MS = 500
+HISTORY_COLUMNS = ["Version", "Size", "Modified", "Author"]
+
+_quit_job = None
+
 
 def maya_main_window():
     """Return the maya main window widget"""
     main_window = omui.MQtUtil.mainWindow()
-    return wrapInstance(long(main_window), QtWidgets.QWidget)
+    return wrapInstance(int(main_window), QtWidgets.QWidget)
+
+
+def flush_transfers_on_quit():
+    """Finish staged transfers when Maya quits, once per session"""
+    global _quit_job
+    if _quit_job is None:
+        _quit_job = cmds.scriptJob(
+            event=['quitApplication', scene_transfer.flush_on_exit],
+            protected=True)
 
 
 class SmartSaveUI(QtWidgets.QDialog):
@@ -23,32 +42,51 @@ class SmartSaveUI(QtWidgets.QDialog):
         super(SmartSaveUI, self).__init__(parent=maya_main_window())
         self.setWindowTitle("Smart Save")
         self.setMinimumWidth(500)
-        self.setMaximumHeight(200)
+        self.setMaximumHeight(500)
         self.setWindowFlags(self.windowFlags() ^
                             QtCore.Qt.WindowContextHelpButtonHint)
         self.scenefile = SceneFile()
+        self.scenefile.metrics_path = default_metrics_path()
+        self.history = None
+        self._history_generation = None
+        self.transfers = scene_transfer.transfer_queue()
+        self.transfers.recover(default_staging_dir())
+        flush_transfers_on_quit()
         self.create_ui()
         self.create_connections()
+        self._follow_history_scene()
+        self.status_timer = QtCore.QTimer(self)
+        self.status_timer.timeout.connect(self._update_transfer_status)
+        self.status_timer.timeout.connect(self._update_history)
+        self.status_timer.start(STATUS_INTERVAL_MS)
 
     def create_ui(self):
         self.title_lbl = QtWidgets.QLabel("Smart Save")
         self.title_lbl.setStyleSheet("font: bold 20px")
         self.folder_lay = self._create_folder_ui()
         self.filename_lay = self._create_filename_ui()
+        self.history_lay = self._create_history_ui()
         self.button_lay = self._create_button_ui()
         self.main_lay = QtWidgets.QVBoxLayout()
         self.main_lay.addWidget(self.title_lbl)
         self.main_lay.addLayout(self.folder_lay)
         self.main_lay.addLayout(self.filename_lay)
-        self.main_lay.addStretch()
+        self.main_lay.addLayout(self.history_lay)
+        self.main_lay.addWidget(self.transfer_status_lbl)
         self.main_lay.addLayout(self.button_lay)
         self.setLayout(self.main_lay)
 
     def create_connections(self):
         """Connect Signals and Slots"""
         self.folder_browse_btn.clicked.connect(self._browse_folder)
+        self.folder_le.editingFinished.connect(self._follow_history_scene)
+        self.descriptor_le.editingFinished.connect(
+            self._follow_history_scene)
+        self.task_le.editingFinished.connect(self._follow_history_scene)
         self.save_btn.clicked.connect(self._save)
         self.save_increment_btn.clicked.connect(self._save_increment)
+        self.history_more_btn.clicked.connect(self._show_more_history)
+        self.history_tbl.cellDoubleClicked.connect(self._pick_history_version)
 
     @QtCore.Slot()
     def _save_increment(self):
@@ -56,12 +94,16 @@ class SmartSaveUI(QtWidgets.QDialog):
         self._set_scenefile_properties_from_ui()
         self.scenefile.save_increment()
         self.ver_sbx.setValue(self.scenefile.ver)
+        self._follow_history_scene()
 
     @QtCore.Slot()
     def _save(self):
         """Save the scene"""
         self._set_scenefile_properties_from_ui()
         self.scenefile.save()
+        self._follow_history_scene()
+        if self.history is not None:
+            self.history.invalidate(self.scenefile.ver)
 
     def _set_scenefile_properties_from_ui(self):
         self.scenefile.folder_path = self.folder_le.text()
@@ -69,6 +111,87 @@ class SmartSaveUI(QtWidgets.QDialog):
         self.scenefile.task = self.task_le.text()
         self.scenefile.ver = self.ver_sbx.value()
         self.scenefile.ext = self.ext_lbl.text()
+        if self.stage_locally_cbx.isChecked():
+            self.scenefile.staging_dir = default_staging_dir()
+        else:
+            self.scenefile.staging_dir = None
+        if self.archive_cbx.isChecked():
+            self.scenefile.archive_keep = scene_archive.DEFAULT_KEEP
+        else:
+            self.scenefile.archive_keep = None
+
+    @QtCore.Slot()
+    def _update_transfer_status(self):
+        """Show how the background transfers are doing"""
+        self.transfer_status_lbl.setText(self.transfers.status())
+
+    @QtCore.Slot()
+    def _follow_history_scene(self):
+        """Show the history of the scene named in the UI.
+
+        Called once a folder or name is entered, browsed to or saved, never
+        while it is being typed, and only folders that exist are indexed.
+        """
+        key = (os.path.normpath(self.folder_le.text()),
+               self.descriptor_le.text(), self.task_le.text(),
+               self.ext_lbl.text())
+        if self.history is not None and self.history.key == key:
+            return
+        if self.history is not None:
+            self.history.close()
+            self.history = None
+        self._history_generation = None
+        if os.path.isdir(key[0]):
+            self.history = scene_history.SceneHistory(*key)
+            self._update_history()
+        else:
+            self.history_tbl.setRowCount(0)
+            self.history_more_btn.setEnabled(False)
+
+    @QtCore.Slot()
+    def _update_history(self):
+        """Show new versions of the followed scene.
+
+        Runs on the status timer. Versions are checked for on the history's
+        worker thread, and the table is only refilled once versions were
+        added or a page of details has loaded.
+        """
+        if self.history is None:
+            return
+        self.history.refresh()
+        if self.history.generation != self._history_generation:
+            self._history_generation = self.history.generation
+            self._fill_history_table()
+
+    @QtCore.Slot()
+    def _show_more_history(self):
+        if self.history is not None:
+            self.history.next_page()
+            self._update_history()
+
+    @QtCore.Slot(int, int)
+    def _pick_history_version(self, row, column):
+        """Select the version double clicked in the history"""
+        self.ver_sbx.setValue(self.history.visible()[row].ver)
+
+    def _fill_history_table(self):
+        records = self.history.visible()
+        self.history_tbl.setRowCount(len(records))
+        for row, record in enumerate(records):
+            cells = [str(record.ver), "", "", ""]
+            if record.loaded and record.mtime is not None:
+                cells[1] = "{:.1f} MB{}".format(
+                    record.size / 1048576.0,
+                    " (archived)" if record.archived else "")
+                cells[2] = datetime.datetime.fromtimestamp(
+                    record.mtime).strftime("%Y-%m-%d %H:%M")
+                cells[3] = record.author or ""
+            elif not record.loaded:
+                cells[1] = "..."
+            for column, text in enumerate(cells):
+                self.history_tbl.setItem(row, column,
+                                         QtWidgets.QTableWidgetItem(text))
+        self.history_more_btn.setEnabled(self.history.has_more())
 
     @QtCore.Slot()
     def _browse_folder(self):
@@ -78,15 +201,42 @@ class SmartSaveUI(QtWidgets.QDialog):
             options=QtWidgets.QFileDialog.ShowDirsOnly |
                     QtWidgets.QFileDialog.DontResolveSymlinks)
         self.folder_le.setText(folder)
+        self._follow_history_scene()
 
     def _create_button_ui(self):
+        self.stage_locally_cbx = QtWidgets.QCheckBox(
+            "Save Locally, Transfer in Background")
+        self.archive_cbx = QtWidgets.QCheckBox(
+            "Compress All but the Newest {} Versions".format(
+                scene_archive.DEFAULT_KEEP))
+        self.transfer_status_lbl = QtWidgets.QLabel(self.transfers.status())
         self.save_btn = QtWidgets.QPushButton("Save")
         self.save_increment_btn = QtWidgets.QPushButton("Save Increment")
         layout = QtWidgets.QHBoxLayout()
+        layout.addWidget(self.stage_locally_cbx)
+        layout.addWidget(self.archive_cbx)
         layout.addWidget(self.save_btn)
         layout.addWidget(self.save_increment_btn)
         return layout
 
+    def _create_history_ui(self):
+        self.history_header_lbl = QtWidgets.QLabel("History")
+        self.history_header_lbl.setStyleSheet("font: bold")
+        self.history_tbl = QtWidgets.QTableWidget(0, len(HISTORY_COLUMNS))
+        self.history_tbl.setHorizontalHeaderLabels(HISTORY_COLUMNS)
+        self.history_tbl.setEditTriggers(
+            QtWidgets.QAbstractItemView.NoEditTriggers)
+        self.history_tbl.setSelectionBehavior(
+            QtWidgets.QAbstractItemView.SelectRows)
+        self.history_tbl.verticalHeader().setVisible(False)
+        self.history_tbl.horizontalHeader().setStretchLastSection(True)
+        self.history_more_btn = QtWidgets.QPushButton("Show Older Versions")
+        layout = QtWidgets.QVBoxLayout()
+        layout.addWidget(self.history_header_lbl)
+        layout.addWidget(self.history_tbl)
+        layout.addWidget(self.history_more_btn)
+        return layout
+
     def _create_filename_ui(self):
         layout = self._create_filename_headers()
         self.descriptor_le = QtWidgets.QLineEdit(self.scenefile.descriptor)
@@ -120,98 +270,11 @@ class SmartSaveUI(QtWidgets.QDialog):
         return layout
 
     def _create_folder_ui(self):
-        default_folder = Path(cmds.workspace(rootDirectory=True, query=True))
-        default_folder = default_folder / "scenes"
+        default_folder = os.path.join(
+            cmds.workspace(rootDirectory=True, query=True), "scenes")
         self.folder_le = QtWidgets.QLineEdit(default_folder)
         self.folder_browse_btn = QtWidgets.QPushButton("...")
         layout = QtWidgets.QHBoxLayout()
         layout.addWidget(self.folder_le)
         layout.addWidget(self.folder_browse_btn)
         return layout
-
-
-class SceneFile(object):
-    """Abstract representation of a Scene file."""
-    def __init__(self, path=None):
-        self._folder_path = Path(cmds.workspace(query=True,
-                                               rootDirectory=True)) / "scenes"
-        self.descriptor = 'main'
-        self.task = 'model'
-        self.ver = 1
-        self.ext = '.ma'
-        scene = pmc.system.sceneName()
-        if not path and scene:
-            path = scene
-        if not path and not scene:
-            log.info("Initialize with default properties.")
-            return
-        self._init_from_path(path)
-
-    @property
-    def folder_path(self):
-        return self._folder_path
-
-    @folder_path.setter
-    def folder_path(self, val):
-        self._folder_path = Path(val)
-
-    @property
-    def filename(self):
-        pattern = "{descriptor}_{task}_v{ver:03d}{ext}"
-        return pattern.format(descriptor=self.descriptor,
-                              task=self.task,
-                              ver=self.ver,
-                              ext=self.ext)
-
-    @property
-    def path(self):
-        return self.folder_path / self.filename
-
-    def _init_from_path(self, path):
-        path = Path(path)
-        self.folder_path = path.parent
-        self.ext = path.ext
-        self.descriptor, self.task, ver = path.name.stripext().split("_")
-        self.ver = int(ver.split("v")[-1])
-
-    def save(self):
-        """Saves the scene file.
-
-        Returns:
-            Path: The path to the scene file if successful
-        """
-        try:
-            return pmc.system.saveAs(self.path)
-        except RuntimeError as err:
-            log.warning("Missing directories in path. Creating directories...")
-            self.folder_path.makedirs_p()
-            return pmc.system.saveAs(self.path)
-
-    def next_avail_ver(self):
-        """Return the next available version number in the folder."""
-        pattern = "{descriptor}_{task}_v*{ext}".format(
-            descriptor=self.descriptor, task=self.task, ext=self.ext)
-        matching_scenefiles = []
-        for file_ in self.folder_path.files():
-            if file_.name.fnmatch(pattern):
-                matching_scenefiles.append(file_)
-        if not matching_scenefiles:
-            return 1
-        matching_scenefiles.sort(reverse=True)
-        latest_scenefile = matching_scenefiles[0]
-        latest_scenefile.name.stripext()
-        latest_scenefile = latest_scenefile.name.stripext()
-        latest_ver_num = int(latest_scenefile.split("_v")[-1])
-        return latest_ver_num + 1
-
-    def save_increment(self):
-        """Increments the version and saves the scene file.
-
-        If the existing version of a file already exists, it should increment
-        from the largest version number available in the folder.
-
-        Returns:
-            Path: The path to the scene file if successful
-        """
-        self.ver = self.next_avail_ver()
-        self.save()
@@ -0,0 +1,171 @@
+"""Benchmark suite for SceneFile saves and version lookups.
+
+Runs SceneFile against the fake maya.cmds scene files in synthetic folders
+of 10 to 100000 files and reports, per folder size, the time to find the next
+version with a cold index, from the sidecar and from the warm index, and the
+time of save and save_increment broken down by phase. Results can be stored
+as a baseline and later runs compared against it, flagging regressions.
+
+Run it outside of Maya from the src folder:
+
+    python smartsave_benchmark.py --save-baseline smartsave_baseline.json
+    python smartsave_benchmark.py --baseline smartsave_baseline.json
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import fakemaya
+
+log = logging.getLogger(__name__)
+
+DEFAULT_FILE_COUNTS = (10, 100, 1000, 10000, 100000)
+DEFAULT_SAVES = 20
+DEFAULT_SCENE_BYTES = 1024 * 1024
+DEFAULT_TOLERANCE = 0.25
+NOISE_FLOOR_SECONDS = 0.01
+ASSETS_PER_FOLDER = 100
+DESCRIPTOR = 'bench'
+TASK = 'model'
+EXT = '.ma'
+
+
+def fill_folder(folder, file_count):
+    """Create file_count empty scene files of ASSETS_PER_FOLDER scenes."""
+    import scene_versions
+    for index in range(file_count):
+        name = scene_versions.format_scene_name(
+            'asset{}'.format(index % ASSETS_PER_FOLDER), TASK,
+            index // ASSETS_PER_FOLDER + 1, EXT)
+        open(os.path.join(folder, name), 'w').close()
+
+
+def _timed(function):
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+
+def run_case(file_count, saves, scene_file, scene_versions):
+    """Measure version lookups and saves in a folder of file_count files.
+
+    Returns:
+        dict: Seconds per lookup and per save, and mean seconds per phase.
+    """
+    folder = tempfile.mkdtemp(prefix='smartsave_bench_')
+    try:
+        fill_folder(folder, file_count)
+        scene_versions._INDEXES.clear()
+        scenefile = scene_file.SceneFile()
+        scenefile.folder_path = folder
+        scenefile.descriptor = DESCRIPTOR
+        scenefile.task = TASK
+        scenefile.ext = EXT
+        result = {
+            'files': file_count,
+            'cold_lookup': _timed(lambda: scene_versions.VersionIndex(
+                folder, use_sidecar=False).next_version(
+                    DESCRIPTOR, TASK, EXT)),
+            'index_build': _timed(scenefile.next_avail_ver),
+            'sidecar_lookup': _timed(lambda: scene_versions.VersionIndex(
+                folder).next_version(DESCRIPTOR, TASK, EXT)),
+            'warm_lookup': _timed(scenefile.next_avail_ver)}
+        for name, save in (('save', scenefile.save),
+                           ('save_increment', scenefile.save_increment)):
+            phases = {}
+            seconds = 0.0
+            for _ in range(saves):
+                seconds += _timed(save)
+                for phase, phase_seconds in \
+                        scenefile.last_save['phases'].items():
+                    phases[phase] = phases.get(phase, 0.0) + phase_seconds
+            result[name] = seconds / saves
+            for phase, phase_seconds in phases.items():
+                result['{}.{}'.format(name, phase)] = phase_seconds / saves
+        result['bytes'] = scenefile.last_save['bytes']
+        return result
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+def run_suite(file_counts, saves, scene_bytes):
+    """Run every folder size and return the results keyed by size."""
+    cmds = fakemaya.install()
+    cmds.backend.scene_bytes = scene_bytes
+    import scene_file
+    import scene_versions
+    logging.getLogger(scene_file.__name__).setLevel(logging.WARNING)
+    results = {}
+    for file_count in file_counts:
+        key = "{}files".format(file_count)
+        results[key] = run_case(file_count, saves, scene_file,
+                                scene_versions)
+        log.info("%-12s cold %8.4fs  sidecar %8.4fs  warm %8.6fs  "
+                 "save %8.4fs  increment %8.4fs", key,
+                 results[key]['cold_lookup'], results[key]['sidecar_lookup'],
+                 results[key]['warm_lookup'], results[key]['save'],
+                 results[key]['save_increment'])
+    return results
+
+
+def find_regressions(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """Compare results to a baseline.
+
+    A timing regresses when it grows by more than tolerance, ignoring
+    timings under the noise floor.
+
+    Returns:
+        list: One message per regression.
+    """
+    regressions = []
+    for key, result in sorted(results.items()):
+        expected = baseline.get(key)
+        if expected is None:
+            continue
+        for metric, seconds in sorted(result.items()):
+            if metric in ('files', 'bytes') or metric not in expected or \
+                    seconds < NOISE_FLOOR_SECONDS:
+                continue
+            if seconds > expected[metric] * (1.0 + tolerance):
+                regressions.append("{} {}: {:.4g}s > baseline {:.4g}s".format(
+                    key, metric, seconds, expected[metric]))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--files', type=int, nargs='+',
+                        default=list(DEFAULT_FILE_COUNTS),
+                        help="Files in each synthetic scene folder.")
+    parser.add_argument('--saves', type=int, default=DEFAULT_SAVES,
+                        help="Saves and increments timed per folder.")
+    parser.add_argument('--scene-bytes', type=int,
+                        default=DEFAULT_SCENE_BYTES)
+    parser.add_argument('--baseline', help="Baseline JSON to compare with.")
+    parser.add_argument('--save-baseline',
+                        help="Write the results to this baseline JSON.")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    results = run_suite(args.files, args.saves, args.scene_bytes)
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as baseline_file:
+            json.dump(results, baseline_file, indent=2, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = find_regressions(results, json.load(baseline_file),
+                                           args.tolerance)
+        for regression in regressions:
+            log.error("REGRESSION %s", regression)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,101 @@
+"""Stress harness for concurrent version reservation.
+
+Starts many processes that all reserve versions of the same scene in one
+local folder at the same time, the way SceneFile.save_increment does, and
+checks that every reservation got its own version. Run it from the src
+folder:
+
+    python smartsave_stress.py --processes 16 --increments 50
+"""
+import argparse
+import logging
+import multiprocessing
+import shutil
+import sys
+import tempfile
+import time
+
+import scene_versions
+
+log = logging.getLogger(__name__)
+
+DESCRIPTOR = 'stress'
+TASK = 'test'
+EXT = '.ma'
+
+
+def _reserve_versions(folder, increments, start_event):
+    """Reserve increments versions, returning them and the collisions."""
+    start_event.wait()
+    versions = []
+    collisions = 0
+    for _ in range(increments):
+        # A new index per increment behaves like a separate artist session.
+        index = scene_versions.VersionIndex(folder)
+        versions.append(index.reserve(DESCRIPTOR, TASK, EXT))
+        collisions += index.collisions
+    return versions, collisions
+
+
+def run(folder, processes, increments):
+    """Run the stress test in folder.
+
+    Returns:
+        dict: Reservation counts, duplicates, collisions and seconds taken.
+    """
+    manager = multiprocessing.Manager()
+    start_event = manager.Event()
+    pool = multiprocessing.Pool(processes)
+    try:
+        results = [pool.apply_async(_reserve_versions,
+                                    (folder, increments, start_event))
+                   for _ in range(processes)]
+        start = time.perf_counter()
+        start_event.set()
+        outcomes = [result.get() for result in results]
+        seconds = time.perf_counter() - start
+    finally:
+        pool.close()
+        pool.join()
+    versions = [ver for reserved, _ in outcomes for ver in reserved]
+    on_disk = scene_versions.VersionIndex(folder, use_sidecar=False) \
+        .versions(DESCRIPTOR, TASK, EXT)
+    return {'reservations': len(versions),
+            'distinct': len(set(versions)),
+            'duplicates': len(versions) - len(set(versions)),
+            'files': len(on_disk),
+            'highest': max(versions) if versions else 0,
+            'collisions': sum(collisions for _, collisions in outcomes),
+            'seconds': seconds}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--processes', type=int, default=16)
+    parser.add_argument('--increments', type=int, default=50)
+    parser.add_argument('--folder', help="Folder to reserve in. A temporary "
+                                         "folder is used and removed when "
+                                         "omitted.")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    folder = args.folder or tempfile.mkdtemp(prefix='smartsave_stress_')
+    try:
+        result = run(folder, args.processes, args.increments)
+    finally:
+        if not args.folder:
+            shutil.rmtree(folder, ignore_errors=True)
+    log.info("%(reservations)d reservations in %(seconds).2fs: "
+             "%(distinct)d distinct, %(duplicates)d duplicates, "
+             "%(files)d files, highest v%(highest)d, "
+             "%(collisions)d collisions retried", result)
+    expected = args.processes * args.increments
+    if result['duplicates'] or result['files'] != expected or \
+            result['highest'] != expected:
+        log.error("FAILED: expected %d distinct versions numbered 1 to %d",
+                  expected, expected)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,159 @@
+"""Parity and determinism checks of the vectorized scatter math.
+
+The reference implementations below are the per vertex, pure Python math of
+the original ScatterTool.find_average_normal and align_to_faces, which the
+vectorized scatter_mesh functions replace. Geometry comes from
+fakemaya.FakeMeshSource, so the checks run without Maya:
+
+    python -m unittest discover tests
+"""
+import math
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir, 'src'))
+
+import numpy as np
+
+import fakemaya
+
+fakemaya.install()
+
+import scatter_engine
+import scatter_mesh
+import scatter_parallel
+
+SEED = 1234
+
+
+def bumpy_grid(rows=12, columns=9):
+    """Return a FakeMeshSource of a grid with hills, so normals vary."""
+    source = fakemaya.FakeMeshSource.grid('bumpy', rows, columns)
+    source.set_points([(x, 0.4 * math.sin(x) * math.cos(0.7 * z), z)
+                       for x, _, z in source.points])
+    return source
+
+
+def _sub(a, b):
+    return (a[0] - b[0], a[1] - b[1], a[2] - b[2])
+
+
+def _cross(a, b):
+    return (a[1] * b[2] - a[2] * b[1],
+            a[2] * b[0] - a[0] * b[2],
+            a[0] * b[1] - a[1] * b[0])
+
+
+def _normalize(vector):
+    length = math.sqrt(sum(value * value for value in vector))
+    return tuple(value / length for value in vector)
+
+
+def reference_face_normal(points):
+    """Newell's method, one face at a time."""
+    normal = [0.0, 0.0, 0.0]
+    for index, current in enumerate(points):
+        following = points[(index + 1) % len(points)]
+        normal[0] += (current[1] - following[1]) * (current[2] + following[2])
+        normal[1] += (current[2] - following[2]) * (current[0] + following[0])
+        normal[2] += (current[0] - following[0]) * (current[1] + following[1])
+    return _normalize(normal)
+
+
+def reference_vertex_normals(source):
+    """Average the normals of the faces around each vertex, one at a time."""
+    faces = []
+    start = 0
+    for count in source.face_counts:
+        faces.append(source.face_indices[start:start + count])
+        start += count
+    normals = []
+    for vertex in range(len(source.points)):
+        total = (0.0, 0.0, 0.0)
+        for face in faces:
+            if vertex in face:
+                normal = reference_face_normal(
+                    [source.points[index] for index in face])
+                total = tuple(a + b for a, b in zip(total, normal))
+        normals.append(_normalize(total))
+    return normals
+
+
+def reference_frame(normal):
+    """The rows of the matrix align_to_faces wrote, without the position."""
+    tangent = _normalize(_cross(normal, (0.0, 1.0, 0.0)))
+    tangent2 = _normalize(_cross(normal, tangent))
+    return [tangent2, normal, tangent]
+
+
+class NormalParityTest(unittest.TestCase):
+
+    def test_vertex_normals_match_per_vertex_average(self):
+        source = bumpy_grid()
+        mesh = scatter_mesh.GEOMETRY_CACHE.fetch(source)
+        np.testing.assert_allclose(mesh.normals,
+                                   reference_vertex_normals(source),
+                                   rtol=0, atol=1e-12)
+
+    def test_frames_match_find_average_normal(self):
+        mesh = bumpy_grid().fetch()
+        normals = mesh.normals[np.abs(mesh.normals[:, 1]) < 0.999]
+        self.assertTrue(len(normals))
+        expected = [reference_frame(tuple(normal))
+                    for normal in normals.tolist()]
+        np.testing.assert_allclose(scatter_mesh.normal_frames(normals),
+                                   expected, rtol=0, atol=1e-12)
+
+    def test_upright_normal_gives_identity_frame(self):
+        frames = scatter_mesh.normal_frames([[0.0, 1.0, 0.0]])
+        np.testing.assert_allclose(frames[0], np.identity(3), atol=1e-15)
+
+    def test_euler_roundtrip(self):
+        rng = np.random.default_rng(SEED)
+        rotations = rng.uniform(-179.0, 179.0, size=(500, 3))
+        rotations[:, 1] = rng.uniform(-89.0, 89.0, size=500)
+        matrices = scatter_engine.euler_to_matrices(rotations)
+        np.testing.assert_allclose(scatter_engine.matrices_to_euler(matrices),
+                                   rotations, rtol=0, atol=1e-9)
+
+
+class SeededLayoutTest(unittest.TestCase):
+
+    def layout(self, sampling, seed=SEED, workers=1):
+        mesh = bumpy_grid(40, 40).fetch()
+        settings = scatter_engine.LayoutSettings(
+            3000, sampling=sampling, align=True,
+            min_rotation=(0.0, 0.0, 0.0), max_rotation=(0.0, 360.0, 0.0),
+            min_scale=0.5, max_scale=1.5)
+        return scatter_engine.concatenate_transforms(
+            scatter_parallel.iter_layout(mesh, settings, seed,
+                                         workers=workers, chunk_size=500))
+
+    def assert_same_layout(self, first, second):
+        np.testing.assert_array_equal(first.positions, second.positions)
+        np.testing.assert_array_equal(first.rotations, second.rotations)
+        np.testing.assert_array_equal(first.scales, second.scales)
+        np.testing.assert_array_equal(first.frames, second.frames)
+
+    def test_same_seed_same_layout(self):
+        for sampling in (scatter_engine.SAMPLE_VERTICES,
+                         scatter_engine.SAMPLE_SURFACE):
+            self.assert_same_layout(self.layout(sampling),
+                                    self.layout(sampling))
+
+    def test_other_seed_other_layout(self):
+        first = self.layout(scatter_engine.SAMPLE_SURFACE)
+        second = self.layout(scatter_engine.SAMPLE_SURFACE, seed=SEED + 1)
+        self.assertFalse(np.array_equal(first.positions, second.positions))
+
+    def test_workers_do_not_change_layout(self):
+        for sampling in (scatter_engine.SAMPLE_VERTICES,
+                         scatter_engine.SAMPLE_SURFACE):
+            self.assert_same_layout(self.layout(sampling),
+                                    self.layout(sampling, workers=2))
+
+
+if __name__ == '__main__':
+    unittest.main()